@@ -70,6 +70,13 @@ st.markdown("""
 def init_systeme_v2():
     return SystemeDecision()
 
+# Google Sheets : onglets lus en parallèle avant les chargements séquentiels du système (une seule fois).
+# init_systeme_v2 doit rester identique à celle des pages : même clé de cache, même SystemeDecision partagé.
+@st.cache_resource
+def precharger_gsheets():
+    DataManager().precharger(['config_vignoble', 'besoins', 'produits', 'traitements',
+                              'historique_alertes', 'meteo_historique', 'gdd_historique'])
+
 # Fonction pour sauvegarder le stade d'une parcelle
 def sauvegarder_stade(parcelle_nom, nouveau_stade, date_debourrement=None):
     """Sauvegarde le nouveau stade via DataManager"""
@@ -119,6 +126,7 @@ with st.sidebar:
     st.markdown("---")
 
     try:
+        precharger_gsheets()
         systeme = init_systeme_v2()
         systeme.config.load_config()
         st.success(f"✅ {len(systeme.config.parcelles)} parcelles configurées")
@@ -141,6 +149,8 @@ with st.sidebar:
 # Main content
 try:
     systeme = init_systeme_v2()
+    # Traitements relus si le stockage a changé (ajout / suppression depuis une autre page)
+    systeme.traitements.rafraichir_historique()
 
     col_date, col_refresh = st.columns([3, 1])
     with col_date:
@@ -521,6 +531,9 @@ try:
     # Footer
     st.caption("🍇 Système Mildiou, Oïdium & Hydrique v1.3")
 
+    # Écritures Google Sheets de ce rerun (parties en parallèle) : attendre leur fin et signaler les échecs
+    DataManager().flush()
+
 except Exception as e:
     st.error(f"""
     ❌ **Erreur lors du chargement**
@@ -11,22 +11,53 @@ Version finale complète avec :
 
 import json
 import csv
-from datetime import datetime, timedelta
-from typing import Dict, List, Tuple, Optional
-import requests
+import copy
+from datetime import datetime, timedelta, date
+from typing import Dict, List, Tuple, Optional, NamedTuple
 import os
+import sys
+import threading
+from bisect import bisect_left, bisect_right
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import numpy as np
 from storage import DataManager
 
-# Bibliothèques optionnelles pour graphiques
-try:
-    import matplotlib.pyplot as plt
-    import matplotlib.dates as mdates
+# Bibliothèques optionnelles pour graphiques (importées à la demande, cf. _ensure_matplotlib)
+GRAPHIQUES_DISPONIBLES = None
+plt = None
+mdates = None
 
-    GRAPHIQUES_DISPONIBLES = True
-except ImportError:
-    GRAPHIQUES_DISPONIBLES = False
-    # print("⚠️  matplotlib non installé - Graphiques désactivés")
-    # print("   Pour activer : pip install matplotlib")
+
+def _ensure_matplotlib() -> bool:
+    """Importe matplotlib au premier besoin ; retourne False s'il n'est pas installé."""
+    global GRAPHIQUES_DISPONIBLES, plt, mdates
+    if GRAPHIQUES_DISPONIBLES is None:
+        try:
+            import matplotlib
+            if 'matplotlib.pyplot' not in sys.modules:
+                matplotlib.use('Agg')  # Graphiques écrits en fichier : pas de recherche de backend graphique
+            import matplotlib.pyplot as _plt
+            import matplotlib.dates as _mdates
+            plt, mdates = _plt, _mdates
+            GRAPHIQUES_DISPONIBLES = True
+        except ImportError:
+            GRAPHIQUES_DISPONIBLES = False
+            # print("⚠️  matplotlib non installé - Graphiques désactivés")
+            # print("   Pour activer : pip install matplotlib")
+    return GRAPHIQUES_DISPONIBLES
+
+
+# Séparateurs des rapports console
+_SEPARATEUR_60 = "=" * 60
+_TIRETS_60 = "-" * 60
+
+
+@lru_cache(maxsize=4096)
+def _annee_de(date_str: str) -> int:
+    """Année d'une date ISO 'AAAA-MM-JJ' (validée par strptime, mise en cache par chaîne)"""
+    return datetime.strptime(date_str, '%Y-%m-%d').year
 
 
 class ConfigVignoble:
@@ -57,9 +88,36 @@ class ConfigVignoble:
         'maturite': 0.2
     }
 
+    # Coefficients d'exportation par défaut (identiques pour tous les cépages)
+    _DEFAULT_EXPORT_COEFS = {cepage: {'n': 1.0, 'p': 0.4, 'k': 1.3, 'mgo': 0.2} for cepage in SENSIBILITES_CEPAGES}
+    # Paramètres par défaut pour GDD et Bilan Hydrique (constante : ne pas modifier, cf. get_default_parameters)
+    _PARAMETRES_DEFAUT = {
+        "t_base_gdd": 10.0,
+        "f_runoff": 0.1,
+        "i_const_mm": 1.0,
+        "rfu_max_mm_default": 100.0,  # RFU Max globale par défaut
+        "kc_calendrier": {
+            "1": 0.1, "2": 0.1, "3": 0.2,
+            "4": 0.4,
+            "5": 0.7,
+            "6": 0.8,
+            "7": 0.8,
+            "8": 0.7,  # Kc pour Août
+            "9": 0.6,  # Kc pour Septembre
+            "10": 0.4,
+            "11": 0.2, "12": 0.1
+        },
+        "export_coefs": _DEFAULT_EXPORT_COEFS
+    }
+
     def __init__(self, config_file: str = 'config_vignoble'):
         self.config_key = config_file.replace('.json', '')
         self.storage = DataManager()
+        self._meteo_parsed_cache = {}
+        self._cache_cepages = {}
+        self._parcelles_par_nom: Dict[str, Dict] = {}
+        self._noms_parcelles: Tuple[str, ...] = ()
+        self._parcelles_indexees: Tuple[int, int] = (0, 0)  # (id, longueur) de la liste indexée
         self.load_config()
 
     def load_config(self):
@@ -81,11 +139,14 @@ class ConfigVignoble:
 
             self.parcelles = config['parcelles']
 
-            default_params = self.get_default_parameters()
-            self.parametres = config.get('parametres', default_params)
-            for key, value in default_params.items():
-                if key not in self.parametres:
-                    self.parametres[key] = value
+            if 'parametres' in config:
+                self.parametres = config['parametres']
+                # Compléter les clés manquantes (copie uniquement des valeurs ajoutées)
+                for key, value in self._PARAMETRES_DEFAUT.items():
+                    if key not in self.parametres:
+                        self.parametres[key] = copy.deepcopy(value)
+            else:
+                self.parametres = self.get_default_parameters()
 
             self.surface_totale = sum(p['surface_ha'] for p in self.parcelles)
 
@@ -95,34 +156,106 @@ class ConfigVignoble:
                 # Fallback sur les paramètres si l'onglet est vide
                 self.export_coefs = self.parametres.get('export_coefs', {})
 
+            self._appliquer_parametres()
+            self._cache_cepages = {}
+            self._indexer_parcelles()
+
             print(f"✅ Configuration chargée via DataManager")
         else:
             print(f"⚠️ Configuration non trouvée. Création par défaut.")
             self.create_default_config()
 
     def get_default_parameters(self):
-        """Retourne les paramètres par défaut pour GDD et Bilan Hydrique"""
-        default_export = {'n': 1.0, 'p': 0.4, 'k': 1.3, 'mgo': 0.2}
-        return {
-            "t_base_gdd": 10.0,
-            "f_runoff": 0.1,
-            "i_const_mm": 1.0,
-            "rfu_max_mm_default": 100.0,  # RFU Max globale par défaut
-            "kc_calendrier": {
-                "1": 0.1, "2": 0.1, "3": 0.2,
-                "4": 0.4,
-                "5": 0.7,
-                "6": 0.8,
-                "7": 0.8,
-                "8": 0.7,  # Kc pour Août
-                "9": 0.6,  # Kc pour Septembre
-                "10": 0.4,
-                "11": 0.2, "12": 0.1
-            },
-            "export_coefs": {
-                cepage: default_export.copy() for cepage in self.SENSIBILITES_CEPAGES
-            }
-        }
+        """Retourne les paramètres par défaut pour GDD et Bilan Hydrique (copie modifiable)"""
+        return copy.deepcopy(self._PARAMETRES_DEFAUT)
+
+    def _appliquer_parametres(self):
+        """
+        Copie en attributs les paramètres lus dans les calculs journaliers (GDD, bilan hydrique),
+        pour éviter les `parametres.get(...)` répétés. À rappeler après toute modification de `parametres`.
+        """
+        self.t_base_gdd = self.parametres.get('t_base_gdd', 10.0)
+        self.rfu_max_mm_default = self.parametres.get('rfu_max_mm_default', 100.0)
+        self.kc_calendrier = self.parametres.get('kc_calendrier', {})
+        self.f_runoff = self.parametres.get('f_runoff', 0.1)
+        self.i_const_mm = self.parametres.get('i_const_mm', 1.0)
+        self.kc_mois = self._construire_kc_mois()
+
+    def _construire_kc_mois(self) -> np.ndarray:
+        """Table des Kc calendrier indexée par numéro de mois (l'indice 0 n'est pas utilisé)"""
+        kc_calendrier = self.parametres.get('kc_calendrier', {})
+        return np.array([0.1] + [kc_calendrier.get(str(m), 0.1) for m in range(1, 13)], dtype=np.float64)
+
+    def get_coefs_cepages(self, cepages: List[str]) -> Tuple[float, float, float, float, float]:
+        """
+        Sensibilité mildiou moyenne et coefficients d'exportation moyens (N, P, K, MgO) d'un encépagement.
+        Mis en cache par liste de cépages ; le cache est vidé au chargement / à la sauvegarde de la config.
+        """
+        cle = tuple(cepages)
+        coefs = self._cache_cepages.get(cle)
+        if coefs is None:
+            sensibilites = [self.SENSIBILITES_CEPAGES.get(c, 5) for c in cepages]
+            sensibilite_moy = sum(sensibilites) / len(sensibilites) if sensibilites else 5.0
+
+            sum_n, sum_p, sum_k, sum_mgo = 0, 0, 0, 0
+            for c in cepages:
+                coef = self.export_coefs.get(c, {'n': 1.0, 'p': 0.4, 'k': 1.3, 'mgo': 0.2})
+                sum_n += coef.get('n', 0)
+                sum_p += coef.get('p', 0)
+                sum_k += coef.get('k', 0)
+                sum_mgo += coef.get('mgo', 0)
+            count = len(cepages)
+            if count > 0:
+                coefs = (sensibilite_moy, sum_n / count, sum_p / count, sum_k / count, sum_mgo / count)
+            else:
+                coefs = (sensibilite_moy, 1.0, 0.4, 1.3, 0.2)
+            self._cache_cepages[cle] = coefs
+        return coefs
+
+    def _indexer_parcelles(self):
+        """Index nom -> parcelle (la première en cas de doublon, comme une recherche linéaire)"""
+        index = {}
+        for p in self.parcelles:
+            index.setdefault(p['nom'], p)
+        self._parcelles_par_nom = index
+        self._noms_parcelles = tuple(p['nom'] for p in self.parcelles)
+        self._parcelles_indexees = (id(self.parcelles), len(self.parcelles))
+
+    def noms_parcelles(self) -> Tuple[str, ...]:
+        """
+        Noms des parcelles dans l'ordre de la configuration (listes de sélection).
+        Calculés avec l'index : reconstruits au chargement / à la sauvegarde, ou si la liste a été remplacée / retaillée.
+        """
+        if self._parcelles_indexees != (id(self.parcelles), len(self.parcelles)):
+            self._indexer_parcelles()
+        return self._noms_parcelles
+
+    def get_parcelle(self, nom: str) -> Optional[Dict]:
+        """
+        Parcelle par nom, ou None. L'index est reconstruit au chargement / à la sauvegarde de la config,
+        et aussi si la liste a été remplacée, allongée / raccourcie, ou une parcelle renommée entre-temps.
+        """
+        parcelle = self._parcelles_par_nom.get(nom)
+        if (parcelle is None or parcelle['nom'] != nom
+                or self._parcelles_indexees != (id(self.parcelles), len(self.parcelles))):
+            self._indexer_parcelles()
+            parcelle = self._parcelles_par_nom.get(nom)
+        return parcelle
+
+    def get_dates_meteo_triees(self, meteo_historique: Dict[str, Dict]) -> Tuple[List, List[str]]:
+        """
+        Retourne les dates de l'historique météo triées (objets date, chaînes ISO).
+        Le résultat est mis en cache tant que l'historique ne change pas de taille ni de bornes.
+        """
+        if not meteo_historique:
+            return [], []
+        cle = (id(meteo_historique), len(meteo_historique),
+               next(iter(meteo_historique)), next(reversed(meteo_historique)))
+        if cle not in self._meteo_parsed_cache:
+            date_strs = sorted(meteo_historique.keys())
+            date_objs = [date.fromisoformat(d) for d in date_strs]
+            self._meteo_parsed_cache = {cle: (date_objs, date_strs)}
+        return self._meteo_parsed_cache[cle]
 
     def create_default_config(self):
         """Crée une configuration par défaut"""
@@ -161,6 +294,10 @@ class ConfigVignoble:
             config_a_sauver['localisation'] = current_config['localisation']
 
         self.storage.save_data(self.config_key, config_a_sauver)
+        self._meteo_parsed_cache = {}
+        self._cache_cepages = {}
+        self._appliquer_parametres()
+        self._indexer_parcelles()
 
     def update_parcelle_stade_et_date(self, nom_parcelle: str, nouveau_stade: str,
                                       date_debourrement: Optional[str] = None) -> bool:
@@ -169,30 +306,72 @@ class ConfigVignoble:
             print(f"⚠️ Stade '{nouveau_stade}' inconnu. Mise à jour annulée.")
             return False
 
-        for parcelle in self.parcelles:
-            if parcelle['nom'] == nom_parcelle:
-                parcelle['stade_actuel'] = nouveau_stade
-                # Pointe verte est considérée comme le point de biofix GDD (Débourrement)
-                if nouveau_stade == 'pointe_verte' and date_debourrement:
-                    parcelle['date_debourrement'] = date_debourrement
-                    print(
-                        f"✅ Date de débourrement (biofix GDD) enregistrée pour '{parcelle['nom']}' : {date_debourrement}")
-                elif nouveau_stade == 'repos':
-                    parcelle['date_debourrement'] = None
-                self.sauvegarder_config()
-                return True
-
-        print(f"❌ Parcelle '{nom_parcelle}' non trouvée.")
-        return False
+        parcelle = self.get_parcelle(nom_parcelle)
+        if parcelle is None:
+            print(f"❌ Parcelle '{nom_parcelle}' non trouvée.")
+            return False
+
+        parcelle['stade_actuel'] = nouveau_stade
+        # Pointe verte est considérée comme le point de biofix GDD (Débourrement)
+        if nouveau_stade == 'pointe_verte' and date_debourrement:
+            parcelle['date_debourrement'] = date_debourrement
+            print(
+                f"✅ Date de débourrement (biofix GDD) enregistrée pour '{parcelle['nom']}' : {date_debourrement}")
+        elif nouveau_stade == 'repos':
+            parcelle['date_debourrement'] = None
+        self.sauvegarder_config()
+        return True
 
 
 class MeteoAPI:
     """Gestion des données météorologiques via Open-Meteo (gratuit)"""
 
+    # Durée de validité des réponses mises en cache sur disque
+    CACHE_TTL_SECONDS = 3600
+
     def __init__(self, latitude: float, longitude: float):
         self.latitude = latitude
         self.longitude = longitude
         self.base_url = "https://api.open-meteo.com/v1/forecast"
+        self.cache_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'meteo_api_cache.json')
+
+    def _charger_cache(self) -> Dict:
+        """Charge le cache local des réponses Open-Meteo"""
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _lire_cache(self, key: str) -> Optional[Dict]:
+        """Retourne les données en cache si elles sont encore valides"""
+        entree = self._charger_cache().get(key)
+        if not entree:
+            return None
+        try:
+            age = datetime.now() - datetime.fromisoformat(entree['fetched_at'])
+        except (KeyError, TypeError, ValueError):
+            return None
+        if age < timedelta(seconds=self.CACHE_TTL_SECONDS):
+            return entree.get('data')
+        return None
+
+    def _ecrire_cache(self, key: str, data: Dict):
+        """Enregistre une réponse et purge les entrées expirées"""
+        now = datetime.now()
+        cache = {}
+        for k, entree in self._charger_cache().items():
+            try:
+                if now - datetime.fromisoformat(entree['fetched_at']) < timedelta(seconds=self.CACHE_TTL_SECONDS):
+                    cache[k] = entree
+            except (KeyError, TypeError, ValueError):
+                continue
+        cache[key] = {'fetched_at': now.isoformat(), 'data': data}
+        try:
+            with open(self.cache_file, 'w', encoding='utf-8') as f:
+                json.dump(cache, f)
+        except OSError as e:
+            print(f"⚠️ Impossible d'écrire le cache météo: {e}")
 
     def get_meteo_data(self, days_past: int = 14, days_future: int = 7) -> Dict:
         """
@@ -205,6 +384,12 @@ class MeteoAPI:
         else:
             days_past_api = days_past
 
+        cache_key = (f"meteo_{self.latitude:.3f}_{self.longitude:.3f}_{days_past_api}_{days_future}_"
+                     f"{datetime.now().strftime('%Y-%m-%d')}")
+        cached = self._lire_cache(cache_key)
+        if cached:
+            return cached
+
         params = {
             'latitude': self.latitude,
             'longitude': self.longitude,
@@ -214,12 +399,17 @@ class MeteoAPI:
             'forecast_days': days_future
         }
 
+        import requests  # import différé : inutile pour les calculs hors ligne
+
         try:
             response = requests.get(self.base_url, params=params, timeout=10)
             response.raise_for_status()
             data = response.json()
 
-            return self._format_meteo_data(data)
+            formatted = self._format_meteo_data(data)
+            if formatted:
+                self._ecrire_cache(cache_key, formatted)
+            return formatted
 
         except requests.RequestException as e:
             print(f"❌ Erreur lors de la récupération des données météo: {e}")
@@ -257,48 +447,204 @@ class MeteoAPI:
         return formatted
 
 
+# Versions compilées (numba) des noyaux numériques : absent = pas encore tenté, False = numba non installé
+_NOYAUX_JIT = {}
+
+
+def _noyau_compile(noyau):
+    """Compile un noyau avec numba au premier besoin (optionnel) ; retourne False si indisponible."""
+    if noyau not in _NOYAUX_JIT:
+        try:
+            from numba import njit
+            _NOYAUX_JIT[noyau] = njit(cache=True)(noyau)
+        except ImportError:
+            _NOYAUX_JIT[noyau] = False
+    return _NOYAUX_JIT[noyau]
+
+
+def _somme_gdd(gdd_jour, gdd_initial: float) -> float:
+    """Cumul des GDD journaliers à partir de gdd_initial, dans l'ordre chronologique."""
+    total = gdd_initial
+    for i in range(len(gdd_jour)):
+        total += gdd_jour[i]
+    return total
+
+
+class IndexMeteo:
+    """
+    Index trié de l'historique météo, en colonnes (une ligne par date ISO, cf. `position`).
+    Précipitations / ETP0 : valeurs absentes ou nulles ramenées à 0 une fois pour toutes à la construction.
+    Températures / humidité : valeurs absentes = NaN.
+    Les GDD journaliers sont rangés dans un tableau continu indexé par (jour - origine) :
+    un jour absent de l'historique vaut 0, et une fenêtre de dates se lit sans recherche.
+    """
+
+    def __init__(self, meteo_historique: Dict[str, Dict]):
+        dates = sorted(meteo_historique.keys())
+        jours = [meteo_historique[d] or {} for d in dates]
+        self.dates = np.array(dates, dtype=str)
+        self.precip = np.array([j.get('precipitation', 0.0) or 0.0 for j in jours], dtype=np.float64)
+        self.etp0 = np.array([j.get('etp0', 0.0) or 0.0 for j in jours], dtype=np.float64)
+        self.temp_min = np.array([j.get('temp_min') for j in jours], dtype=np.float64)
+        self.temp_max = np.array([j.get('temp_max') for j in jours], dtype=np.float64)
+        self.temp_moy = np.array([j.get('temp_moy') for j in jours], dtype=np.float64)
+        self.humidite = np.array([j.get('humidite') for j in jours], dtype=np.float64)
+        self.position = {d: i for i, d in enumerate(dates)}
+
+        ordinaux = np.array([date.fromisoformat(d).toordinal() for d in dates], dtype=np.int64)
+        self.origine = int(ordinaux[0]) if len(ordinaux) else 0
+        self.gdd_jour = np.zeros(int(ordinaux[-1]) - self.origine + 1 if len(ordinaux) else 0, dtype=np.float64)
+        self.gdd_jour[ordinaux - self.origine] = [j.get('gdd_jour', 0.0) or 0.0 for j in jours]
+        # Ligne de chaque jour calendaire dans les colonnes (-1 = jour absent), même indexation que gdd_jour
+        self.ligne_jour = np.full(len(self.gdd_jour), -1, dtype=np.intp)
+        self.ligne_jour[ordinaux - self.origine] = np.arange(len(dates))
+
+    def cumul_gdd(self, date_debut: date, date_fin: date, gdd_initial: float = 0.0) -> float:
+        """Cumul des GDD journaliers entre deux dates (incluses), à partir de gdd_initial"""
+        i = min(max(date_debut.toordinal() - self.origine, 0), len(self.gdd_jour))
+        j = min(max(date_fin.toordinal() - self.origine + 1, i), len(self.gdd_jour))
+        gdd_fenetre = self.gdd_jour[i:j]
+        noyau = _noyau_compile(_somme_gdd)
+        if noyau:
+            return noyau(gdd_fenetre, float(gdd_initial))
+        return _somme_gdd(gdd_fenetre.tolist(), gdd_initial)
+
+    def dates_apres(self, date_iso: str, nb_jours: int) -> List[str]:
+        """Les `nb_jours` premières dates strictement postérieures à `date_iso`"""
+        debut = int(np.searchsorted(self.dates, date_iso, side='right'))
+        return self.dates[debut:debut + nb_jours].tolist()
+
+    def cumul_pluie_apres(self, date_iso: str, nb_jours: int) -> float:
+        """Cumul des précipitations des `nb_jours` premières dates strictement postérieures à `date_iso`"""
+        debut = int(np.searchsorted(self.dates, date_iso, side='right'))
+        return float(self.precip[debut:debut + nb_jours].sum())
+
+    def colonne(self, champ: str, dates: List[str]) -> np.ndarray:
+        """Valeurs d'une colonne (precip, temp_moy, humidite...) aux dates demandées ; NaN si date absente"""
+        return self.colonne_lignes(champ, np.array([self.position.get(d, -1) for d in dates], dtype=np.intp))
+
+    def lignes_jours(self, ordinal_debut: int, nb_jours: int) -> np.ndarray:
+        """Lignes des `nb_jours` jours calendaires consécutifs à partir d'un ordinal (-1 = jour absent)"""
+        decalages = np.arange(ordinal_debut, ordinal_debut + nb_jours) - self.origine
+        dans_index = (decalages >= 0) & (decalages < len(self.ligne_jour))
+        lignes = np.full(nb_jours, -1, dtype=np.intp)
+        lignes[dans_index] = self.ligne_jour[decalages[dans_index]]
+        return lignes
+
+    def colonne_lignes(self, champ: str, lignes: np.ndarray) -> np.ndarray:
+        """Valeurs d'une colonne aux lignes données (cf. lignes_jours) ; NaN si ligne -1"""
+        valeurs = getattr(self, champ)[lignes] if len(self.dates) else np.full(len(lignes), np.nan)
+        valeurs[lignes < 0] = np.nan
+        return valeurs
+
+    def fenetre(self, date_debut: str, date_fin: str) -> slice:
+        """Tranche des jours entre deux dates ISO (bornes incluses)"""
+        i = int(np.searchsorted(self.dates, date_debut, side='left'))
+        j = int(np.searchsorted(self.dates, date_fin, side='right'))
+        return slice(i, max(i, j))
+
+    def cumul_pluie(self, date_debut: str, date_fin: str) -> float:
+        """Cumul des précipitations entre deux dates ISO (bornes incluses)"""
+        tranche = self.fenetre(date_debut, date_fin)
+        return float(self.precip[tranche].sum()) if tranche.stop > tranche.start else 0.0
+
+    def cumuls_pluie(self, date_debut: str, dates_fin: List[str]) -> np.ndarray:
+        """cumul_pluie(date_debut, d) pour chaque date d de dates_fin, par une seule somme cumulée"""
+        i = int(np.searchsorted(self.dates, date_debut, side='left'))
+        fins = np.searchsorted(self.dates, np.array(dates_fin, dtype=str), side='right') - i
+        cumul = np.concatenate(([0.0], np.cumsum(self.precip[i:])))
+        return cumul[np.maximum(fins, 0)]
+
+
+def _meteo_to_soa(meteo_list: List[Dict]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Convertit une liste de relevés météo en tableaux (precip, temp_moy, humidite).
+    Les relevés vides sont ignorés ; précipitation absente = 0, température/humidité absentes = NaN.
+    """
+    releves = [m for m in meteo_list if m]
+    precip = np.array([m.get('precipitation', 0) for m in releves], dtype=np.float64)
+    temp = np.array([m.get('temp_moy') for m in releves], dtype=np.float64)
+    humid = np.array([m.get('humidite') for m in releves], dtype=np.float64)
+    return precip, temp, humid
+
+
 class ModeleSimple:
     """Modèle simplifié basé sur la règle des 3-10 améliorée"""
+    # Barème pluie sur 48h : >= 2mm -> 1, >= 5mm -> 3, >= 10mm -> 5
+    _SEUILS_PLUIE = np.array([2, 5, 10])
+    _SCORE_PLUIE = np.array([0, 1, 3, 5])
+    # Barème température (fenêtres emboîtées 10-30 -> 1, 15-28 -> 2, 20-25 -> 4, bornes incluses) :
+    # indice = nb de bornes basses <= T + nb de bornes hautes < T
+    _BORNES_TEMP_BASSES = np.array([10, 15, 20])
+    _BORNES_TEMP_HAUTES = np.array([25, 28, 30])
+    _SCORE_TEMP = np.array([0, 1, 2, 4, 2, 1, 0])
 
     @staticmethod
     def calculer_risque_infection(meteo_48h: List[Dict], stade_coef: float,
                                   sensibilite_cepage: float) -> Tuple[float, str]:
         if not meteo_48h:
             return 0.0, "FAIBLE"
-        pluie_totale = sum(m.get('precipitation', 0) for m in meteo_48h if m)
-        jours_humides = [m for m in meteo_48h if m and m.get('precipitation', 0) > 1]
-        temp_moy_list = [m.get('temp_moy') for m in meteo_48h if m and m.get('temp_moy') is not None]
-        if not temp_moy_list: return 0.0, "FAIBLE"
-        if jours_humides:
-            temp_moy = sum(m['temp_moy'] for m in jours_humides) / len(jours_humides)
-        else:
-            temp_moy = sum(temp_moy_list) / len(temp_moy_list)
-        score_base = 0
-        if pluie_totale >= 10:
-            score_base += 5
-        elif pluie_totale >= 5:
-            score_base += 3
-        elif pluie_totale >= 2:
-            score_base += 1
-        if 20 <= temp_moy <= 25:
-            score_base += 4
-        elif 15 <= temp_moy <= 28:
-            score_base += 2
-        elif 10 <= temp_moy <= 30:
-            score_base += 1
-        humid_moy_list = [m.get('humidite') for m in meteo_48h if m and m.get('humidite') is not None]
-        if not humid_moy_list: return 0.0, "FAIBLE"
-        humid_moy = sum(humid_moy_list) / len(humid_moy_list)
-        if humid_moy > 85: score_base += 1
-        score_final = score_base * stade_coef * (sensibilite_cepage / 5)
-        score_final = min(10, score_final)
-        if score_final >= 7:
-            niveau = "FORT"
-        elif score_final >= 4:
-            niveau = "MOYEN"
-        else:
-            niveau = "FAIBLE"
-        return round(score_final, 1), niveau
+        precip, temp, humid = _meteo_to_soa(meteo_48h)
+        scores, niveaux = ModeleSimple.calculer_risque_infection_batch(
+            precip[np.newaxis], temp[np.newaxis], humid[np.newaxis], stade_coef, sensibilite_cepage
+        )
+        return scores[0], niveaux[0]
+
+    @staticmethod
+    def calculer_risque_infection_batch(precip: np.ndarray, temp: np.ndarray, humid: np.ndarray,
+                                        stade_coef: float, sensibilite_cepage: float) -> Tuple[List[float], List[str]]:
+        """
+        Risque pour plusieurs fenêtres à la fois : tableaux (nb_fenetres, nb_jours), NaN = relevé absent.
+        Moyennes calculées en sommes masquées (les jours absents comptent pour 0 dans la somme).
+        """
+        temp_ok = ~np.isnan(temp)
+        humid_ok = ~np.isnan(humid)
+        pluie_totale = np.nansum(precip, axis=1)
+        mask_humide = (precip > 1) & temp_ok
+        nb_humide = mask_humide.sum(axis=1)
+        nb_temp = temp_ok.sum(axis=1)
+        nb_humid = humid_ok.sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            temp_moy = np.where(nb_humide > 0,
+                                np.where(mask_humide, temp, 0.0).sum(axis=1) / nb_humide,
+                                np.where(temp_ok, temp, 0.0).sum(axis=1) / nb_temp)
+            humid_moy = np.where(humid_ok, humid, 0.0).sum(axis=1) / nb_humid
+        idx_temp = (np.searchsorted(ModeleSimple._BORNES_TEMP_BASSES, temp_moy, 'right')
+                    + np.searchsorted(ModeleSimple._BORNES_TEMP_HAUTES, temp_moy, 'left'))
+        score_base = (ModeleSimple._SCORE_PLUIE[np.digitize(pluie_totale, ModeleSimple._SEUILS_PLUIE)]
+                      + ModeleSimple._SCORE_TEMP[idx_temp] + (humid_moy > 85))
+        # Fenêtre sans température ou sans humidité : risque nul
+        valide = (nb_temp > 0) & (nb_humid > 0)
+
+        scores, niveaux = [], []
+        for ok, base in zip(valide.tolist(), score_base.tolist()):
+            if not ok:
+                scores.append(0.0); niveaux.append("FAIBLE")
+                continue
+            score_final = base * stade_coef * (sensibilite_cepage / 5)
+            score_final = min(10, score_final)
+            if score_final >= 7:
+                niveau = "FORT"
+            elif score_final >= 4:
+                niveau = "MOYEN"
+            else:
+                niveau = "FAIBLE"
+            scores.append(round(score_final, 1)); niveaux.append(niveau)
+        return scores, niveaux
+
+
+def _construire_grille_ipi(table: Dict[int, Dict[int, int]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Aplatit la table IPI (lignes de longueurs inégales) en grille dense.
+    Chaque ligne est complétée par interpolation linéaire sur ses propres clés, bornée à ses extrémités.
+    """
+    temp_ax = np.array(sorted(table), dtype=np.float64)
+    duree_ax = np.array(sorted({d for durees in table.values() for d in durees}), dtype=np.float64)
+    grille = np.empty((len(temp_ax), len(duree_ax)))
+    for i, t in enumerate(sorted(table)):
+        keys = sorted(table[t])
+        grille[i] = np.interp(duree_ax, keys, [table[t][d] for d in keys])
+    return temp_ax, duree_ax, grille
 
 
 class ModeleIPI:
@@ -312,39 +658,38 @@ class ModeleIPI:
         24: {3: 10, 4: 30, 6: 70, 8: 100},
         27: {3: 20, 5: 60, 7: 100}
     }
+    # Table aplatie en grille dense (températures x durées), calculée une fois (la table est constante)
+    _TEMP_AX, _DUREE_AX, _GRID = _construire_grille_ipi(IPI_TABLE)
 
     @staticmethod
-    def _interpolate(x: float, x0: float, y0: float, x1: float, y1: float) -> float:
-        if x1 == x0: return y0
-        return y0 + (x - x0) * (y1 - y0) / (x1 - x0)
-
-    @staticmethod
-    def _find_bounding_keys(keys: List[float], value: float) -> Tuple[float, float]:
-        if value <= keys[0]: return keys[0], keys[0]
-        if value >= keys[-1]: return keys[-1], keys[-1]
-        for i in range(len(keys) - 1):
-            if keys[i] <= value < keys[i + 1]: return keys[i], keys[i + 1]
-        return keys[-1], keys[-1]
+    def calculer_ipi_batch(temps, durees_humectation) -> np.ndarray:
+        """
+        IPI pour un lot d'événements (interpolation bilinéaire sur la grille dense).
+        Les durées sont bornées aux extrémités de la table ; hors plage 10-27°C l'IPI est nul.
+        """
+        temps = np.asarray(temps, dtype=np.float64)
+        durees = np.clip(np.asarray(durees_humectation, dtype=np.float64),
+                         ModeleIPI._DUREE_AX[0], ModeleIPI._DUREE_AX[-1])
+        t_ax = ModeleIPI._TEMP_AX
+        # 1. Interpolation selon la durée d'humectation pour chaque ligne de température
+        par_ligne = np.array([np.interp(durees, ModeleIPI._DUREE_AX, ligne) for ligne in ModeleIPI._GRID])
+        # 2. Interpolation selon la température entre les deux lignes encadrantes
+        i = np.clip(np.searchsorted(t_ax, temps, side='right') - 1, 0, len(t_ax) - 2)
+        cols = np.arange(temps.size)
+        ipi_t0 = par_ligne[i, cols]
+        ipi_t1 = par_ligne[i + 1, cols]
+        ipi = ipi_t0 + (temps - t_ax[i]) * (ipi_t1 - ipi_t0) / (t_ax[i + 1] - t_ax[i])
+        valide = (temps >= t_ax[0]) & (temps <= t_ax[-1])
+        return np.rint(np.where(valide, np.maximum(ipi, 0), 0)).astype(int)
 
     @staticmethod
     def calculer_ipi(meteo_evenement: Dict, duree_humectation_estimee: float) -> int:
         temp = meteo_evenement.get('temp_moy')
         if temp is None or temp < 10 or temp > 27: return 0
-        temp_keys = sorted(ModeleIPI.IPI_TABLE.keys())
-        t0, t1 = ModeleIPI._find_bounding_keys(temp_keys, temp)
-        durees_t0 = ModeleIPI.IPI_TABLE[t0]
-        keys_d_t0 = sorted(durees_t0.keys())
-        d0_t0, d1_t0 = ModeleIPI._find_bounding_keys(keys_d_t0, duree_humectation_estimee)
-        ipi_t0 = ModeleIPI._interpolate(duree_humectation_estimee, d0_t0, durees_t0[d0_t0], d1_t0, durees_t0[d1_t0])
-        if t0 == t1: return round(max(0, ipi_t0))
-        durees_t1 = ModeleIPI.IPI_TABLE[t1]
-        keys_d_t1 = sorted(durees_t1.keys())
-        d0_t1, d1_t1 = ModeleIPI._find_bounding_keys(keys_d_t1, duree_humectation_estimee)
-        ipi_t1 = ModeleIPI._interpolate(duree_humectation_estimee, d0_t1, durees_t1[d0_t1], d1_t1, durees_t1[d1_t1])
-        ipi_final = ModeleIPI._interpolate(temp, t0, ipi_t0, t1, ipi_t1)
-        return round(max(0, ipi_final))
+        return int(ModeleIPI.calculer_ipi_batch([temp], [duree_humectation_estimee])[0])
 
     @staticmethod
+    @lru_cache(maxsize=4096)
     def estimer_duree_humectation(precipitation: float, humidite: float) -> float:
         if precipitation is None or humidite is None: return 0
         if precipitation < 2: return 0
@@ -362,26 +707,27 @@ class ModeleIPI:
 class ModeleOidium:
     """Modèle de risque Oïdium (simplifié)"""
 
+    @staticmethod
+    def scores_journaliers(releves: List[Dict]) -> np.ndarray:
+        """Score journalier (-2 à 3) de chaque relevé, calculé en une passe vectorisée"""
+        # Colonnes temp_max / humidite / precipitation ; valeurs absentes -> NaN :
+        # toutes les comparaisons sont fausses (score journalier neutre)
+        arr = np.array([[m.get('temp_max'), m.get('humidite'), m.get('precipitation')] for m in releves],
+                       dtype=np.float64).reshape(-1, 3)
+        tmax, hum, pl = arr[:, 0], arr[:, 1], arr[:, 2]
+        conditions = [tmax >= 33,
+                      (20 <= tmax) & (tmax <= 28) & (hum >= 60),
+                      (15 <= tmax) & (tmax <= 30) & (hum >= 50)]
+        ds = np.select(conditions, [-2, 3, 1], default=0)
+        ds -= (pl >= 5)
+        return np.maximum(ds, -2)
+
     @staticmethod
     def calculer_risque_infection(meteo_7j: List[Dict], stade_coef: float) -> Tuple[float, str]:
         if not meteo_7j: return 0.0, "FAIBLE"
-        score_total = 0
-        jours_comptes = 0
-        for m in meteo_7j:
-            if not m: continue
-            jours_comptes += 1
-            temp_max = m.get('temp_max', 0)
-            humid = m.get('humidite', 0)
-            pluie = m.get('precipitation', 0)
-            daily_score = 0
-            if temp_max is not None and temp_max >= 33:
-                daily_score = -2
-            elif temp_max is not None and humid is not None and 20 <= temp_max <= 28 and humid >= 60:
-                daily_score = 3
-            elif temp_max is not None and humid is not None and 15 <= temp_max <= 30 and humid >= 50:
-                daily_score = 1
-            if pluie is not None and pluie >= 5: daily_score -= 1
-            score_total += max(daily_score, -2)
+        releves = [m for m in meteo_7j if m]
+        jours_comptes = len(releves)
+        score_total = int(ModeleOidium.scores_journaliers(releves).sum())
         max_score_possible = jours_comptes * 3
         if max_score_possible == 0: return 0.0, "FAIBLE"
         score_final_brut = (score_total / max_score_possible) * 10
@@ -397,10 +743,30 @@ class ModeleOidium:
         return round(score_final, 1), niveau
 
 
+def _rfu_noyau(p_eff, kc_etp0, rfu_max_mm: float, seuil_stress_pct: float):
+    """
+    Récurrence journalière RFU / Ks (FAO-56 simplifié) d'une parcelle.
+    Ks diminue linéairement de 1.0 à 0.0 sous le seuil de stress (p = 0.5 pour la vigne).
+    Écrite en Python scalaire pour pouvoir être compilée telle quelle par numba (cf. _noyau_compile).
+    """
+    n = len(p_eff)
+    rfu_out = np.empty(n)
+    ks_out = np.empty(n)
+    rfu = rfu_max_mm  # Init plein
+    for i in range(n):
+        rfu_pct_veille = (rfu / rfu_max_mm) * 100.0 if rfu_max_mm > 0 else 0.0
+        ks = 1.0 if rfu_pct_veille > seuil_stress_pct else max(0.0, rfu_pct_veille / seuil_stress_pct)
+        rfu = max(0.0, min(rfu_max_mm, rfu + p_eff[i] - kc_etp0[i] * ks))
+        rfu_out[i] = rfu
+        ks_out[i] = ks
+    return rfu_out, ks_out
+
+
 class ModeleBilanHydrique:
     """Modèle de Bilan Hydrique Agronomique (ETc + Ks + Kc dynamique)"""
 
     @staticmethod
+    @lru_cache(maxsize=4096)
     def calculer_kc_gdd(gdd_cumul: float) -> float:
         """Calcule un Kc dynamique basé sur les GDD (courbe foliaire simplifiée)"""
         # 0 - 180 GDD : Dormance / Pointe verte (Kc minimal)
@@ -419,6 +785,41 @@ class ModeleBilanHydrique:
         else:
             return max(0.3, 0.4 - (0.1 * (gdd_cumul - 1750) / 300))
 
+    # Points d'inflexion de la courbe Kc(GDD) ci-dessus (linéaire par morceaux, plancher 0.3 atteint à 2050 GDD)
+    KC_GDD_POINTS = (np.array([180.0, 660.0, 1450.0, 1750.0, 2050.0]),
+                     np.array([0.1, 0.7, 0.8, 0.4, 0.3]))
+
+    @staticmethod
+    def calculer_kc_gdd_array(gdd_cumul: np.ndarray) -> np.ndarray:
+        """Version vectorisée de calculer_kc_gdd pour un tableau de cumuls GDD"""
+        x_points, kc_points = ModeleBilanHydrique.KC_GDD_POINTS
+        return np.interp(gdd_cumul, x_points, kc_points)
+
+    @staticmethod
+    def _boucle_rfu(p_eff: np.ndarray, kc_etp0: np.ndarray, rfu_max_mm: np.ndarray,
+                    seuil_stress_pct: float = 50.0) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Récurrence journalière RFU / Ks pour plusieurs parcelles (une ligne de `kc_etp0` par parcelle).
+        `p_eff` (n_jours,) est commun, `kc_etp0` est de forme (n_parcelles, n_jours), `rfu_max_mm` (n_parcelles,).
+        Retourne la RFU (mm) en fin de journée et le Ks appliqué chaque jour, de forme (n_parcelles, n_jours).
+        """
+        n_parcelles, n = kc_etp0.shape
+        rfu_out = np.empty((n_parcelles, n))
+        ks_out = np.empty((n_parcelles, n))
+        noyau = _noyau_compile(_rfu_noyau)
+        if noyau:
+            p_eff_k = np.ascontiguousarray(p_eff, dtype=np.float64)
+            for k in range(n_parcelles):
+                rfu_out[k], ks_out[k] = noyau(p_eff_k, np.ascontiguousarray(kc_etp0[k]),
+                                              float(rfu_max_mm[k]), float(seuil_stress_pct))
+        else:
+            # Sans numba : listes Python, plus rapides à indexer élément par élément que les tableaux
+            p_eff_l = p_eff.tolist()
+            for k in range(n_parcelles):
+                rfu_out[k], ks_out[k] = _rfu_noyau(p_eff_l, kc_etp0[k].tolist(),
+                                                   float(rfu_max_mm[k]), float(seuil_stress_pct))
+        return rfu_out, ks_out
+
     @staticmethod
     def calculer_bilan_rfu(meteo_historique: Dict[str, Dict],
                            parcelle: Dict,
@@ -428,18 +829,44 @@ class ModeleBilanHydrique:
                            f_runoff: float,
                            i_const_mm: float,
                            gdd_cumul_actuel: float = 0.0,
-                           debug: bool = False) -> Dict:
+                           debug: bool = False,
+                           dates_triees: Optional[Tuple[List, List[str]]] = None,
+                           kc_mois: Optional[np.ndarray] = None,
+                           index_meteo: Optional[IndexMeteo] = None) -> Dict:
         """
         Calcule la Réserve Utile (AWC/RFU) restante en %
         Optimisation Jules : Intégration Ks (stress) et Kc dynamique GDD.
+        `dates_triees` et `kc_mois` (cf. ConfigVignoble) évitent de re-parser les dates et la table Kc.
+        """
+        return ModeleBilanHydrique.calculer_bilan_rfu_batch(
+            meteo_historique, [stade_manuel], kc_calendrier, [rfu_max_mm], f_runoff, i_const_mm,
+            gdd_cumuls=[gdd_cumul_actuel], debug=debug, dates_triees=dates_triees, kc_mois=kc_mois,
+            index_meteo=index_meteo
+        )[0]
+
+    @staticmethod
+    def calculer_bilan_rfu_batch(meteo_historique: Dict[str, Dict],
+                                 stades_manuels: List[str],
+                                 kc_calendrier: Dict,
+                                 rfu_max_mm: List[float],
+                                 f_runoff: float,
+                                 i_const_mm: float,
+                                 gdd_cumuls: Optional[List[float]] = None,
+                                 debug: bool = False,
+                                 dates_triees: Optional[Tuple[List, List[str]]] = None,
+                                 kc_mois: Optional[np.ndarray] = None,
+                                 index_meteo: Optional[IndexMeteo] = None) -> List[Dict]:
+        """
+        Bilan hydrique de plusieurs parcelles en une passe sur la météo.
+        Pluie efficace, ETP0 et table Kc sont communes ; seuls le Kc GDD (selon le cumul de chaque
+        parcelle) et la RFU max diffèrent. Retourne un dict de résultat par parcelle, dans l'ordre.
+        Avec `index_meteo`, pluie et ETP0 sont lues dans ses colonnes déjà nettoyées.
         """
         aujourdhui = datetime.now().date()
         annee_actuelle = aujourdhui.year
-
-        if debug:
-            print("\n🔍 MODE DEBUG - CALCUL BILAN HYDRIQUE OPTIMISÉ")
-            print(f"Date       | Pluie | P.Eff | ET₀  | Kc   | Ks   | ETc  | RFU mm | RFU %")
-            print("-" * 85)
+        n_parcelles = len(stades_manuels)
+        if gdd_cumuls is None:
+            gdd_cumuls = [0.0] * n_parcelles
 
         # 1. Début du cycle hydrologique (1er Novembre précédent)
         if aujourdhui.month >= 11:
@@ -447,98 +874,143 @@ class ModeleBilanHydrique:
         else:
             date_cycle_debut = datetime(annee_actuelle - 1, 11, 1).date()
 
-        dates_disponibles = sorted([datetime.strptime(d, '%Y-%m-%d').date() for d in meteo_historique.keys()])
-        dates_utiles = [d for d in dates_disponibles if d >= date_cycle_debut and d <= aujourdhui]
+        if dates_triees is None:
+            date_strs_triees = sorted(meteo_historique.keys())
+            dates_triees = ([date.fromisoformat(d) for d in date_strs_triees], date_strs_triees)
+        jours_utiles = [(d, d_str) for d, d_str in zip(*dates_triees) if date_cycle_debut <= d <= aujourdhui]
+        dates_utiles = [d for d, _ in jours_utiles]
 
         if not dates_utiles:
-            return {
-                'rfu_pct': 100.0, 'rfu_mm': rfu_max_mm, 'rfu_max_mm': rfu_max_mm,
+            return [{
+                'rfu_pct': 100.0, 'rfu_mm': rfu_max, 'rfu_max_mm': rfu_max,
                 'niveau': "Données insuffisantes", 'historique_pct': {}, 'ks_actuel': 1.0
-            }
-
-        date_debut = dates_utiles[0]
-        rfu_actuelle_mm = rfu_max_mm # Init plein
-        rfu_historique_pct = {}
-        ks_actuel = 1.0
-
-        for date_obj in dates_utiles:
-            date_str = date_obj.strftime('%Y-%m-%d')
-            data_jour = meteo_historique.get(date_str, {})
-
-            pluie = data_jour.get('precipitation', 0.0) or 0.0
-            etp0 = data_jour.get('etp0', 0.0) or 0.0
-            gdd_jour = data_jour.get('gdd_jour', 0.0) or 0.0 # On a besoin de cumuler les GDD pour le Kc
-
-            # 2. Kc Dynamique (Estimation du cumul au jour J)
-            # Pour la simulation, on pourrait cumuler les GDD ici si besoin
-            # Mais on va utiliser le Kc calendrier si GDD non dispo (période hivernale)
-            # Jules : On utilise Kc GDD si on est après le débourrement estimé
-            if date_obj.month >= 3 and date_obj.month <= 10:
-                # Simulation simple du cumul GDD progressif pour le Kc
-                # Dans une version parfaite, on passerait le dictionnaire des GDD cumulés
-                Kc = ModeleBilanHydrique.calculer_kc_gdd(gdd_cumul_actuel * (dates_utiles.index(date_obj)/len(dates_utiles)))
+            } for rfu_max in rfu_max_mm]
+
+        n_jours = len(dates_utiles)
+        date_strs = [d_str for _, d_str in jours_utiles]
+        tranche = index_meteo.fenetre(date_strs[0], date_strs[-1]) if index_meteo is not None else None
+        if tranche is not None and tranche.stop - tranche.start == n_jours:
+            pluie_arr = index_meteo.precip[tranche]
+            etp0_arr = index_meteo.etp0[tranche]
+        else:
+            jours = [meteo_historique.get(d, {}) for d in date_strs]
+            pluie_arr = np.asarray([j.get('precipitation', 0.0) or 0.0 for j in jours], dtype=np.float64)
+            etp0_arr = np.asarray([j.get('etp0', 0.0) or 0.0 for j in jours], dtype=np.float64)
+        mois_arr = np.asarray([d.month for d in dates_utiles], dtype=np.int64)
+
+        # 2. Kc : calendrier (table indexée par mois) hors saison, Kc dynamique GDD de mars à octobre
+        # Simulation simple du cumul GDD progressif (proportionnel à l'avancement dans le cycle)
+        if kc_mois is None:
+            kc_mois = np.array([0.1] + [kc_calendrier.get(str(m), 0.1) for m in range(1, 13)], dtype=np.float64)
+        kc_arr = np.tile(kc_mois[mois_arr], (n_parcelles, 1))
+        saison = (mois_arr >= 3) & (mois_arr <= 10)
+        if saison.any():
+            avancement = np.arange(n_jours)[saison] / n_jours
+            gdd_simules = np.asarray(gdd_cumuls, dtype=np.float64)[:, None] * avancement
+            kc_arr[:, saison] = ModeleBilanHydrique.calculer_kc_gdd_array(gdd_simules)
+
+        # 4. Pluie efficace
+        p_eff_arr = np.where(pluie_arr > i_const_mm, (pluie_arr - i_const_mm) * (1.0 - f_runoff), 0.0)
+
+        # 3 & 5. Récurrence Ks / RFU (séquentielle par nature)
+        rfu_max_arr = np.asarray(rfu_max_mm, dtype=np.float64)
+        rfu_mat, ks_mat = ModeleBilanHydrique._boucle_rfu(p_eff_arr, kc_arr * etp0_arr, rfu_max_arr)
+
+        resultats = []
+        for k in range(n_parcelles):
+            rfu_max = rfu_max_mm[k]
+            rfu_arr, ks_arr = rfu_mat[k], ks_mat[k]
+            rfu_actuelle_mm = float(rfu_arr[-1])
+            ks_actuel = float(ks_arr[-1])
+            if rfu_max > 0:
+                pct_arr = np.round(rfu_arr / rfu_max * 100, 1)
             else:
-                Kc = kc_calendrier.get(str(date_obj.month), 0.1)
-
-            # 3. Coefficient de Stress Ks (FAO-56 simplifié)
-            # p = 0.5 (seuil de stress à 50% de la RFU pour la vigne)
-            seuil_stress_pct = 50.0
-            rfu_pct_veille = (rfu_actuelle_mm / rfu_max_mm) * 100 if rfu_max_mm > 0 else 0
-
-            if rfu_pct_veille > seuil_stress_pct:
-                ks = 1.0
+                pct_arr = np.zeros(n_jours)
+            rfu_historique_pct = dict(zip(date_strs, pct_arr.tolist()))
+
+            if debug:
+                print("\n🔍 MODE DEBUG - CALCUL BILAN HYDRIQUE OPTIMISÉ")
+                print(f"Date       | Pluie | P.Eff | ET₀  | Kc   | Ks   | ETc  | RFU mm | RFU %")
+                print("-" * 85)
+                etc_arr = kc_arr[k] * etp0_arr * ks_arr
+                for i, date_obj in enumerate(dates_utiles):
+                    if date_obj.day == 1 or date_obj.day == 15 or date_obj == aujourdhui:
+                        current_pct = (rfu_arr[i] / rfu_max) * 100 if rfu_max > 0 else 0
+                        print(f"{date_strs[i]} | {pluie_arr[i]:5.1f} | {p_eff_arr[i]:5.1f} | {etp0_arr[i]:4.1f} | {kc_arr[k, i]:4.2f} | {ks_arr[i]:4.2f} | {etc_arr[i]:4.1f} | {rfu_arr[i]:6.1f} | {current_pct:5.1f}%")
+                print("-" * 70)
+
+            # 8. Calculer le pourcentage final
+            if rfu_max == 0:
+                rfu_pct = 0.0
             else:
-                # Ks diminue linéairement de 1.0 à 0.0 entre le seuil et le point de flétrissement
-                ks = max(0.0, rfu_pct_veille / seuil_stress_pct)
-
-            ks_actuel = ks
+                rfu_pct = (rfu_actuelle_mm / rfu_max) * 100
 
-            # 4. Calcul Pluie Efficace et ETc
-            if pluie > i_const_mm:
-                P_eff = (pluie - i_const_mm) * (1.0 - f_runoff)
+            # 9. Déterminer le niveau d'alerte
+            if rfu_pct <= 30:
+                niveau = "STRESS FORT"
+            elif rfu_pct <= 60:
+                niveau = "SURVEILLANCE"
             else:
-                P_eff = 0.0
-
-            ETc = Kc * etp0 * ks
-
-            # 5. Bilan
-            rfu_actuelle_mm = min(rfu_max_mm, rfu_actuelle_mm + P_eff - ETc)
-            rfu_actuelle_mm = max(0.0, rfu_actuelle_mm)
-
-            current_pct = (rfu_actuelle_mm / rfu_max_mm) * 100 if rfu_max_mm > 0 else 0
-            rfu_historique_pct[date_str] = round(current_pct, 1)
-
-            if debug and (date_obj.day == 1 or date_obj.day == 15 or date_obj == aujourdhui):
-                print(f"{date_str} | {pluie:5.1f} | {P_eff:5.1f} | {etp0:4.1f} | {Kc:4.2f} | {ks:4.2f} | {ETc:4.1f} | {rfu_actuelle_mm:6.1f} | {current_pct:5.1f}%")
-
-        if debug:
-            print("-" * 70)
-
-        # 8. Calculer le pourcentage final
-        if rfu_max_mm == 0:
-            rfu_pct = 0.0
-        else:
-            rfu_pct = (rfu_actuelle_mm / rfu_max_mm) * 100
-
-        # 9. Déterminer le niveau d'alerte
-        if rfu_pct <= 30:
-            niveau = "STRESS FORT"
-        elif rfu_pct <= 60:
-            niveau = "SURVEILLANCE"
-        else:
-            niveau = "CONFORTABLE"
-
-        if stade_manuel == 'repos':
-            niveau += " (Dormance)"
-
-        return {
-            'rfu_pct': round(rfu_pct, 1),
-            'rfu_mm': round(rfu_actuelle_mm, 1),
-            'rfu_max_mm': rfu_max_mm,
-            'niveau': niveau,
-            'historique_pct': rfu_historique_pct,
-            'ks_actuel': round(ks_actuel, 2)
-        }
+                niveau = "CONFORTABLE"
+
+            if stades_manuels[k] == 'repos':
+                niveau += " (Dormance)"
+
+            resultats.append({
+                'rfu_pct': round(rfu_pct, 1),
+                'rfu_mm': round(rfu_actuelle_mm, 1),
+                'rfu_max_mm': rfu_max,
+                'niveau': niveau,
+                'historique_pct': rfu_historique_pct,
+                'ks_actuel': round(ks_actuel, 2)
+            })
+        return resultats
+
+
+def _protection_noyau(jours_ecoules, pluie, persistance: float, coef_pousse: float,
+                      seuil_lessivage: float, pousse: bool):
+    """
+    Protection résiduelle (0-10), jour par jour, d'un même traitement (cf. calculer_protection_actuelle).
+    Écrite en Python scalaire pour pouvoir être compilée telle quelle par numba (cf. _noyau_compile).
+    """
+    n = len(jours_ecoules)
+    protection_out = np.empty(n)
+    for i in range(n):
+        jours = jours_ecoules[i]
+        if jours < 0:
+            protection_out[i] = 10.0  # Traitement futur
+            continue
+        protection = max(0.0, 10.0 - (jours / persistance * 10.0))
+        if pousse:
+            protection = min(protection, max(0.0, 10.0 - (jours * coef_pousse)))
+        if pluie[i] > seuil_lessivage:
+            protection = 0.0
+        protection_out[i] = protection
+    return protection_out
+
+
+_NOYAUX_PRECHAUFFES = False
+
+
+def _prechauffer_noyaux():
+    """
+    Compile une fois par processus les noyaux numba avec de petits tableaux factices,
+    pour que la compilation ait lieu au démarrage et non à la première analyse (sans effet sans numba).
+    Avec cache=True, les compilations suivantes sont relues depuis __pycache__.
+    """
+    global _NOYAUX_PRECHAUFFES
+    if _NOYAUX_PRECHAUFFES:
+        return
+    _NOYAUX_PRECHAUFFES = True
+    zeros = np.zeros(4, dtype=np.float64)
+    appels = ((_somme_gdd, (zeros, 0.0)),
+              (_rfu_noyau, (zeros, zeros, 100.0, 50.0)),
+              (_protection_noyau, (np.zeros(4, dtype=np.int64), zeros, 7.0, 1.0, 25.0, True)))
+    for noyau, args in appels:
+        compile_ = _noyau_compile(noyau)
+        if not compile_:
+            return
+        compile_(*args)
 
 
 class GestionTraitements:
@@ -555,6 +1027,7 @@ class GestionTraitements:
         'soufre': {'nom': 'Soufre', 'persistance_jours': 8, 'lessivage_seuil_mm': 15, 'type': 'contact',
                    'dose_reference_kg_ha': 3.0, 'n_amm': '2080066'}
     }
+    TYPES_PHYTO = frozenset(("contact", "penetrant", "systemique", "autre"))
     COEF_POUSSE = {
         'repos': 0.0,
         'bourgeon_hiver': 0.0,
@@ -576,8 +1049,12 @@ class GestionTraitements:
     def __init__(self, fichier_historique: str = 'traitements'):
         self.key = fichier_historique.replace('.json', '')
         self.storage = DataManager()
+        self._version = self.storage.get_version(self.key)
         self.historique = self.charger_historique()
-        self.FONGICIDES = self.charger_produits()
+        self._indexer_traitements()
+        self._produits_version = None
+        self._produits_phyto = None  # (catalogue, clés, noms) calculés par get_produits_phyto
+        self.rafraichir_produits()
 
     def charger_produits(self) -> Dict:
         """Charge la liste des produits depuis le stockage ou utilise les valeurs par défaut."""
@@ -599,11 +1076,73 @@ class GestionTraitements:
         # Reconstruire le dictionnaire indexé par le nom technique (ou id)
         return {p.get('id', p['nom'].lower().replace(' ', '_')): p for p in produits_list}
 
+    def rafraichir_produits(self) -> Dict:
+        """Recharge les produits seulement si le stockage a changé depuis le dernier chargement."""
+        version = self.storage.get_version('produits')
+        if version is None or version != self._produits_version:
+            self.FONGICIDES = self.charger_produits()
+            # charger_produits peut avoir sauvegardé (migration initiale) : relire la version
+            self._produits_version = self.storage.get_version('produits')
+        return self.FONGICIDES
+
+    def get_produits_phyto(self) -> Tuple[List[str], List[str]]:
+        """
+        Clés et noms des produits phytosanitaires (types TYPES_PHYTO) du catalogue, dans son ordre.
+        Recalculés seulement quand le catalogue a été rechargé (nouvel objet FONGICIDES).
+        """
+        if self._produits_phyto is None or self._produits_phyto[0] is not self.FONGICIDES:
+            ids = [k for k, v in self.FONGICIDES.items() if v.get('type') in self.TYPES_PHYTO]
+            self._produits_phyto = (self.FONGICIDES, ids, [self.FONGICIDES[k]['nom'] for k in ids])
+        return self._produits_phyto[1], self._produits_phyto[2]
+
+    def invalidate_produits(self):
+        """Force le rechargement des produits au prochain rafraichir_produits()."""
+        self._produits_version = None
+
     def charger_historique(self) -> Dict:
         return self.storage.load_data(self.key, default_factory=lambda: {'traitements': []})
 
+    def rafraichir_historique(self) -> Dict:
+        """
+        Recharge l'historique seulement si le stockage a changé depuis le dernier chargement / la dernière sauvegarde
+        (ex : traitement ajouté par une autre instance). Réindexé seulement si son contenu a changé.
+        """
+        version = self.storage.get_version(self.key)
+        if version is None or version != self._version:
+            historique = self.charger_historique()
+            if historique != self.historique:
+                self.historique = historique
+                self._indexer_traitements()
+            self._version = version
+        return self.historique
+
+    def _indexer_traitements(self):
+        """Index des traitements par parcelle (du plus récent au plus ancien) et par date."""
+        self._par_parcelle: Dict[str, List[Dict]] = defaultdict(list)
+        for t in self.historique.get('traitements', []):
+            self._par_parcelle[t['parcelle']].append(t)
+        for traitements in self._par_parcelle.values():
+            traitements.sort(key=lambda x: x['date'], reverse=True)
+        # Liste chronologique + dates parallèles pour les extractions de période par dichotomie
+        self._traitements_tries = sorted(self.historique.get('traitements', []), key=lambda x: x['date'])
+        self._dates_triees = [t['date'] for t in self._traitements_tries]
+        # Colonnes NumPy alignées sur la liste chronologique (calcul IFT vectorisé)
+        self._dose_arr = np.array([t.get('dose_kg_ha', 0) for t in self._traitements_tries], dtype=np.float64)
+        self._ref_arr = np.array([t['caracteristiques'].get('dose_reference_kg_ha', 1.0)
+                                  for t in self._traitements_tries], dtype=np.float64)
+        # Protections déjà calculées, valables pour ces traitements et un index météo donné
+        self._memo_protection: Dict[Tuple[str, str, str], Tuple[float, Dict, str]] = {}
+        self._memo_index_meteo = None
+
+    def get_traitements_parcelle(self, parcelle: str) -> List[Dict]:
+        """Traitements d'une parcelle, du plus récent au plus ancien."""
+        return self._par_parcelle.get(parcelle, [])
+
     def sauvegarder_historique(self):
         self.storage.save_data(self.key, self.historique)
+        self._version = self.storage.get_version(self.key)
+        # L'historique a pu être modifié directement (suppression depuis l'interface)
+        self._indexer_traitements()
 
     def ajouter_traitement(self, parcelle: str, date: str, produit: str, dose_kg_ha: Optional[float] = None,
                            heure: str = "10:00", mouillage_pct: float = 100.0, surface_traitee: float = 0.0,
@@ -612,7 +1151,7 @@ class GestionTraitements:
                            systeme_culture: str = "PC", culture: str = "Vigne"):
 
         # On rafraîchit la liste des produits pour être sûr d'avoir les derniers ajouts
-        self.FONGICIDES = self.charger_produits()
+        self.rafraichir_produits()
 
         produit_key = produit # On attend l'ID maintenant
         if produit_key not in self.FONGICIDES:
@@ -657,14 +1196,34 @@ class GestionTraitements:
         self.sauvegarder_historique()
         print(f"✅ Traitement '{caracteristiques['nom']}' ajouté pour '{parcelle}' le {date}")
 
-    def calculer_protection_actuelle(self, parcelle: str, date_actuelle: str, meteo_periode: Dict, stade_actuel: str) -> \
-    Tuple[float, Dict, str]:
-        traitements_parcelle = [t for t in self.historique['traitements'] if t['parcelle'] == parcelle]
+    def calculer_protection_actuelle(self, parcelle: str, date_actuelle: str, meteo_periode: Dict, stade_actuel: str,
+                                     index_meteo: Optional[IndexMeteo] = None) -> Tuple[float, Dict, str]:
+        """
+        Protection résiduelle (score, dernier traitement, facteur limitant) à une date.
+        Avec un index météo, le résultat est mémorisé par (parcelle, date, stade) ; la mémoire est vidée
+        à chaque réindexation des traitements ou changement d'index météo.
+        """
+        if index_meteo is None:
+            return self._calculer_protection(parcelle, date_actuelle, meteo_periode, stade_actuel, None)
+        if self._memo_index_meteo is not index_meteo:
+            self._memo_protection = {}
+            self._memo_index_meteo = index_meteo
+        cle = (parcelle, date_actuelle, stade_actuel)
+        resultat = self._memo_protection.get(cle)
+        if resultat is None:
+            resultat = self._memo_protection[cle] = self._calculer_protection(
+                parcelle, date_actuelle, meteo_periode, stade_actuel, index_meteo
+            )
+        return resultat
+
+    def _calculer_protection(self, parcelle: str, date_actuelle: str, meteo_periode: Dict, stade_actuel: str,
+                             index_meteo: Optional[IndexMeteo]) -> Tuple[float, Dict, str]:
+        traitements_parcelle = self.get_traitements_parcelle(parcelle)
         if not traitements_parcelle:
             return 0.0, {}, "Aucun traitement"
-        dernier_traitement = max(traitements_parcelle, key=lambda x: x['date'])
-        date_trait = datetime.strptime(dernier_traitement['date'], '%Y-%m-%d')
-        date_act = datetime.strptime(date_actuelle, '%Y-%m-%d')
+        dernier_traitement = traitements_parcelle[0]
+        date_trait = date.fromisoformat(dernier_traitement['date'])
+        date_act = date.fromisoformat(date_actuelle)
         jours_ecoules = (date_act - date_trait).days
         if jours_ecoules < 0:
             return 10.0, dernier_traitement, "Traitement futur"
@@ -681,145 +1240,248 @@ class GestionTraitements:
             if protection_pousse < protection:
                 protection = protection_pousse
                 facteur_limitant = "Pousse (dilution)"
-        pluie_depuis_traitement = sum(
-            meteo_periode.get(date, {}).get('precipitation', 0)
-            for date in meteo_periode
-            if date >= dernier_traitement['date'] and date <= date_actuelle
-        )
+        if index_meteo is not None:
+            pluie_depuis_traitement = index_meteo.cumul_pluie(dernier_traitement['date'], date_actuelle)
+        else:
+            pluie_depuis_traitement = sum(
+                meteo_periode.get(date, {}).get('precipitation', 0)
+                for date in meteo_periode
+                if date >= dernier_traitement['date'] and date <= date_actuelle
+            )
         if pluie_depuis_traitement > seuil_lessivage:
             protection = 0
             facteur_limitant = f"Lessivage ({pluie_depuis_traitement:.1f}mm)"
         return round(protection, 1), dernier_traitement, facteur_limitant
 
+    def calculer_protection_serie(self, parcelle: str, dates: List[str], stade_actuel: str,
+                                  index_meteo: IndexMeteo) -> List[float]:
+        """
+        Score de protection (calculer_protection_actuelle) pour une série de dates ISO,
+        avec le même dernier traitement : la boucle journalière est un noyau numérique.
+        """
+        traitements_parcelle = self.get_traitements_parcelle(parcelle)
+        if not traitements_parcelle:
+            return [0.0] * len(dates)
+        dernier_traitement = traitements_parcelle[0]
+        date_trait = dernier_traitement['date']
+        ordinal_trait = date.fromisoformat(date_trait).toordinal()
+        jours_ecoules = np.array([date.fromisoformat(d).toordinal() - ordinal_trait for d in dates], dtype=np.int64)
+        # Pluie depuis le traitement : passe cumulative unique ; chaque jour est ensuite indépendant dans le noyau
+        pluie = index_meteo.cumuls_pluie(date_trait, dates)
+
+        carac = dernier_traitement['caracteristiques']
+        args = (float(carac.get('persistance_jours', 7)), float(self.COEF_POUSSE.get(stade_actuel, 1.0)),
+                float(carac.get('lessivage_seuil_mm', 25)), carac.get('type', 'contact') in ['contact', 'penetrant'])
+        noyau = _noyau_compile(_protection_noyau)
+        if noyau:
+            serie = noyau(jours_ecoules, pluie, *args)
+        else:
+            serie = _protection_noyau(jours_ecoules.tolist(), pluie.tolist(), *args)
+        return [round(p, 1) for p in serie.tolist()]
+
     def calculer_ift_periode(self, date_debut: str, date_fin: str, surface_totale: float) -> Dict:
-        traitements_periode = [t for t in self.historique['traitements'] if date_debut <= t['date'] <= date_fin]
+        i = bisect_left(self._dates_triees, date_debut)
+        j = bisect_right(self._dates_triees, date_fin)
+        traitements_periode = self._traitements_tries[i:j]
         if not traitements_periode:
             return {'ift_total': 0.0, 'nb_traitements': 0, 'details': []}
-        ift_details = []
-        ift_total = 0.0
-        for t in traitements_periode:
-            dose_appliquee = t.get('dose_kg_ha', 0)
-            dose_reference = t['caracteristiques'].get('dose_reference_kg_ha', 1.0)
-            ift_traitement = dose_appliquee / dose_reference
-            ift_total += ift_traitement
-            ift_details.append({'date': t['date'], 'parcelle': t['parcelle'], 'produit': t['caracteristiques']['nom'],
-                                'ift': round(ift_traitement, 2)})
+        ift_periode = self._dose_arr[i:j] / self._ref_arr[i:j]
+        ift_total = float(ift_periode.sum())
+        ift_details = [{'date': t['date'], 'parcelle': t['parcelle'], 'produit': t['caracteristiques']['nom'],
+                        'ift': round(float(ift), 2)} for t, ift in zip(traitements_periode, ift_periode)]
         return {'ift_total': round(ift_total, 2), 'nb_traitements': len(traitements_periode), 'details': ift_details,
                 'periode': f"{date_debut} à {date_fin}"}
 
 
-class GestionFertilisation:
+class _SauvegardeGroupee:
+    """
+    Regroupement des écritures : dans un bloc `with gestionnaire:`, les ajouts ne sont pas
+    sauvegardés un par un ; une seule sauvegarde est faite à la sortie du bloc.
+    """
+    _autosave = True
+    _modifie = False
+
+    def __enter__(self):
+        self._autosave = False
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._autosave = True
+        if self._modifie:
+            self._modifie = False
+            self.sauvegarder()
+        return False
+
+    def _sauvegarder_ou_differer(self):
+        """Sauvegarde immédiate, ou différée à la sortie du bloc `with` en cours."""
+        if self._autosave:
+            self.sauvegarder()
+        else:
+            self._modifie = True
+
+
+def _cumul_npk_vide() -> Dict:
+    """Cumul N-P-K-MgO vide (détail par type d'application)"""
+    return {'n': 0, 'p': 0, 'k': 0, 'mgo': 0}
+
+
+def _cumul_annuel_vide() -> Dict:
+    """Cumul N-P-K-MgO vide avec compteur de passages (bilan annuel)"""
+    return {'n': 0, 'p': 0, 'k': 0, 'mgo': 0, 'nb_passages': 0}
+
+
+def _stats_parcelle_vides() -> Dict:
+    """Statistiques de campagne vides d'une parcelle"""
+    return {'nb_analyses': 0, 'alertes_haute': 0, 'alertes_moyenne': 0, 'risque_moyen': 0, 'protection_moyenne': 0}
+
+
+class GestionFertilisation(_SauvegardeGroupee):
     """Gestion des apports en engrais et amendements"""
 
     def __init__(self, fichier='fertilisation'):
         self.key = fichier.replace('.json', '')
         self.storage = DataManager()
+        self._version = self.storage.get_version(self.key)
         self.donnees = self.charger_donnees()
+        self._indexer_apports()
 
     def charger_donnees(self) -> Dict:
         return self.storage.load_data(self.key, default_factory=lambda: {'apports': []})
 
+    def rafraichir(self) -> Dict:
+        """Recharge les apports seulement si le stockage a changé depuis le dernier chargement / la dernière sauvegarde."""
+        version = self.storage.get_version(self.key)
+        if version is None or version != self._version:
+            self.donnees = self.charger_donnees()
+            self._indexer_apports()
+            self._version = version
+        return self.donnees
+
+    def _indexer_apports(self):
+        """
+        Cumuls d'unités par (année, parcelle) et par (année, parcelle, type d'application).
+        Reconstruits en colonnes NumPy : une somme np.bincount par élément et par regroupement
+        (les poids sont cumulés dans l'ordre des apports, comme un parcours de la liste).
+        """
+        self._index_annuel: Dict[int, Dict[str, Dict]] = defaultdict(lambda: defaultdict(_cumul_annuel_vide))
+        self._index_detaille: Dict[Tuple[int, str], Dict[str, Dict]] = defaultdict(lambda: defaultdict(_cumul_npk_vide))
+        apports = self.donnees['apports']
+        if not apports:
+            return
+
+        colonnes = {k: np.array([a.get(f'u_{k}', 0) for a in apports], dtype=np.float64)
+                    for k in ('n', 'p', 'k', 'mgo')}
+        cles_annuelles = [(_annee_de(a['date']), a['parcelle']) for a in apports]
+        cles_detail = [cle + (a.get('type_application', 'Sol').lower(),) for cle, a in zip(cles_annuelles, apports)]
+
+        # Regroupements numérotés dans l'ordre de première apparition
+        groupes_annuels, groupes_detail = {}, {}
+        gid_annuel = np.array([groupes_annuels.setdefault(c, len(groupes_annuels)) for c in cles_annuelles])
+        gid_detail = np.array([groupes_detail.setdefault(c, len(groupes_detail)) for c in cles_detail])
+
+        sommes = {k: np.bincount(gid_annuel, weights=col, minlength=len(groupes_annuels)).tolist()
+                  for k, col in colonnes.items()}
+        passages = np.bincount(gid_annuel, minlength=len(groupes_annuels)).tolist()
+        for (annee, p), g in groupes_annuels.items():
+            self._index_annuel[annee][p] = {
+                'n': sommes['n'][g], 'p': sommes['p'][g], 'k': sommes['k'][g], 'mgo': sommes['mgo'][g],
+                'nb_passages': passages[g]
+            }
+
+        sommes = {k: np.bincount(gid_detail, weights=col, minlength=len(groupes_detail)).tolist()
+                  for k, col in colonnes.items()}
+        for (annee, p, t), g in groupes_detail.items():
+            self._index_detaille[(annee, p)][t] = {
+                'n': sommes['n'][g], 'p': sommes['p'][g], 'k': sommes['k'][g], 'mgo': sommes['mgo'][g]
+            }
+
+    def _indexer_apport(self, a: Dict):
+        """Ajoute un nouvel apport aux cumuls."""
+        annee = _annee_de(a['date'])
+        p = a['parcelle']
+        bilan = self._index_annuel[annee][p]
+        bilan['n'] += a.get('u_n', 0)
+        bilan['p'] += a.get('u_p', 0)
+        bilan['k'] += a.get('u_k', 0)
+        bilan['mgo'] += a.get('u_mgo', 0)
+        bilan['nb_passages'] += 1
+
+        detail = self._index_detaille[(annee, p)][a.get('type_application', 'Sol').lower()]
+        detail['n'] += a.get('u_n', 0)
+        detail['p'] += a.get('u_p', 0)
+        detail['k'] += a.get('u_k', 0)
+        detail['mgo'] += a.get('u_mgo', 0)
+
     def sauvegarder(self):
         self.storage.save_data(self.key, self.donnees)
+        self._version = self.storage.get_version(self.key)
+        # Les apports ont pu être modifiés directement (suppression depuis l'interface)
+        self._indexer_apports()
 
     def ajouter_apport(self, parcelle: str, date_apport: str, produit_id: str, produit_info: Dict, quantite_ha: float):
         """Ajoute un apport et calcule les unités"""
 
-        # Calcul des unités : Qty * (% / 100)
-        u_n = quantite_ha * (float(produit_info.get('n', 0)) / 100)
-        u_p = quantite_ha * (float(produit_info.get('p', 0)) / 100)
-        u_k = quantite_ha * (float(produit_info.get('k', 0)) / 100)
-        u_mgo = quantite_ha * (float(produit_info.get('mgo', 0)) / 100)
+        # Calcul des unités : Qty * (% / 100), arrondies au centième
+        info = produit_info.get
+        u_n, u_p, u_k, u_mgo = (round(quantite_ha * (float(info('n', 0)) / 100), 2),
+                                round(quantite_ha * (float(info('p', 0)) / 100), 2),
+                                round(quantite_ha * (float(info('k', 0)) / 100), 2),
+                                round(quantite_ha * (float(info('mgo', 0)) / 100), 2))
 
         apport = {
             'parcelle': parcelle,
             'date': date_apport,
             'produit_id': produit_id,
-            'produit_nom': produit_info.get('nom', produit_id),
+            'produit_nom': info('nom', produit_id),
             'quantite_ha': quantite_ha,
-            'u_n': round(u_n, 2),
-            'u_p': round(u_p, 2),
-            'u_k': round(u_k, 2),
-            'u_mgo': round(u_mgo, 2),
-            'bio': produit_info.get('bio', False),
-            'type_application': produit_info.get('type_application', 'Sol')
+            'u_n': u_n,
+            'u_p': u_p,
+            'u_k': u_k,
+            'u_mgo': u_mgo,
+            'bio': info('bio', False),
+            'type_application': info('type_application', 'Sol')
         }
 
         self.donnees['apports'].append(apport)
-        self.sauvegarder()
+        self._indexer_apport(apport)
+        if self._autosave:
+            # Index déjà à jour : ajout au journal (ou écriture complète), sans reconstruction
+            if not self.storage.append_record(self.key, 'apports', apport):
+                self.storage.save_data(self.key, self.donnees)
+            self._version = self.storage.get_version(self.key)
+        else:
+            self._modifie = True
         return apport
 
+    def ajouter_apports_batch(self, apports: List[Dict]) -> List[Dict]:
+        """Ajoute plusieurs apports (arguments de ajouter_apport) et sauvegarde une seule fois."""
+        with self:
+            return [self.ajouter_apport(**a) for a in apports]
+
     def get_bilan_annuel(self, annee: int) -> Dict:
         """Retourne le bilan N-P-K par parcelle pour une année"""
-        bilan = {}
-        for a in self.donnees['apports']:
-            date_dt = datetime.strptime(a['date'], '%Y-%m-%d')
-            if date_dt.year == annee:
-                p = a['parcelle']
-                if p not in bilan:
-                    bilan[p] = {'n': 0, 'p': 0, 'k': 0, 'mgo': 0, 'nb_passages': 0}
-                bilan[p]['n'] += a.get('u_n', 0)
-                bilan[p]['p'] += a.get('u_p', 0)
-                bilan[p]['k'] += a.get('u_k', 0)
-                bilan[p]['mgo'] += a.get('u_mgo', 0)
-                bilan[p]['nb_passages'] += 1
-
-        # Arrondir les résultats
-        for p in bilan:
-            bilan[p]['n'] = round(bilan[p]['n'], 1)
-            bilan[p]['p'] = round(bilan[p]['p'], 1)
-            bilan[p]['k'] = round(bilan[p]['k'], 1)
-            bilan[p]['mgo'] = round(bilan[p]['mgo'], 1)
-
-        return bilan
+        return {p: {'n': round(v['n'], 1), 'p': round(v['p'], 1), 'k': round(v['k'], 1),
+                    'mgo': round(v['mgo'], 1), 'nb_passages': v['nb_passages']}
+                for p, v in self._index_annuel.get(annee, {}).items()}
 
     def get_bilan_detaille(self, annee: int, parcelle_nom: str) -> Dict:
         """Retourne le bilan N-P-K détaillé (Sol vs Foliaire)"""
-        detail = {'sol': {'n': 0, 'p': 0, 'k': 0, 'mgo': 0}, 'foliaire': {'n': 0, 'p': 0, 'k': 0, 'mgo': 0}}
-        for a in self.donnees['apports']:
-            date_dt = datetime.strptime(a['date'], '%Y-%m-%d')
-            if date_dt.year == annee and a['parcelle'] == parcelle_nom:
-                t = a.get('type_application', 'Sol').lower()
-                if t not in detail: detail[t] = {'n': 0, 'p': 0, 'k': 0, 'mgo': 0}
-                detail[t]['n'] += a.get('u_n', 0)
-                detail[t]['p'] += a.get('u_p', 0)
-                detail[t]['k'] += a.get('u_k', 0)
-                detail[t]['mgo'] += a.get('u_mgo', 0)
-
-        for t in detail:
-            for k in detail[t]:
-                detail[t][k] = round(detail[t][k], 1)
-        return detail
+        detail = {'sol': _cumul_npk_vide(), 'foliaire': _cumul_npk_vide()}
+        for t, unites in self._index_detaille.get((annee, parcelle_nom), {}).items():
+            detail[t] = unites
+        return {t: {k: round(v, 1) for k, v in unites.items()} for t, unites in detail.items()}
 
     def calculer_bilan_pilotage(self, parcelle_nom: str, annee: int, config_vignoble: 'ConfigVignoble') -> Dict:
         """Calcule les besoins théoriques et le solde pour une parcelle avec breakdown sarments"""
-        parcelle = next((p for p in config_vignoble.parcelles if p['nom'] == parcelle_nom), None)
+        parcelle = config_vignoble.get_parcelle(parcelle_nom)
         if not parcelle:
             return {}
 
         objectif_hl_ha = parcelle.get('objectif_rdt', 50.0)
         cepages = parcelle.get('cepages', [])
 
-        # Calculer le coefficient moyen pondéré par cépage
-        all_coefs = config_vignoble.export_coefs
-
-        sum_n, sum_p, sum_k, sum_mgo = 0, 0, 0, 0
-        count = 0
-        for c in cepages:
-            coef = all_coefs.get(c, {'n': 1.0, 'p': 0.4, 'k': 1.3, 'mgo': 0.2})
-            sum_n += coef.get('n', 0)
-            sum_p += coef.get('p', 0)
-            sum_k += coef.get('k', 0)
-            sum_mgo += coef.get('mgo', 0)
-            count += 1
-
-        if count > 0:
-            avg_coef_n = sum_n / count
-            avg_coef_p = sum_p / count
-            avg_coef_k = sum_k / count
-            avg_coef_mgo = sum_mgo / count
-        else:
-            avg_coef_n, avg_coef_p, avg_coef_k, avg_coef_mgo = 1.0, 0.4, 1.3, 0.2
+        # Coefficient moyen par cépage (mis en cache par la configuration)
+        _, avg_coef_n, avg_coef_p, avg_coef_k, avg_coef_mgo = config_vignoble.get_coefs_cepages(cepages)
 
         # Besoin théorique (Unités/Ha) = Objectif (Hl/Ha) * Coef (Unités/Hl)
         besoin_n = objectif_hl_ha * avg_coef_n
@@ -872,17 +1534,57 @@ class GestionFertilisation:
         }
 
 
-class GestionHistoriqueAlertes:
+class GestionHistoriqueAlertes(_SauvegardeGroupee):
     """Gestion de l'historique des alertes et analyses"""
 
     def __init__(self, fichier='historique_alertes'):
         self.key = fichier.replace('.json', '')
         self.storage = DataManager()
         self.historique = self.charger_historique()
+        self._indexer_campagnes()
 
     def charger_historique(self):
         return self.storage.load_data(self.key, default_factory=self.creer_structure_defaut)
 
+    def _indexer_campagnes(self):
+        """Index des campagnes par année et, pour chacune, des analyses par (date, parcelle)."""
+        self._campagne_par_annee: Dict[int, Dict] = {}
+        self._analyses_par_cle: Dict[int, Dict[Tuple[str, str], int]] = {}
+        self._dates_analyses: Dict[int, Tuple[List[str], List[int]]] = {}
+        for c in self.historique['campagnes']:
+            if c['annee'] in self._campagne_par_annee:
+                continue  # Doublon : seule la première campagne de l'année est utilisée
+            self._campagne_par_annee[c['annee']] = c
+            index = self._analyses_par_cle[c['annee']] = {}
+            for i, a in enumerate(c['analyses']):
+                index.setdefault((a.get('date'), a.get('parcelle')), i)
+
+    def _enregistrer_analyse(self, analyse_complete):
+        """Remplace l'analyse du même jour pour la parcelle, ou l'ajoute à la campagne de l'année."""
+        annee = _annee_de(analyse_complete['date_analyse'])
+        campagne = self.get_campagne(annee)
+        if not campagne:
+            campagne = self.creer_campagne(annee)
+
+        analyse_simplifiee = self._simplifier_analyse(analyse_complete)
+        index = self._analyses_par_cle[annee]
+        cle = (analyse_simplifiee['date'], analyse_simplifiee['parcelle'])
+        if cle in index:
+            campagne['analyses'][index[cle]] = analyse_simplifiee
+        else:
+            index[cle] = len(campagne['analyses'])
+            campagne['analyses'].append(analyse_simplifiee)
+            self._dates_analyses.pop(annee, None)
+
+    def _analyses_triees(self, annee) -> Tuple[List[str], List[int]]:
+        """Dates triées des analyses de la campagne et positions correspondantes (calculées au besoin)."""
+        tri = self._dates_analyses.get(annee)
+        if tri is None:
+            analyses = self._campagne_par_annee[annee]['analyses']
+            ordre = sorted(range(len(analyses)), key=lambda i: analyses[i]['date'])
+            tri = self._dates_analyses[annee] = ([analyses[i]['date'] for i in ordre], ordre)
+        return tri
+
     def creer_structure_defaut(self):
         return {'campagnes': []}
 
@@ -890,13 +1592,14 @@ class GestionHistoriqueAlertes:
         self.storage.save_data(self.key, self.historique)
 
     def get_campagne(self, annee):
-        for c in self.historique['campagnes']:
-            if c['annee'] == annee: return c
-        return None
+        return self._campagne_par_annee.get(annee)
 
     def creer_campagne(self, annee):
         campagne = {'annee': annee, 'analyses': []}
         self.historique['campagnes'].append(campagne)
+        if annee not in self._campagne_par_annee:
+            self._campagne_par_annee[annee] = campagne
+            self._analyses_par_cle[annee] = {}
         return campagne
 
     def _simplifier_analyse(self, analyse_complete):
@@ -943,45 +1646,17 @@ class GestionHistoriqueAlertes:
         }
 
     def ajouter_analyse(self, analyse_complete):
-        date_analyse = analyse_complete['date_analyse']
-        annee = datetime.strptime(date_analyse, '%Y-%m-%d').year
-        campagne = self.get_campagne(annee)
-        if not campagne:
-            campagne = self.creer_campagne(annee)
-
-        analyse_simplifiee = self._simplifier_analyse(analyse_complete)
-
-        analyses_existantes = [a for a in campagne['analyses']
-                               if a['date'] == date_analyse and a['parcelle'] == analyse_complete['parcelle']]
-        if analyses_existantes:
-            idx = campagne['analyses'].index(analyses_existantes[0])
-            campagne['analyses'][idx] = analyse_simplifiee
-        else:
-            campagne['analyses'].append(analyse_simplifiee)
-        self.sauvegarder()
+        self._enregistrer_analyse(analyse_complete)
+        self._sauvegarder_ou_differer()
 
     def ajouter_analyses_batch(self, analyses_completes):
         """Ajoute plusieurs analyses et sauvegarde une seule fois."""
         if not analyses_completes: return
 
         for analyse_complete in analyses_completes:
-            date_analyse = analyse_complete['date_analyse']
-            annee = datetime.strptime(date_analyse, '%Y-%m-%d').year
-            campagne = self.get_campagne(annee)
-            if not campagne:
-                campagne = self.creer_campagne(annee)
-
-            analyse_simplifiee = self._simplifier_analyse(analyse_complete)
-
-            analyses_existantes = [a for a in campagne['analyses']
-                                   if a['date'] == date_analyse and a['parcelle'] == analyse_complete['parcelle']]
-            if analyses_existantes:
-                idx = campagne['analyses'].index(analyses_existantes[0])
-                campagne['analyses'][idx] = analyse_simplifiee
-            else:
-                campagne['analyses'].append(analyse_simplifiee)
+            self._enregistrer_analyse(analyse_complete)
 
-        self.sauvegarder()
+        self._sauvegarder_ou_differer()
 
     def get_analyses_parcelle(self, parcelle, date_debut=None, date_fin=None):
         analyses = []
@@ -995,10 +1670,20 @@ class GestionHistoriqueAlertes:
 
     def get_alertes_urgence(self, urgence='haute', jours=7):
         date_limite = (datetime.now() - timedelta(days=jours)).strftime('%Y-%m-%d')
+        annee_limite = int(date_limite[:4])
         alertes = []
         for campagne in self.historique['campagnes']:
-            for analyse in campagne['analyses']:
-                if analyse['date'] >= date_limite and analyse['decision']['urgence'] == urgence:
+            if campagne['annee'] < annee_limite:
+                continue  # Campagne entièrement antérieure à la fenêtre
+            analyses = campagne['analyses']
+            if self._campagne_par_annee.get(campagne['annee']) is campagne:
+                # Recherche dichotomique de la première analyse de la fenêtre
+                dates, ordre = self._analyses_triees(campagne['annee'])
+                recentes = (analyses[i] for i in ordre[bisect_left(dates, date_limite):])
+            else:
+                recentes = (a for a in analyses if a['date'] >= date_limite)
+            for analyse in recentes:
+                if analyse['decision']['urgence'] == urgence:
                     alertes.append(analyse)
         return sorted(alertes, key=lambda x: x['date'], reverse=True)
 
@@ -1006,13 +1691,15 @@ class GestionHistoriqueAlertes:
         campagne = self.get_campagne(annee)
         if not campagne or not campagne['analyses']: return None
         analyses = campagne['analyses']
-        parcelles_stats = {}
+        parcelles_stats = defaultdict(_stats_parcelle_vides)
+        date_debut = date_fin = analyses[0]['date']
         for analyse in analyses:
-            parcelle = analyse['parcelle']
-            if parcelle not in parcelles_stats:
-                parcelles_stats[parcelle] = {'nb_analyses': 0, 'alertes_haute': 0, 'alertes_moyenne': 0,
-                                             'risque_moyen': 0, 'protection_moyenne': 0}
-            stats = parcelles_stats[parcelle]
+            date_analyse = analyse['date']
+            if date_analyse < date_debut:
+                date_debut = date_analyse
+            elif date_analyse > date_fin:
+                date_fin = date_analyse
+            stats = parcelles_stats[analyse['parcelle']]
             stats['nb_analyses'] += 1
             stats['risque_moyen'] += analyse['risque_mildiou']['score']
             stats['protection_moyenne'] += analyse['protection']['score']
@@ -1024,8 +1711,19 @@ class GestionHistoriqueAlertes:
             if stats['nb_analyses'] > 0:
                 stats['risque_moyen'] = round(stats['risque_moyen'] / stats['nb_analyses'], 2)
                 stats['protection_moyenne'] = round(stats['protection_moyenne'] / stats['nb_analyses'], 2)
-        return {'annee': annee, 'nb_analyses_total': len(analyses), 'parcelles': parcelles_stats,
-                'periode': {'debut': min(a['date'] for a in analyses), 'fin': max(a['date'] for a in analyses)}}
+        return {'annee': annee, 'nb_analyses_total': len(analyses), 'parcelles': dict(parcelles_stats),
+                'periode': {'debut': date_debut, 'fin': date_fin}}
+
+
+class DecisionParcelle(NamedTuple):
+    """Résultat réduit d'une analyse (cf. SystemeDecision.analyser_parcelle_rapide)"""
+    parcelle: str
+    date: str
+    risque: float
+    protection: float
+    score: float
+    action: str
+    urgence: str
 
 
 class SystemeDecision:
@@ -1038,7 +1736,20 @@ class SystemeDecision:
     SEUIL_IPI_HAUT = 50
     SEUIL_IPI_MOYEN = 30
 
+    # Paliers de traitement Mildiou, du plus urgent au moins urgent : (IPI min, score min, action, urgence)
+    PALIERS_DECISION_MILDIOU = (
+        (SEUIL_IPI_HAUT, SEUIL_DECISION_HAUTE, "TRAITEMENT URGENT (Mildiou)", "haute"),
+        (SEUIL_IPI_MOYEN, SEUIL_DECISION_MOYENNE, "TRAITEMENT PRÉVENTIF (Mildiou)", "moyenne"),
+    )
+    ALERTES_OIDIUM = {
+        'FORT': "⚠️ RISQUE OÏDIUM FORT - Vérifier protection",
+        'MOYEN': "🔸 Risque Oïdium MOYEN - Surveillance",
+    }
+
     METEO_HISTORIQUE_FILE = 'meteo_historique.json'
+    HISTORIQUE_ANALYSES_MAX = 1000  # Résumés d'analyses gardés en mémoire pour l'export CSV
+    ANALYSE_THREADS_MAX = 8  # Parcelles analysées en parallèle par analyser_toutes_parcelles
+    CHAMPS_EXPORT_CSV = ('date', 'parcelle', 'risque', 'protection', 'decision_score')  # Ordre des résumés
     GDD_STADE_MAP = {
         100: 'bourgeon_coton',     # Stade B
         180: 'pointe_verte',       # Stade C (Biofix)
@@ -1065,11 +1776,17 @@ class SystemeDecision:
         self.modele_ipi = ModeleIPI()
         self.modele_oidium = ModeleOidium()
         self.modele_bilan_hydrique = ModeleBilanHydrique()
-        self.historique_analyses = []
+        self.historique_analyses = deque(maxlen=self.HISTORIQUE_ANALYSES_MAX)
+        self._nb_analyses = 0  # Total depuis le démarrage (y compris celles sorties de la mémoire)
+        self._analyses_exportees: Dict[str, int] = {}  # Fichier CSV -> total déjà écrit
+        self._verrou_historique = threading.Lock()  # Résumés ajoutés depuis les threads d'analyse
+        self._figure_evolution = None  # (Figure, Axes) réutilisés d'un graphique à l'autre
         self.historique_alertes = GestionHistoriqueAlertes()
+        _prechauffer_noyaux()
 
         self.meteo_historique: Dict[str, Dict] = self._charger_meteo_historique()
         # On lance une mise à jour de l'historique météo au démarrage
+        # (l'index trié est reconstruit à chaque mise à jour, cf. _mettre_a_jour_historique_meteo)
         self._mettre_a_jour_historique_meteo()
 
     def _charger_meteo_historique(self) -> Dict[str, Dict]:
@@ -1114,12 +1831,14 @@ class SystemeDecision:
 
         if not meteo_data_recent:
             print("❌ Échec de la mise à jour de l'historique météo. Utilisation des données en cache.")
+            self.index_meteo = IndexMeteo(self.meteo_historique)
             return self.meteo_historique
 
         aujourdhui = datetime.now().date()
-        T_base = self.config.parametres.get('t_base_gdd', 10.0)
+        T_base = self.config.t_base_gdd
 
         # 2. Mettre à jour l'historique persistant
+        historique_modifie = False
         for date_str, data in meteo_data_recent.items():
             if not data:
                 continue
@@ -1153,7 +1872,7 @@ class SystemeDecision:
 
             # Fusion (sans écraser par None)
             jour = self.meteo_historique.get(date_str, {})
-            self.meteo_historique[date_str] = {
+            nouveau_jour = {
                 'temp_moy': temp_moy,
                 'temp_max': temp_max if temp_max is not None else jour.get('temp_max'),
                 'temp_min': temp_min if temp_min is not None else jour.get('temp_min'),
@@ -1162,9 +1881,16 @@ class SystemeDecision:
                 'etp0': etp0 if etp0 is not None else jour.get('etp0', 3.5),
                 'gdd_jour': gdd_journalier
             }
+            if nouveau_jour != jour:
+                self.meteo_historique[date_str] = nouveau_jour
+                historique_modifie = True
 
-        # 3. Sauvegarder le fichier (contient maintenant l'ancien + le nouveau)
-        self._sauvegarder_meteo_historique()
+        # 3. Sauvegarder le fichier (contient maintenant l'ancien + le nouveau) seulement s'il a changé
+        if historique_modifie:
+            self._sauvegarder_meteo_historique()
+
+        # 4. Dates triées (et colonnes) recalculées une seule fois par mise à jour de l'historique
+        self.index_meteo = IndexMeteo(self.meteo_historique)
 
         return self.meteo_historique
 
@@ -1177,32 +1903,34 @@ class SystemeDecision:
             if stade_manuel == 'repos' and not parcelle.get('date_debourrement'):
                 return 0, 'repos', 180, 'pointe_verte', 'En dormance (calcul GDD inactif)'
 
-            annee_actuelle = datetime.strptime(date_actuelle, '%Y-%m-%d').year
-            aujourdhui = datetime.strptime(date_actuelle, '%Y-%m-%d').date()
+            aujourdhui = date.fromisoformat(date_actuelle)
+            annee_actuelle = aujourdhui.year
 
-            date_debut_gdd_str = f"{annee_actuelle}-03-01"
+            date_debut_gdd = date(annee_actuelle, 3, 1)
             mode_calcul = "1er Mars (Estimation)"
 
             date_biofix = parcelle.get('date_debourrement')
             gdd_initial = 0.0
             if date_biofix:
-                date_biofix_dt = datetime.strptime(date_biofix, '%Y-%m-%d')
-                if date_biofix_dt.year == annee_actuelle and date_biofix_dt.date() <= aujourdhui:
-                    date_debut_gdd_str = date_biofix
+                date_biofix_dt = date.fromisoformat(date_biofix)
+                if date_biofix_dt.year == annee_actuelle and date_biofix_dt <= aujourdhui:
+                    date_debut_gdd = date_biofix_dt
                     mode_calcul = f"Biofix ({date_biofix})"
                     # Jules : Si on utilise un Biofix manuel (Pointe verte), on part de 180 GDD
                     gdd_initial = 180.0
 
-            date_debut_gdd = datetime.strptime(date_debut_gdd_str, '%Y-%m-%d').date()
-
-            gdd_sum = gdd_initial
             stade_estime_gdd = 'repos'
 
-            dates_historique = sorted(meteo_historique.keys())
-
-            for date_str in dates_historique:
-                date_meteo = datetime.strptime(date_str, '%Y-%m-%d').date()
-                if date_meteo >= date_debut_gdd and date_meteo <= aujourdhui:
+            # Fenêtre [début GDD, aujourd'hui] : décalage en jours dans l'index,
+            # ou dichotomie sur les dates ISO (comparables comme des chaînes) pour un autre historique
+            if meteo_historique is self.meteo_historique:
+                gdd_sum = self.index_meteo.cumul_gdd(date_debut_gdd, aujourdhui, gdd_initial)
+            else:
+                dates_historique = sorted(meteo_historique.keys())
+                i = bisect_left(dates_historique, date_debut_gdd.isoformat())
+                j = bisect_right(dates_historique, date_actuelle)
+                gdd_sum = gdd_initial
+                for date_str in dates_historique[i:j]:
                     gdd_sum += meteo_historique.get(date_str, {}).get('gdd_jour', 0.0)
 
             for gdd_seuil, nom_stade in sorted(self.GDD_STADE_MAP.items(), reverse=True):
@@ -1240,8 +1968,11 @@ class SystemeDecision:
         gdd_futur_cumul = 0
         jours_pour_atteindre = -1
 
-        dates_futures = sorted([d for d in meteo_historique.keys() if d > date_actuelle])[:7]
-        T_base = self.config.parametres.get('t_base_gdd', 10.0)
+        if meteo_historique is self.meteo_historique:
+            dates_futures = self.index_meteo.dates_apres(date_actuelle, 7)
+        else:
+            dates_futures = sorted([d for d in meteo_historique.keys() if d > date_actuelle])[:7]
+        T_base = self.config.t_base_gdd
 
         for i, date in enumerate(dates_futures):
             if date in meteo_historique and meteo_historique[date]:
@@ -1271,11 +2002,47 @@ class SystemeDecision:
                                   sauvegarder: bool = True) -> Dict[str, Dict]:
         """Analyse toutes les parcelles et sauvegarde en batch."""
         analyses = {}
-        for parcelle in self.config.parcelles:
-            analyses[parcelle['nom']] = self.analyser_parcelle(
-                parcelle['nom'], utiliser_ipi, debug, sauvegarder_historique=False
+        precalculs = {}
+        if not debug and self.meteo_historique:
+            # GDD par parcelle puis bilan hydrique de toutes les parcelles en une seule passe
+            # (en mode debug, on garde le calcul parcelle par parcelle pour l'ordre des traces)
+            date_actuelle = datetime.now().strftime('%Y-%m-%d')
+            config = self.config
+            for parcelle in self.config.parcelles:
+                precalculs[parcelle['nom']] = {'gdd': self._calculer_gdd(
+                    parcelle, self.meteo_historique, date_actuelle, parcelle['stade_actuel']
+                )}
+            bilans = self.modele_bilan_hydrique.calculer_bilan_rfu_batch(
+                self.meteo_historique,
+                [p['stade_actuel'] for p in self.config.parcelles],
+                config.kc_calendrier,
+                [p.get('rfu_max_mm', config.rfu_max_mm_default) for p in self.config.parcelles],
+                config.f_runoff,
+                config.i_const_mm,
+                gdd_cumuls=[precalculs[p['nom']]['gdd'][0] for p in self.config.parcelles],
+                dates_triees=self.config.get_dates_meteo_triees(self.meteo_historique),
+                kc_mois=self.config.kc_mois,
+                index_meteo=self.index_meteo
+            )
+            for parcelle, bilan in zip(self.config.parcelles, bilans):
+                precalculs[parcelle['nom']]['bilan_hydrique'] = bilan
+
+        def analyser(parcelle):
+            return self.analyser_parcelle(
+                parcelle['nom'], utiliser_ipi, debug, sauvegarder_historique=False,
+                precalcul=precalculs.get(parcelle['nom'])
             )
 
+        parcelles = self.config.parcelles
+        if debug or len(parcelles) < 2:
+            resultats = [analyser(p) for p in parcelles]  # Traces debug dans l'ordre des parcelles
+        else:
+            # Parcelles indépendantes : analysées en parallèle, résultats rendus dans l'ordre
+            with ThreadPoolExecutor(max_workers=min(self.ANALYSE_THREADS_MAX, len(parcelles))) as executeur:
+                resultats = list(executeur.map(analyser, parcelles))
+        for parcelle, analyse in zip(parcelles, resultats):
+            analyses[parcelle['nom']] = analyse
+
         if sauvegarder:
             try:
                 self.historique_alertes.ajouter_analyses_batch(list(analyses.values()))
@@ -1284,10 +2051,118 @@ class SystemeDecision:
 
         return analyses
 
+    def _calculer_ipi(self, meteo_48h: List[Dict], stade_coef: float, utiliser_ipi: bool,
+                      debug: bool = False) -> Tuple[Optional[float], str]:
+        """IPI du jour le plus pluvieux des dernières 48h et son niveau ; (None, "N/A") si l'IPI n'est pas demandé"""
+        ipi_value = None
+        ipi_risque = "N/A"
+        if utiliser_ipi and meteo_48h and stade_coef > 0.0:
+            # Jour le plus pluvieux (premier en cas d'égalité), en un seul parcours sans lambda
+            jour_max_pluie = None
+            pluie_max = -1
+            for m in meteo_48h:
+                p = m.get('precipitation', 0) if m else -1
+                if jour_max_pluie is None or p > pluie_max:
+                    pluie_max = p
+                    jour_max_pluie = m
+            if jour_max_pluie and jour_max_pluie.get('precipitation', 0) >= 2:
+                duree_humect = self.modele_ipi.estimer_duree_humectation(jour_max_pluie.get('precipitation'),
+                                                                         jour_max_pluie.get('humidite'))
+                if duree_humect > 0:
+                    ipi_value = self.modele_ipi.calculer_ipi(jour_max_pluie, duree_humect)
+                    if ipi_value >= 60:
+                        ipi_risque = "FORT"
+                    elif ipi_value >= 30:
+                        ipi_risque = "MOYEN"
+                    else:
+                        ipi_risque = "FAIBLE"
+
+                    if debug:
+                        print("\n🔍 MODE DEBUG - CALCUL IPI")
+                        print(f"Jour max pluie: {jour_max_pluie.get('precipitation'):.1f}mm")
+                        print(f"Température: {jour_max_pluie.get('temp_moy'):.1f}°C")
+                        print(f"Humidité: {jour_max_pluie.get('humidite', 0):.0f}%")
+                        print(f"Durée humectation: {duree_humect:.1f}h")
+                        print(f"→ IPI: {ipi_value}/100 ({ipi_risque})")
+                else:
+                    ipi_value = 0; ipi_risque = "FAIBLE (Humect. Nulle)"
+            else:
+                ipi_value = 0; ipi_risque = "FAIBLE (Pluie Insuff.)"
+        elif utiliser_ipi:
+            ipi_value = 0
+            ipi_risque = "NUL (Repos végétatif)"
+        return ipi_value, ipi_risque
+
+    def _decider(self, score_decision: float, ipi_value: Optional[float]) -> Tuple[str, str]:
+        """Action et urgence Mildiou d'après le score de décision (risque - protection) et l'IPI"""
+        ipi_present = ipi_value if ipi_value is not None else 0
+
+        if score_decision <= 0:
+            decision, urgence = "Protection suffisante (Mildiou)", "faible"
+        else:
+            for ipi_min, score_min, decision, urgence in self.PALIERS_DECISION_MILDIOU:
+                if ipi_present >= ipi_min and score_decision >= score_min:
+                    break
+            else:
+                if ipi_present < 20 and score_decision < 2.0:
+                    decision, urgence = "Pas de traitement Mildiou nécessaire", "faible"
+                elif ipi_present > 0:
+                    decision, urgence = "Surveillance : risque modéré (Mildiou)", "faible"
+                elif score_decision >= self.SEUIL_DECISION_HAUTE:
+                    decision = "Risque théorique élevé : surveiller remontée des températures (Mildiou)"
+                    urgence = "moyenne"
+                else:
+                    decision, urgence = "Pas de traitement Mildiou nécessaire", "faible"
+        return decision, urgence
+
+    def analyser_parcelle_rapide(self, nom_parcelle: str, utiliser_ipi: bool = False) -> Optional[DecisionParcelle]:
+        """
+        Décision Mildiou seule (risque, protection, action), pour les ré-analyses en masse :
+        ni oïdium, ni GDD, ni bilan hydrique, ni prévisions, et pas de dictionnaire d'analyse.
+        Même décision que analyser_parcelle ; le résumé est ajouté à l'historique en mémoire (export CSV).
+        Retourne None si la parcelle est inconnue ou l'historique météo vide.
+        """
+        parcelle = self.config.get_parcelle(nom_parcelle)
+        if not parcelle or not self.meteo_historique:
+            return None
+
+        aujourdhui = datetime.now().date()
+        date_actuelle = aujourdhui.isoformat()
+        jour = aujourdhui.toordinal()
+        meteo_48h = [self.meteo_historique.get(date.fromordinal(jour - i).isoformat(), {}) for i in range(2, -1, -1)]
+
+        stade_manuel = parcelle['stade_actuel']
+        stade_coef = self.config.COEF_STADES.get(stade_manuel, 1.0)
+        if stade_coef == 0.0:
+            risque_simple = 0.0
+        else:
+            risque_simple, _ = self.modele_simple.calculer_risque_infection(
+                meteo_48h, stade_coef, self.config.get_coefs_cepages(parcelle['cepages'])[0]
+            )
+        ipi_value, _ = self._calculer_ipi(meteo_48h, stade_coef, utiliser_ipi)
+        protection, _, _ = self.traitements.calculer_protection_actuelle(
+            nom_parcelle, date_actuelle, self.meteo_historique, stade_manuel, index_meteo=self.index_meteo
+        )
+        score_decision = risque_simple - protection
+        decision, urgence = self._decider(score_decision, ipi_value)
+
+        with self._verrou_historique:
+            self.historique_analyses.append(
+                (date_actuelle, nom_parcelle, risque_simple, protection, score_decision))
+            self._nb_analyses += 1
+
+        return DecisionParcelle(nom_parcelle, date_actuelle, risque_simple, protection,
+                                round(score_decision, 1), decision, urgence)
+
     def analyser_parcelle(self, nom_parcelle: str, utiliser_ipi: bool = False,
-                          debug: bool = False, sauvegarder_historique: bool = True) -> Dict:
-        """Analyse complète d'une parcelle"""
-        parcelle = next((p for p in self.config.parcelles if p['nom'] == nom_parcelle), None)
+                          debug: bool = False, sauvegarder_historique: bool = True,
+                          precalcul: Optional[Dict] = None) -> Dict:
+        """
+        Analyse complète d'une parcelle.
+        `precalcul` peut fournir le résultat de `_calculer_gdd` ('gdd') et le bilan hydrique
+        ('bilan_hydrique') déjà calculés en lot par analyser_toutes_parcelles.
+        """
+        parcelle = self.config.get_parcelle(nom_parcelle)
         if not parcelle:
             return {'erreur': f"Parcelle '{nom_parcelle}' non trouvée"}
 
@@ -1296,21 +2171,31 @@ class SystemeDecision:
         if not meteo_historique_complet:
             return {'erreur': "Historique météo vide. Impossible de lancer l'analyse."}
 
-        date_actuelle = datetime.now().strftime('%Y-%m-%d')
+        # Une seule lecture de l'horloge : toutes les fenêtres se rapportent au même jour
+        aujourdhui = datetime.now().date()
+        date_actuelle = aujourdhui.isoformat()
+        jour = aujourdhui.toordinal()
+        dates_7j = [date.fromordinal(jour - i).isoformat() for i in range(6, -1, -1)]
 
-        dates_48h = [(datetime.now() - timedelta(days=i)).strftime('%Y-%m-%d') for i in range(2, -1, -1)]
+        dates_48h = dates_7j[-3:]
         meteo_48h = [meteo_historique_complet.get(d, {}) for d in dates_48h]
 
-        sensibilites = [self.config.SENSIBILITES_CEPAGES.get(c, 5) for c in parcelle['cepages']]
-        sensibilite_moy = sum(sensibilites) / len(sensibilites)
+        sensibilite_moy = self.config.get_coefs_cepages(parcelle['cepages'])[0]
 
         stade_manuel = parcelle['stade_actuel']
         stade_coef = self.config.COEF_STADES.get(stade_manuel, 1.0)
+        # Dormance (coef de stade nul) : les scores mildiou et oïdium sont nuls quelle que soit la météo,
+        # les modèles ne sont pas évalués (sauf en debug, pour garder le détail des calculs).
+        # GDD et prévision de stade ont leur propre raccourci pour le repos.
+        dormance = stade_coef == 0.0 and not debug
 
         # MODÈLE SIMPLE
-        risque_simple, niveau_simple = self.modele_simple.calculer_risque_infection(
-            meteo_48h, stade_coef, sensibilite_moy
-        )
+        if dormance:
+            risque_simple, niveau_simple = 0.0, "FAIBLE"
+        else:
+            risque_simple, niveau_simple = self.modele_simple.calculer_risque_infection(
+                meteo_48h, stade_coef, sensibilite_moy
+            )
 
         if debug:
             print(f"\n🔍 MODE DEBUG - STADE MANUEL UTILISÉ : {stade_manuel} (Coef: {stade_coef})")
@@ -1324,43 +2209,17 @@ class SystemeDecision:
             print(f"→ Score: {risque_simple}/10 ({niveau_simple})")
 
         # MODÈLE IPI
-        ipi_value = None
-        ipi_risque = "N/A"
-        if utiliser_ipi and meteo_48h and stade_coef > 0.0:
-            jour_max_pluie = max(meteo_48h, key=lambda x: x.get('precipitation', 0) if x else -1)
-            if jour_max_pluie and jour_max_pluie.get('precipitation', 0) >= 2:
-                duree_humect = self.modele_ipi.estimer_duree_humectation(jour_max_pluie.get('precipitation'),
-                                                                         jour_max_pluie.get('humidite'))
-                if duree_humect > 0:
-                    ipi_value = self.modele_ipi.calculer_ipi(jour_max_pluie, duree_humect)
-                    if ipi_value >= 60:
-                        ipi_risque = "FORT"
-                    elif ipi_value >= 30:
-                        ipi_risque = "MOYEN"
-                    else:
-                        ipi_risque = "FAIBLE"
-
-                    if debug:
-                        print("\n🔍 MODE DEBUG - CALCUL IPI")
-                        print(f"Jour max pluie: {jour_max_pluie.get('precipitation'):.1f}mm")
-                        print(f"Température: {jour_max_pluie.get('temp_moy'):.1f}°C")
-                        print(f"Humidité: {jour_max_pluie.get('humidite', 0):.0f}%")
-                        print(f"Durée humectation: {duree_humect:.1f}h")
-                        print(f"→ IPI: {ipi_value}/100 ({ipi_risque})")
-                else:
-                    ipi_value = 0; ipi_risque = "FAIBLE (Humect. Nulle)"
-            else:
-                ipi_value = 0; ipi_risque = "FAIBLE (Pluie Insuff.)"
-        elif utiliser_ipi:
-            ipi_value = 0
-            ipi_risque = "NUL (Repos végétatif)"
+        ipi_value, ipi_risque = self._calculer_ipi(meteo_48h, stade_coef, utiliser_ipi, debug)
 
         # MODÈLE OÏDIUM
-        dates_7j = [(datetime.now() - timedelta(days=i)).strftime('%Y-%m-%d') for i in range(6, -1, -1)]
         meteo_7j = [meteo_historique_complet.get(d, {}) for d in dates_7j]
-        risque_oidium, niveau_oidium = self.modele_oidium.calculer_risque_infection(
-            meteo_7j, stade_coef
-        )
+        if dormance:
+            # Vigne en dormance : pas de risque oïdium, modèle non évalué
+            risque_oidium, niveau_oidium = 0.0, "FAIBLE"
+        else:
+            risque_oidium, niveau_oidium = self.modele_oidium.calculer_risque_infection(
+                meteo_7j, stade_coef
+            )
 
         if debug:
             print("\n🔍 MODE DEBUG - CALCUL OÏDIUM (7 jours)")
@@ -1368,24 +2227,17 @@ class SystemeDecision:
             print("-" * 50)
             print("Date       | T°Max | Humidité | Pluie | Score Jour")
             print("-" * 50)
+            releves_debug = [m for m in meteo_7j if m]
+            scores_debug = iter(ModeleOidium.scores_journaliers(releves_debug).tolist())
             score_total_debug = 0;
-            jours_comptes_debug = 0
+            jours_comptes_debug = len(releves_debug)
             for i, jour_meteo in enumerate(meteo_7j):
                 date_str = dates_7j[i]
                 if not jour_meteo: print(f"{date_str} | Données N/A"); continue
-                jours_comptes_debug += 1
                 temp_max = jour_meteo.get('temp_max', 0);
                 humid = jour_meteo.get('humidite', 0);
                 pluie = jour_meteo.get('precipitation', 0)
-                daily_score_debug = 0
-                if temp_max is not None and temp_max >= 33:
-                    daily_score_debug = -2
-                elif temp_max is not None and humid is not None and 20 <= temp_max <= 28 and humid >= 60:
-                    daily_score_debug = 3
-                elif temp_max is not None and humid is not None and 15 <= temp_max <= 30 and humid >= 50:
-                    daily_score_debug = 1
-                if pluie is not None and pluie >= 5: daily_score_debug -= 1
-                daily_score_debug = max(daily_score_debug, -2);
+                daily_score_debug = next(scores_debug)
                 score_total_debug += daily_score_debug
                 print(f"{date_str} | {temp_max:>5.1f}C | {humid:>6.0f}% | {pluie:>5.1f}mm | {daily_score_debug:>4}")
             print("-" * 50);
@@ -1399,9 +2251,12 @@ class SystemeDecision:
         # ======================================================================
         # --- BLOC : CALCUL GDD (DJC) (Utilise la persistance) ---
         # ======================================================================
-        gdd_actuel, stade_estime, prochain_stade_gdd, prochain_stade_nom, mode_calcul = self._calculer_gdd(
-            parcelle, self.meteo_historique, date_actuelle, stade_manuel
-        )
+        if precalcul and 'gdd' in precalcul:
+            gdd_actuel, stade_estime, prochain_stade_gdd, prochain_stade_nom, mode_calcul = precalcul['gdd']
+        else:
+            gdd_actuel, stade_estime, prochain_stade_gdd, prochain_stade_nom, mode_calcul = self._calculer_gdd(
+                parcelle, self.meteo_historique, date_actuelle, stade_manuel
+            )
 
         alerte_stade, _ = self._predire_stade_futur(
             self.meteo_historique, date_actuelle, gdd_actuel, prochain_stade_gdd, prochain_stade_nom, stade_manuel
@@ -1419,22 +2274,28 @@ class SystemeDecision:
         # ======================================================================
         # --- BLOC : BILAN HYDRIQUE (Utilise la persistance) ---
         # ======================================================================
-        rfu_max_mm = parcelle.get('rfu_max_mm', self.config.parametres.get('rfu_max_mm_default', 100.0))
-        kc_calendrier = self.config.parametres.get('kc_calendrier', {})
-        f_runoff = self.config.parametres.get('f_runoff', 0.1)
-        i_const_mm = self.config.parametres.get('i_const_mm', 1.0)
-
-        bilan_hydrique = self.modele_bilan_hydrique.calculer_bilan_rfu(
-            self.meteo_historique, parcelle, stade_manuel,
-            kc_calendrier, rfu_max_mm, f_runoff, i_const_mm,
-            gdd_cumul_actuel=gdd_actuel,
-            debug=debug  # Passe le flag debug
-        )
+        if precalcul and 'bilan_hydrique' in precalcul:
+            bilan_hydrique = precalcul['bilan_hydrique']
+        else:
+            rfu_max_mm = parcelle.get('rfu_max_mm', self.config.rfu_max_mm_default)
+            kc_calendrier = self.config.kc_calendrier
+            f_runoff = self.config.f_runoff
+            i_const_mm = self.config.i_const_mm
+
+            bilan_hydrique = self.modele_bilan_hydrique.calculer_bilan_rfu(
+                self.meteo_historique, parcelle, stade_manuel,
+                kc_calendrier, rfu_max_mm, f_runoff, i_const_mm,
+                gdd_cumul_actuel=gdd_actuel,
+                debug=debug,  # Passe le flag debug
+                dates_triees=self.config.get_dates_meteo_triees(self.meteo_historique),
+                kc_mois=self.config.kc_mois,
+                index_meteo=self.index_meteo
+            )
         # ======================================================================
 
         # PROTECTION ACTUELLE
         protection, dernier_trait, facteur_limitant = self.traitements.calculer_protection_actuelle(
-            nom_parcelle, date_actuelle, self.meteo_historique, stade_manuel
+            nom_parcelle, date_actuelle, self.meteo_historique, stade_manuel, index_meteo=self.index_meteo
         )
 
         if debug:
@@ -1445,40 +2306,13 @@ class SystemeDecision:
 
         # DÉCISION (Logique pivotée sur l'IPI + Protection)
         score_decision = risque_simple - protection
-        ipi_present = ipi_value if ipi_value is not None else 0
+        decision, urgence = self._decider(score_decision, ipi_value)
 
-        if score_decision <= 0:
-            decision = "Protection suffisante (Mildiou)"
-            urgence = "faible"
-        elif ipi_present >= self.SEUIL_IPI_HAUT and score_decision >= self.SEUIL_DECISION_HAUTE:
-            decision = "TRAITEMENT URGENT (Mildiou)"
-            urgence = "haute"
-        elif ipi_present >= self.SEUIL_IPI_MOYEN and score_decision >= self.SEUIL_DECISION_MOYENNE:
-            decision = "TRAITEMENT PRÉVENTIF (Mildiou)"
-            urgence = "moyenne"
-        elif ipi_present < 20 and score_decision < 2.0:
-            decision = "Pas de traitement Mildiou nécessaire"
-            urgence = "faible"
-        elif ipi_present > 0:
-            decision = "Surveillance : risque modéré (Mildiou)"
-            urgence = "faible"
-        else:
-            if score_decision >= self.SEUIL_DECISION_HAUTE:
-                decision = "Risque théorique élevé : surveiller remontée des températures (Mildiou)"
-                urgence = "moyenne"
-            else:
-                decision = "Pas de traitement Mildiou nécessaire"
-                urgence = "faible"
-
-        alerte_oidium = ""
-        if niveau_oidium == "FORT":
-            alerte_oidium = "⚠️ RISQUE OÏDIUM FORT - Vérifier protection"
-        elif niveau_oidium == "MOYEN":
-            alerte_oidium = "🔸 Risque Oïdium MOYEN - Surveillance"
+        alerte_oidium = self.ALERTES_OIDIUM.get(niveau_oidium, "")
 
         # PRÉVISIONS
-        dates_futures = sorted([d for d in self.meteo_historique.keys() if d > date_actuelle])[:3]
-        pluie_prevue = sum(self.meteo_historique.get(d, {}).get('precipitation', 0) for d in dates_futures)
+        dates_futures = self.index_meteo.dates_apres(date_actuelle, 3)
+        pluie_prevue = self.index_meteo.cumul_pluie_apres(date_actuelle, 3)
         alerte_preventive = ""
         if pluie_prevue > self.SEUIL_ALERTE_PLUIE and protection < self.SEUIL_PROTECTION_FAIBLE:
             alerte_preventive = f"⚠️  Pluie de {pluie_prevue:.1f}mm prévue - Traitement préventif Mildiou recommandé"
@@ -1525,9 +2359,10 @@ class SystemeDecision:
             }
         }
 
-        self.historique_analyses.append(
-            {'date': date_actuelle, 'parcelle': nom_parcelle, 'risque': risque_simple, 'protection': protection,
-             'decision_score': score_decision})
+        with self._verrou_historique:
+            self.historique_analyses.append(
+                (date_actuelle, nom_parcelle, risque_simple, protection, score_decision))
+            self._nb_analyses += 1
 
         if sauvegarder_historique:
             try:
@@ -1538,115 +2373,117 @@ class SystemeDecision:
         return analyse
 
     def afficher_rapport(self, analyse: Dict):
-        """Affiche un rapport formaté de l'analyse"""
-        print("\n" + "=" * 60)
-        print(f"   ANALYSE MILDIOU, OÏDIUM & HYDRIQUE - {analyse['parcelle']}")
-        print("=" * 60)
-        print(f"Date: {analyse['date_analyse']}")
-        print(f"Cépages: {', '.join(analyse['cepages'])}")
-        print(f"Stade phénologique (Manuel): {analyse['stade']}")
+        """Affiche un rapport formaté de l'analyse (assemblé puis écrit en une fois)"""
+        lignes = ["\n" + _SEPARATEUR_60,
+                  f"   ANALYSE MILDIOU, OÏDIUM & HYDRIQUE - {analyse['parcelle']}",
+                  _SEPARATEUR_60,
+                  f"Date: {analyse['date_analyse']}",
+                  f"Cépages: {', '.join(analyse['cepages'])}",
+                  f"Stade phénologique (Manuel): {analyse['stade']}"]
 
         gdd_info = analyse.get('gdd', {})
-        print(f"GDD Cumulés (base 10°C) : {gdd_info.get('cumul', 0):.0f} GDD")
-        print(f"   └── Mode de calcul : {gdd_info.get('mode_calcul', 'N/A')}")
-        print(f"Stade estimé (GDD) : {gdd_info.get('stade_estime', 'N/A')}")
+        lignes += [f"GDD Cumulés (base 10°C) : {gdd_info.get('cumul', 0):.0f} GDD",
+                   f"   └── Mode de calcul : {gdd_info.get('mode_calcul', 'N/A')}",
+                   f"Stade estimé (GDD) : {gdd_info.get('stade_estime', 'N/A')}"]
         if gdd_info.get('alerte_stade'):
-            print(f"   └── {gdd_info.get('alerte_stade')}")
+            lignes.append(f"   └── {gdd_info.get('alerte_stade')}")
 
-        print("-" * 60)
+        lignes.append(_TIRETS_60)
         meteo = analyse['meteo_actuelle']
-        print(f"\n🌡️  MÉTÉO ACTUELLE")
-        print(f"   Température: {meteo.get('temp_min', 'N/A')}°C - {meteo.get('temp_max', 'N/A')}°C")
-        print(f"   Précipitations: {meteo.get('precipitation', 0):.1f} mm")
-        print(f"   Humidité: {meteo.get('humidite', 'N/A'):.0f}%")
-        print(f"   ETP (Évap.) : {meteo.get('etp0', 'N/A'):.1f} mm")
+        lignes += [f"\n🌡️  MÉTÉO ACTUELLE",
+                   f"   Température: {meteo.get('temp_min', 'N/A')}°C - {meteo.get('temp_max', 'N/A')}°C",
+                   f"   Précipitations: {meteo.get('precipitation', 0):.1f} mm",
+                   f"   Humidité: {meteo.get('humidite', 'N/A'):.0f}%",
+                   f"   ETP (Évap.) : {meteo.get('etp0', 'N/A'):.1f} mm"]
 
         risque_m = analyse['risque_infection']
-        print(f"\n🦠 RISQUE MILDIOU: {risque_m['niveau']}")
-        print(f"   Score modèle simple: {risque_m['score']}/10")
+        lignes += [f"\n🦠 RISQUE MILDIOU: {risque_m['niveau']}",
+                   f"   Score modèle simple: {risque_m['score']}/10"]
         if risque_m['ipi'] is not None:
-            print(f"   IPI: {risque_m['ipi']}/100 ({risque_m['ipi_niveau']})")
+            lignes.append(f"   IPI: {risque_m['ipi']}/100 ({risque_m['ipi_niveau']})")
 
         risque_o = analyse.get('risque_oidium', {})
-        print(f"\n🍄 RISQUE OÏDIUM: {risque_o.get('niveau', 'N/A')}")
-        print(f"   Score modèle Oïdium: {risque_o.get('score', 0)}/10")
+        lignes += [f"\n🍄 RISQUE OÏDIUM: {risque_o.get('niveau', 'N/A')}",
+                   f"   Score modèle Oïdium: {risque_o.get('score', 0)}/10"]
 
         bilan_h = analyse.get('bilan_hydrique', {})
-        print(f"\n💧 BILAN HYDRIQUE: {bilan_h.get('niveau', 'N/A')}")
-        print(
-            f"   Réserve Utile (RFU) : {bilan_h.get('rfu_pct', 0)}% ({bilan_h.get('rfu_mm', 0)} / {bilan_h.get('rfu_max_mm', 0)} mm)")
-        print(f"   Indice de Stress (Ks) : {bilan_h.get('ks_actuel', 1.0)}")
+        lignes += [f"\n💧 BILAN HYDRIQUE: {bilan_h.get('niveau', 'N/A')}",
+                   f"   Réserve Utile (RFU) : {bilan_h.get('rfu_pct', 0)}% "
+                   f"({bilan_h.get('rfu_mm', 0)} / {bilan_h.get('rfu_max_mm', 0)} mm)",
+                   f"   Indice de Stress (Ks) : {bilan_h.get('ks_actuel', 1.0)}"]
 
         prot = analyse['protection_actuelle']
-        print(f"\n🛡️  PROTECTION ACTUELLE: {prot['score']}/10")
+        lignes.append(f"\n🛡️  PROTECTION ACTUELLE: {prot['score']}/10")
         if prot['dernier_traitement']:
             dt = prot['dernier_traitement']
-            print(f"   Dernier traitement: {dt['date']}")
-            print(f"   Produit: {dt['caracteristiques'].get('nom', 'N/A')}")
-            print(f"   Facteur limitant: {prot['facteur_limitant']}")
+            lignes += [f"   Dernier traitement: {dt['date']}",
+                       f"   Produit: {dt['caracteristiques'].get('nom', 'N/A')}",
+                       f"   Facteur limitant: {prot['facteur_limitant']}"]
         else:
-            print("   Aucun traitement enregistré.")
+            lignes.append("   Aucun traitement enregistré.")
 
         dec = analyse['decision']
-        print(f"\n{'=' * 60}")
-        print(f"➜  DÉCISION: {dec['action']}")
-        print(f"   Score décision (Mildiou): {dec['score']}/10")
+        lignes += [f"\n{_SEPARATEUR_60}",
+                   f"➜  DÉCISION: {dec['action']}",
+                   f"   Score décision (Mildiou): {dec['score']}/10"]
         if dec['alerte_preventive']:
-            print(f"\n   {dec['alerte_preventive']}")
+            lignes.append(f"\n   {dec['alerte_preventive']}")
         if dec['alerte_oidium']:
-            print(f"   {dec['alerte_oidium']}")
+            lignes.append(f"   {dec['alerte_oidium']}")
         if bilan_h.get('niveau') == "STRESS FORT":
-            print(f"   💧 ALERTE STRESS HYDRIQUE FORT ({bilan_h.get('rfu_pct')}%)")
-        print("=" * 60)
+            lignes.append(f"   💧 ALERTE STRESS HYDRIQUE FORT ({bilan_h.get('rfu_pct')}%)")
+        lignes.append(_SEPARATEUR_60)
         prev = analyse['previsions_3j']
-        print(f"\n📅 PRÉVISIONS 3 JOURS")
-        print(f"   Cumul pluie prévu: {prev['pluie_totale']} mm")
-        print()
+        lignes += [f"\n📅 PRÉVISIONS 3 JOURS",
+                   f"   Cumul pluie prévu: {prev['pluie_totale']} mm",
+                   ""]
+        print("\n".join(lignes))
 
     def generer_graphique_evolution(self, parcelle: str, nb_jours: int = 30,
                                     fichier_sortie: str = 'evolution_risque.png'):
-        if not GRAPHIQUES_DISPONIBLES:
+        if not _ensure_matplotlib():
             print("⚠️  matplotlib non installé. Graphiques non disponibles.")
             return
 
-        meteo_dict_daily = self.meteo_historique
-
-        dates, risques, protections = [], [], []
+        dates, dates_iso, risques = [], [], []
         date_fin = datetime.now()
 
-        parcelle_obj = next((p for p in self.config.parcelles if p['nom'] == parcelle), None)
+        parcelle_obj = self.config.get_parcelle(parcelle)
         if not parcelle_obj:
             print(f"❌ Parcelle {parcelle} non trouvée pour graphique.")
             return
 
-        for i in range(nb_jours, -1, -1):
-            date_dt = date_fin - timedelta(days=i)
-            date = date_dt.strftime('%Y-%m-%d')
+        sensibilite_moy = self.config.get_coefs_cepages(parcelle_obj['cepages'])[0]
+        stade_coef = self.config.COEF_STADES.get(parcelle_obj['stade_actuel'], 1.0)
 
-            if date not in meteo_dict_daily:
-                continue
-
-            dates.append(date_dt)
-
-            meteo_48h = []
-            for j in range(3):
-                d = (date_dt - timedelta(days=2 - j)).strftime('%Y-%m-%d')
-                if d in meteo_dict_daily: meteo_48h.append(meteo_dict_daily.get(d, {}))
+        # Colonnes journalières de J-(nb_jours+2) à J (NaN = jour absent), puis fenêtres glissantes de 3 jours :
+        # les jours sont parcourus par ordinal, seules les dates présentes dans l'historique sont converties
+        ordinal_fin = date_fin.toordinal()
+        lignes = self.index_meteo.lignes_jours(ordinal_fin - nb_jours - 2, nb_jours + 3)
+        colonnes = [self.index_meteo.colonne_lignes(champ, lignes) for champ in ('precip', 'temp_moy', 'humidite')]
+        risques_jour, _ = self.modele_simple.calculer_risque_infection_batch(
+            *(np.lib.stride_tricks.sliding_window_view(col, 3) for col in colonnes), stade_coef, sensibilite_moy
+        )
 
-            sensibilites = [self.config.SENSIBILITES_CEPAGES.get(c, 5) for c in parcelle_obj['cepages']]
-            sensibilite_moy = sum(sensibilites) / len(sensibilites)
-            stade_coef = self.config.COEF_STADES.get(parcelle_obj['stade_actuel'], 1.0)
-            risque, _ = self.modele_simple.calculer_risque_infection(meteo_48h, stade_coef, sensibilite_moy)
-            protection, _, _ = self.traitements.calculer_protection_actuelle(parcelle, date, meteo_dict_daily,
-                                                                             parcelle_obj['stade_actuel'])
+        for retard, ligne, risque in zip(range(nb_jours, -1, -1), lignes[2:].tolist(), risques_jour):
+            if ligne < 0:
+                continue
+            dates.append(date_fin - timedelta(days=retard))
+            dates_iso.append(str(self.index_meteo.dates[ligne]))
             risques.append(risque)
-            protections.append(protection)
+
+        protections = self.traitements.calculer_protection_serie(
+            parcelle, dates_iso, parcelle_obj['stade_actuel'], self.index_meteo
+        )
 
         if not dates:
             print("❌ Aucune donnée à tracer pour le graphique (vérifiez l'historique météo).")
             return
 
-        fig, ax = plt.subplots(figsize=(12, 6))
+        if self._figure_evolution is None:
+            self._figure_evolution = plt.subplots(figsize=(12, 6))
+        fig, ax = self._figure_evolution
+        ax.clear()
         ax.plot(dates, risques, 'r-', linewidth=2, label='Risque infection', marker='o')
         ax.plot(dates, protections, 'g-', linewidth=2, label='Protection', marker='s')
         ax.axhline(y=self.SEUIL_DECISION_HAUTE, color='orange', linestyle='--',
@@ -1660,20 +2497,36 @@ class SystemeDecision:
         ax.grid(True, alpha=0.3)
         ax.xaxis.set_major_formatter(mdates.DateFormatter('%d/%m'))
         ax.xaxis.set_major_locator(mdates.DayLocator(interval=max(1, nb_jours // 10)))
-        plt.xticks(rotation=45);
-        plt.tight_layout()
-        plt.savefig(fichier_sortie, dpi=150)
+        ax.tick_params(axis='x', labelrotation=45)
+        fig.tight_layout()
+        fig.savefig(fichier_sortie, dpi=150)
         print(f"✅ Graphique sauvegardé : {fichier_sortie}");
-        plt.close()
 
     def exporter_analyses_csv(self, fichier: str = 'historique_analyses.csv'):
+        """
+        Exporte les analyses en CSV. Un fichier déjà écrit par cette instance est complété
+        (mode ajout) avec les seules analyses réalisées depuis le dernier export.
+        """
         if not self.historique_analyses:
             print("⚠️  Aucune analyse à exporter");
             return
-        with open(fichier, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=['date', 'parcelle', 'risque', 'protection', 'decision_score'])
-            writer.writeheader();
-            writer.writerows(self.historique_analyses)
+        deja_exportees = self._analyses_exportees.get(fichier, 0) if os.path.exists(fichier) else 0
+        nouvelles = min(self._nb_analyses - deja_exportees, len(self.historique_analyses))
+        if deja_exportees and nouvelles <= 0:
+            print(f"✅ Historique déjà à jour : {fichier}")
+            return
+        lignes = list(self.historique_analyses)[-nouvelles:] if deja_exportees else self.historique_analyses
+        # Analyses sorties de la mémoire (au-delà de HISTORIQUE_ANALYSES_MAX) avant d'avoir été exportées
+        perdues = self._nb_analyses - deja_exportees - len(lignes)
+        with open(fichier, 'a' if deja_exportees else 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            if not deja_exportees:
+                writer.writerow(self.CHAMPS_EXPORT_CSV)
+            writer.writerows(lignes)
+        self._analyses_exportees[fichier] = self._nb_analyses
+        if perdues > 0:
+            print(f"⚠️  {perdues} analyse(s) plus ancienne(s) non exportée(s) : seules les "
+                  f"{self.HISTORIQUE_ANALYSES_MAX} dernières sont gardées en mémoire. Exportez plus souvent.")
         print(f"✅ Historique exporté : {fichier}")
 
     def generer_synthese_annuelle(self, annee: int, fichier_sortie: str = None):
@@ -1681,59 +2534,64 @@ class SystemeDecision:
         date_debut = f"{annee}-01-01";
         date_fin = f"{annee}-12-31"
         ift = self.traitements.calculer_ift_periode(date_debut, date_fin, self.config.surface_totale)
+        # Traitements de l'année comptés par parcelle en un passage sur le détail IFT (même période)
+        nb_par_parcelle = defaultdict(int)
+        for detail in ift['details']:
+            nb_par_parcelle[detail['parcelle']] += 1
         stats_parcelles = {}
         for parcelle in self.config.parcelles:
-            traitements_parcelle = [t for t in self.traitements.historique['traitements'] if
-                                    t['parcelle'] == parcelle['nom'] and date_debut <= t['date'] <= date_fin]
-            stats_parcelles[parcelle['nom']] = {'nb_traitements': len(traitements_parcelle),
+            stats_parcelles[parcelle['nom']] = {'nb_traitements': nb_par_parcelle[parcelle['nom']],
                                                 'surface_ha': parcelle['surface_ha'], 'cepages': parcelle['cepages']}
+
+        # Le rapport est assemblé en mémoire puis écrit en une fois
+        separateur = "=" * 70
+        tirets = "-" * 70
+        lignes = [
+            separateur,
+            f"   SYNTHÈSE ANNUELLE MILDIOU - {annee}",
+            f"   {self.config.config_key.upper()}",
+            separateur + "\n",
+            f"📊 DONNÉES GÉNÉRALES",
+            f"   Surface totale : {self.config.surface_totale} ha",
+            f"   Nombre de parcelles : {len(self.config.parcelles)}",
+            f"   Période d'analyse : {date_debut} au {date_fin}\n",
+            f"💊 BILAN TRAITEMENTS",
+            f"   Nombre total de traitements : {ift['nb_traitements']}",
+            f"   IFT total : {ift['ift_total']}",
+            f"   IFT moyen par hectare : {ift['ift_total'] / self.config.surface_totale:.2f}\n",
+            f"📋 DÉTAIL PAR PARCELLE",
+            tirets,
+        ]
+        for nom, stats in stats_parcelles.items():
+            lignes += [f"\n🍇 {nom}",
+                       f"   Surface : {stats['surface_ha']} ha",
+                       f"   Cépages : {', '.join(stats['cepages'])}",
+                       f"   Traitements : {stats['nb_traitements']}",
+                       f"   IFT estimé : {stats['nb_traitements']}"]
+        lignes += ["\n" + tirets, f"📅 HISTORIQUE DES TRAITEMENTS", tirets]
+        for detail in ift['details']:
+            lignes += [f"\n{detail['date']} - {detail['parcelle']}",
+                       f"   Produit : {detail['produit']}",
+                       f"   IFT : {detail['ift']}"]
+        lignes += ["\n" + separateur, f"💡 RECOMMANDATIONS", separateur]
+        if ift['ift_total'] > 15:
+            lignes += ["⚠️  IFT élevé : Envisager des stratégies de réduction",
+                       "   - Optimiser le positionnement des traitements",
+                       "   - Privilégier les produits longue rémanence",
+                       "   - Évaluer les cépages résistants"]
+        elif ift['ift_total'] < 8:
+            lignes.append("✅ IFT maîtrisé : Bonne gestion phytosanitaire")
+        else:
+            lignes.append("✓  IFT dans la moyenne nationale")
+        lignes += ["\n" + separateur,
+                   f"Rapport généré le {datetime.now().strftime('%d/%m/%Y à %H:%M')}",
+                   separateur]
+        contenu = "\n".join(lignes) + "\n"
+
         with open(fichier_sortie, 'w', encoding='utf-8') as f:
-            f.write("=" * 70 + "\n");
-            f.write(f"   SYNTHÈSE ANNUELLE MILDIOU - {annee}\n");
-            f.write(f"   {self.config.config_file.replace('.json', '').upper()}\n");
-            f.write("=" * 70 + "\n\n")
-            f.write(f"📊 DONNÉES GÉNÉRALES\n");
-            f.write(f"   Surface totale : {self.config.surface_totale} ha\n");
-            f.write(f"   Nombre de parcelles : {len(self.config.parcelles)}\n");
-            f.write(f"   Période d'analyse : {date_debut} au {date_fin}\n\n")
-            f.write(f"💊 BILAN TRAITEMENTS\n");
-            f.write(f"   Nombre total de traitements : {ift['nb_traitements']}\n");
-            f.write(f"   IFT total : {ift['ift_total']}\n");
-            f.write(f"   IFT moyen par hectare : {ift['ift_total'] / self.config.surface_totale:.2f}\n\n")
-            f.write(f"📋 DÉTAIL PAR PARCELLE\n");
-            f.write("-" * 70 + "\n")
-            for nom, stats in stats_parcelles.items():
-                f.write(f"\n🍇 {nom}\n");
-                f.write(f"   Surface : {stats['surface_ha']} ha\n");
-                f.write(f"   Cépages : {', '.join(stats['cepages'])}\n");
-                f.write(f"   Traitements : {stats['nb_traitements']}\n");
-                ift_parcelle = stats['nb_traitements'];
-                f.write(f"   IFT estimé : {ift_parcelle}\n")
-            f.write("\n" + "-" * 70 + "\n");
-            f.write(f"📅 HISTORIQUE DES TRAITEMENTS\n");
-            f.write("-" * 70 + "\n")
-            for detail in ift['details']:
-                f.write(f"\n{detail['date']} - {detail['parcelle']}\n");
-                f.write(f"   Produit : {detail['produit']}\n");
-                f.write(f"   IFT : {detail['ift']}\n")
-            f.write("\n" + "=" * 70 + "\n");
-            f.write(f"💡 RECOMMANDATIONS\n");
-            f.write("=" * 70 + "\n")
-            if ift['ift_total'] > 15:
-                f.write("⚠️  IFT élevé : Envisager des stratégies de réduction\n");
-                f.write("   - Optimiser le positionnement des traitements\n");
-                f.write("   - Privilégier les produits longue rémanence\n");
-                f.write("   - Évaluer les cépages résistants\n")
-            elif ift['ift_total'] < 8:
-                f.write("✅ IFT maîtrisé : Bonne gestion phytosanitaire\n")
-            else:
-                f.write("✓  IFT dans la moyenne nationale\n")
-            f.write("\n" + "=" * 70 + "\n");
-            f.write(f"Rapport généré le {datetime.now().strftime('%d/%m/%Y à %H:%M')}\n");
-            f.write("=" * 70 + "\n")
+            f.write(contenu)
         print(f"✅ Synthèse annuelle générée : {fichier_sortie}")
-        with open(fichier_sortie, 'r', encoding='utf-8') as f:
-            print("\n" + f.read())
+        print("\n" + contenu)
 
 
 def menu_maj_stade_et_date(systeme):
@@ -1847,7 +2705,7 @@ def menu_principal():
             except (ValueError, IndexError):
                 print("❌ Entrée invalide")
         elif choix == '4':
-            if not GRAPHIQUES_DISPONIBLES: print("\n❌ matplotlib non installé"); print(
+            if not _ensure_matplotlib(): print("\n❌ matplotlib non installé"); print(
                 "   Installation : pip install matplotlib"); continue
             print("\n📈 GÉNÉRATION DE GRAPHIQUE");
             print("-" * 70);
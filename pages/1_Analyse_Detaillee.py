@@ -85,11 +85,13 @@ def init_systeme_v2():
 
 try:
     systeme = init_systeme_v2()
+    # Traitements relus si le stockage a changé (ajout / suppression depuis une autre page)
+    systeme.traitements.rafraichir_historique()
 
     # Sidebar
     with st.sidebar:
         st.subheader("📍 Sélection Parcelle")
-        parcelle_names = [p['nom'] for p in systeme.config.parcelles]
+        parcelle_names = systeme.config.noms_parcelles()
         parcelle_selectionnee = st.selectbox(
             "Choisir une parcelle",
             parcelle_names,
@@ -141,7 +143,7 @@ try:
         # --- TAB 1 : Synthèse (MODIFIÉ AVEC OÏDIUM ET GDD) ---
         # ==============================================================================
         with tab1:
-            parcelle_obj = next(p for p in systeme.config.parcelles if p['nom'] == parcelle_selectionnee)
+            parcelle_obj = systeme.config.get_parcelle(parcelle_selectionnee)
             col_info1, col_info2, col_info3 = st.columns(3)
             with col_info1:
                 st.markdown("### 📍 Parcelle")
@@ -8,9 +8,10 @@ Fichier : pages/2_Gestion_Traitements.py
 import streamlit as st
 import sys
 import os
+import json
+import hashlib
 from datetime import datetime, timedelta
 import pandas as pd
-import io
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from mildiou_prevention import SystemeDecision
@@ -24,46 +25,116 @@ st.title("💊 Gestion des Traitements & Registre")
 def init_systeme_v2():
     return SystemeDecision()
 
-def get_parcel_surface(systeme, parcel_name):
-    for p in systeme.config.parcelles:
-        if p['nom'] == parcel_name:
-            return p.get('surface_ha', 0.0)
-    return 0.0
-
-try:
-    systeme = init_systeme_v2()
-    # Forcer le rafraîchissement des produits
-    if hasattr(systeme.traitements, 'charger_produits'):
-        systeme.traitements.FONGICIDES = systeme.traitements.charger_produits()
-
-    # Gérer la navigation par onglets via session_state pour éviter les resets
-    tab_titles = ["➕ Ajouter un Traitement", "📋 Registre & Historique", "📊 Statistiques"]
-    if "active_tab_traitements" not in st.session_state:
-        st.session_state.active_tab_traitements = tab_titles[0]
-
-    selected_tab = st.radio("Navigation", tab_titles, index=tab_titles.index(st.session_state.active_tab_traitements), horizontal=True, label_visibility="collapsed")
-    st.session_state.active_tab_traitements = selected_tab
-
-    st.markdown("---")
-
-    # TAB 1 : Ajouter traitement
-    if selected_tab == tab_titles[0]:
-        st.subheader("Enregistrer un Nouveau Traitement (Données Légales)")
-
-        col_form1, col_form2 = st.columns([2, 1])
-
-        with col_form1:
-            # Sélection parcelle
-            parcelle_names = [p['nom'] for p in systeme.config.parcelles]
-            parcelle = st.selectbox(
-                "📍 Parcelle *",
-                parcelle_names,
-                help="Sélectionnez la parcelle traitée",
-                key="select_parcelle"
-            )
-
-            p_surface = get_parcel_surface(systeme, parcelle)
+# Versions du registre (et de ses exports) gardées en cache
+REGISTRE_VERSIONS_MAX = 8
+
+def empreinte_registre(traitements):
+    """Clé de cache du registre : empreinte du contenu complet des traitements (ajout, suppression ou modification)"""
+    contenu = json.dumps(traitements, ensure_ascii=False, default=str).encode('utf-8')
+    return hashlib.blake2b(contenu, digest_size=16).hexdigest()
+
+@st.cache_data(show_spinner=False, max_entries=REGISTRE_VERSIONS_MAX)
+def construire_registre_df(empreinte, _traitements):
+    """Tableau du registre (format officiel), trié par date décroissante ; recalculé si l'empreinte change"""
+    df_raw = pd.DataFrame(_traitements)
+    caracs = df_raw['caracteristiques'] if 'caracteristiques' in df_raw else pd.Series([{}] * len(df_raw))
+    carac = pd.json_normalize([c if isinstance(c, dict) else {} for c in caracs])
+
+    def colonne(df, nom, defaut):
+        """Colonne optionnelle : valeur par défaut (scalaire ou série) là où la clé est absente"""
+        if nom in df:
+            return df[nom].fillna(defaut)
+        return defaut if isinstance(defaut, pd.Series) else pd.Series(defaut, index=df_raw.index)
+
+    df_final = pd.DataFrame({
+        'Parcelle': df_raw['parcelle'],
+        'Culture': colonne(df_raw, 'culture', 'Vigne'),
+        'Système': colonne(df_raw, 'systeme_culture', 'PC'),
+        'Produit': colonne(carac, 'nom', df_raw['produit']),
+        'N° AMM': colonne(carac, 'n_amm', 'N/A'),
+        'Date': df_raw['date'],
+        'Heure': colonne(df_raw, 'heure', '10:00'),
+        'Quantité/ha': colonne(df_raw, 'dose_kg_ha', 0),
+        'Mouillage %': colonne(df_raw, 'mouillage_pct', 100),
+        'Surface (ha)': colonne(df_raw, 'surface_traitee', 0),
+        'Type': colonne(df_raw, 'type_utilisation', 'Plein champ'),
+        'Cible': colonne(df_raw, 'cible', 'Mildiou'),
+        'Météo': colonne(df_raw, 'conditions_meteo', ''),
+        'Applicateur': colonne(df_raw, 'applicateur', '')
+    })
+    # Libellés répétés d'une ligne à l'autre : stockés en catégories (codes entiers)
+    for c in ('Parcelle', 'Culture', 'Système', 'Produit', 'Type', 'Cible', 'Applicateur'):
+        df_final[c] = df_final[c].astype('category')
+    return df_final.sort_values(by='Date', ascending=False, kind='stable', ignore_index=True)
+
+@st.cache_data(show_spinner=False, max_entries=REGISTRE_VERSIONS_MAX)
+def exporter_registre(empreinte, _df_final):
+    """Octets des exports Excel et CSV du registre ; générés une fois par empreinte"""
+    # Imports propres à l'export : seul l'onglet Registre les charge
+    import io
+    try:
+        import xlsxwriter  # noqa: F401
+        # Mode constant_memory : les lignes sont écrites au fil de l'eau
+        engine, engine_kwargs = 'xlsxwriter', {'options': {'constant_memory': True}}
+    except ImportError:
+        engine, engine_kwargs = 'openpyxl', {}
+
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine=engine, engine_kwargs=engine_kwargs) as writer:
+        _df_final.to_excel(writer, index=False, sheet_name='Registre_Phyto')
+    return output.getvalue(), _df_final.to_csv(index=False).encode('utf-8')
+
+@st.cache_data(ttl=300, show_spinner=False)
+def ift_annee(annee, surface_totale, empreinte, _systeme):
+    """IFT d'une année, mis en cache par (année, surface, empreinte du registre)"""
+    return _systeme.traitements.calculer_ift_periode(f"{annee}-01-01", f"{annee}-12-31", surface_totale)
 
+def get_parcel_surface(systeme, parcel_name):
+    # Recherche par l'index nom -> parcelle de la configuration (pas de parcours de la liste)
+    p = systeme.config.get_parcelle(parcel_name)
+    return p.get('surface_ha', 0.0) if p else 0.0
+
+@st.fragment
+def _tab_ajout(systeme):
+    """Onglet ajout : les saisies ne relancent que ce fragment"""
+    st.subheader("Enregistrer un Nouveau Traitement (Données Légales)")
+
+    col_form1, col_form2 = st.columns([2, 1])
+
+    with col_form1:
+        # Sélection parcelle
+        parcelle_names = systeme.config.noms_parcelles()
+        parcelle = st.selectbox(
+            "📍 Parcelle *",
+            parcelle_names,
+            help="Sélectionnez la parcelle traitée",
+            key="select_parcelle"
+        )
+
+        p_surface = get_parcel_surface(systeme, parcelle)
+
+        # Produit
+        produits_dict = systeme.traitements.FONGICIDES
+        # Produits phytosanitaires uniquement (listes gardées tant que le catalogue n'est pas rechargé)
+        phyto_ids, produits_noms = systeme.traitements.get_produits_phyto()
+
+        if not phyto_ids:
+            st.warning("⚠️ Aucun produit phytosanitaire trouvé. Allez dans 'Paramètres' pour en ajouter.")
+
+        produit_selectionne = st.selectbox(
+            "💊 Produit *",
+            produits_noms,
+            key="select_produit"
+        )
+
+        produit_key = phyto_ids[produits_noms.index(produit_selectionne)] if phyto_ids else None
+        produit_info = produits_dict[produit_key] if produit_key else {}
+
+        st.info(f"**N° AMM :** {produit_info.get('n_amm', 'N/A')} | **Type :** {produit_info.get('type', 'N/A')} | **Dose réf :** {produit_info.get('dose_reference_kg_ha', 0)} kg/ha")
+
+        # Parcelle et produit restent hors du formulaire (ils fixent la surface et la dose par défaut) ;
+        # les autres champs ne relancent la page qu'à l'envoi du formulaire
+        with st.form("ajout_traitement", clear_on_submit=True):
             col1, col2 = st.columns(2)
             with col1:
                 date_traitement = st.date_input(
@@ -79,28 +150,6 @@ try:
                     key="heure_trait"
                 )
 
-            # Produit
-            produits_dict = systeme.traitements.FONGICIDES
-            # Filtrer pour n'afficher que les produits phytosanitaires
-            phyto_ids = [k for k, v in produits_dict.items() if v.get('type') in ["contact", "penetrant", "systemique", "autre"]]
-
-            if not phyto_ids:
-                st.warning("⚠️ Aucun produit phytosanitaire trouvé. Allez dans 'Paramètres' pour en ajouter.")
-                produits_noms = []
-            else:
-                produits_noms = [produits_dict[p]['nom'] for p in phyto_ids]
-
-            produit_selectionne = st.selectbox(
-                "💊 Produit *",
-                produits_noms,
-                key="select_produit"
-            )
-
-            produit_key = phyto_ids[produits_noms.index(produit_selectionne)] if phyto_ids else None
-            produit_info = produits_dict[produit_key] if produit_key else {}
-
-            st.info(f"**N° AMM :** {produit_info.get('n_amm', 'N/A')} | **Type :** {produit_info.get('type', 'N/A')} | **Dose réf :** {produit_info.get('dose_reference_kg_ha', 0)} kg/ha")
-
             col3, col4 = st.columns(2)
             with col3:
                 # Utiliser la dose de référence par défaut
@@ -144,150 +193,155 @@ try:
                     meteo_cond = st.text_area("☁️ Conditions climatiques", placeholder="Ex: 18°C, Vent faible < 10km/h, Humidité 60%", height=68)
 
             # Bouton soumission
-            if st.button("✅ Enregistrer au Registre", type="primary", use_container_width=True):
-                try:
-                    systeme.traitements.ajouter_traitement(
-                        parcelle=parcelle,
-                        date=date_traitement.strftime('%Y-%m-%d'),
-                        produit=produit_key,
-                        dose_kg_ha=dose,
-                        heure=heure_traitement.strftime('%H:%M'),
-                        mouillage_pct=mouillage,
-                        surface_traitee=surface_t,
-                        type_utilisation=type_u,
-                        cible=cible,
-                        conditions_meteo=meteo_cond,
-                        applicateur=applicateur,
-                        systeme_culture=sys_culture.split(' ')[0],
-                        culture=culture
-                    )
+            submitted = st.form_submit_button("✅ Enregistrer au Registre", type="primary", use_container_width=True)
+
+        if submitted:
+            try:
+                systeme.traitements.ajouter_traitement(
+                    parcelle=parcelle,
+                    date=date_traitement.strftime('%Y-%m-%d'),
+                    produit=produit_key,
+                    dose_kg_ha=dose,
+                    heure=heure_traitement.strftime('%H:%M'),
+                    mouillage_pct=mouillage,
+                    surface_traitee=surface_t,
+                    type_utilisation=type_u,
+                    cible=cible,
+                    conditions_meteo=meteo_cond,
+                    applicateur=applicateur,
+                    systeme_culture=sys_culture.split(' ')[0],
+                    culture=culture
+                )
 
+                # Le système en cache est déjà à jour (historique sauvegardé et réindexé) : on ne vide
+                # que les caches de la page ; registre et exports suivent l'empreinte des traitements
+                ift_annee.clear()
+                if systeme.traitements.storage.flush():
                     st.success(f"✅ Traitement enregistré pour {parcelle}")
-                    st.cache_resource.clear()
                     st.rerun()
 
-                except Exception as e:
-                    st.error(f"❌ Erreur : {str(e)}")
-
-        with col_form2:
-            st.subheader("📋 Rappel Légal")
-            st.warning("""
-            Le **Registre Phytosanitaire** est obligatoire.
-            Toutes les colonnes marquées d'un * doivent être renseignées.
-            """)
-            st.info("""
-            **Données conservées :**
-            - Nom de parcelle & Culture
-            - Produit & N° AMM
-            - Date & Heure
-            - Dose & Surface
-            - Conditions & Applicateur
-            """)
-
-    # TAB 2 : Registre & Historique
-    elif selected_tab == tab_titles[1]:
-        st.subheader("📋 Registre Phytosanitaire Officiel")
-
-        traitements = systeme.traitements.historique.get('traitements', [])
-
-        if traitements:
-            df_full = pd.DataFrame(traitements)
-
-            # Formater pour affichage
-            df_display = []
-            for t in traitements:
-                carac = t.get('caracteristiques', {})
-                df_display.append({
-                    'Parcelle': t['parcelle'],
-                    'Culture': t.get('culture', 'Vigne'),
-                    'Système': t.get('systeme_culture', 'PC'),
-                    'Produit': carac.get('nom', t['produit']),
-                    'N° AMM': carac.get('n_amm', 'N/A'),
-                    'Date': t['date'],
-                    'Heure': t.get('heure', '10:00'),
-                    'Quantité/ha': t.get('dose_kg_ha', 0),
-                    'Mouillage %': t.get('mouillage_pct', 100),
-                    'Surface (ha)': t.get('surface_traitee', 0),
-                    'Type': t.get('type_utilisation', 'Plein champ'),
-                    'Cible': t.get('cible', 'Mildiou'),
-                    'Météo': t.get('conditions_meteo', ''),
-                    'Applicateur': t.get('applicateur', '')
-                })
-
-            df_final = pd.DataFrame(df_display)
-            df_final = df_final.sort_values(by='Date', ascending=False)
-
-            st.dataframe(df_final, use_container_width=True, hide_index=True)
-
-            # --- SUPPRESSION / MODIFICATION ---
-            st.markdown("---")
-            with st.expander("🗑️ Supprimer un traitement"):
-                options_suppr = [f"{t['date']} - {t['parcelle']} - {t.get('caracteristiques', {}).get('nom', t['produit'])}" for t in traitements]
-                trait_to_del_str = st.selectbox("Sélectionner le traitement à supprimer", options=options_suppr)
-
-                if st.button("Confirmer la suppression", type="secondary"):
-                    idx_to_del = options_suppr.index(trait_to_del_str)
-                    systeme.traitements.historique['traitements'].pop(idx_to_del)
-                    systeme.traitements.sauvegarder_historique()
+            except Exception as e:
+                st.error(f"❌ Erreur : {str(e)}")
+
+    with col_form2:
+        st.subheader("📋 Rappel Légal")
+        st.warning("""
+        Le **Registre Phytosanitaire** est obligatoire.
+        Toutes les colonnes marquées d'un * doivent être renseignées.
+        """)
+        st.info("""
+        **Données conservées :**
+        - Nom de parcelle & Culture
+        - Produit & N° AMM
+        - Date & Heure
+        - Dose & Surface
+        - Conditions & Applicateur
+        """)
+
+@st.fragment
+def _tab_registre(systeme):
+    """Onglet registre : tableau, suppression et exports"""
+    st.subheader("📋 Registre Phytosanitaire Officiel")
+
+    traitements = systeme.traitements.historique.get('traitements', [])
+
+    if traitements:
+        # Tableau et exports mis en cache : pas de reconstruction à chaque rerun de la page
+        empreinte = empreinte_registre(traitements)
+        df_final = construire_registre_df(empreinte, traitements)
+
+        st.dataframe(df_final, use_container_width=True, hide_index=True)
+
+        # --- SUPPRESSION / MODIFICATION ---
+        st.markdown("---")
+        with st.expander("🗑️ Supprimer un traitement"):
+            options_suppr = [f"{t['date']} - {t['parcelle']} - {t.get('caracteristiques', {}).get('nom', t['produit'])}" for t in traitements]
+            trait_to_del_str = st.selectbox("Sélectionner le traitement à supprimer", options=options_suppr)
+
+            if st.button("Confirmer la suppression", type="secondary"):
+                idx_to_del = options_suppr.index(trait_to_del_str)
+                systeme.traitements.historique['traitements'].pop(idx_to_del)
+                systeme.traitements.sauvegarder_historique()
+                ift_annee.clear()
+                if systeme.traitements.storage.flush():
                     st.success("✅ Traitement supprimé.")
-                    st.cache_resource.clear()
                     st.rerun()
 
-            # Export EXCEL (Format Officiel)
-            st.markdown("---")
+        # Export EXCEL (Format Officiel)
+        st.markdown("---")
+
+        col_ex1, col_ex2 = st.columns([1, 1])
+        with col_ex1:
+            xlsx_bytes, csv = exporter_registre(empreinte, df_final)
+            st.download_button(
+                label="📂 Télécharger Registre Phytosanitaire (Excel)",
+                data=xlsx_bytes,
+                file_name=f"Registre_Phytosanitaire_{datetime.now().year}.xlsx",
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            )
 
-            col_ex1, col_ex2 = st.columns([1, 1])
-            with col_ex1:
-                # Bouton pour générer l'Excel
-                output = io.BytesIO()
-                with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                    df_final.to_excel(writer, index=False, sheet_name='Registre_Phyto')
-                    # On pourrait ajouter du style ici avec openpyxl si besoin
-
-                st.download_button(
-                    label="📂 Télécharger Registre Phytosanitaire (Excel)",
-                    data=output.getvalue(),
-                    file_name=f"Registre_Phytosanitaire_{datetime.now().year}.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                )
+        with col_ex2:
+             st.download_button(
+                label="📥 Télécharger en CSV",
+                data=csv,
+                file_name=f"traitements_{datetime.now().strftime('%Y%m%d')}.csv",
+                mime="text/csv"
+            )
 
-            with col_ex2:
-                 csv = df_final.to_csv(index=False).encode('utf-8')
-                 st.download_button(
-                    label="📥 Télécharger en CSV",
-                    data=csv,
-                    file_name=f"traitements_{datetime.now().strftime('%Y%m%d')}.csv",
-                    mime="text/csv"
-                )
+    else:
+        st.info("📝 Aucun traitement enregistré")
+
+@st.fragment
+def _tab_statistiques(systeme):
+    """Onglet statistiques : le choix de l'année ne relance que ce fragment"""
+    st.subheader("📊 Statistiques & IFT")
+    # Garder la logique de stats existante (simplifiée ici pour la démo)
+    traitements = systeme.traitements.historique.get('traitements', [])
+    if traitements:
+        annee = st.selectbox("Année de référence", list(range(datetime.now().year, 2020, -1)))
+        # Traitements de l'année comptés par calculer_ift_periode sur l'index trié par date (bisect)
+        ift = ift_annee(annee, systeme.config.surface_totale, empreinte_registre(traitements), systeme)
+
+        if ift['nb_traitements']:
+            col_s1, col_s2, col_s3 = st.columns(3)
+            col_s1.metric("Traitements", ift['nb_traitements'])
+            col_s2.metric("IFT Annuel Total", f"{ift['ift_total']:.2f}")
+            col_s3.metric("IFT moyen / ha", f"{ift['ift_total']/systeme.config.surface_totale:.2f}")
 
+            st.markdown("---")
+            st.subheader("Détail des calculs IFT")
+            st.dataframe(pd.DataFrame(ift['details']), use_container_width=True, hide_index=True)
         else:
-            st.info("📝 Aucun traitement enregistré")
+            st.info(f"Aucune donnée pour l'année {annee}")
+
+try:
+    systeme = init_systeme_v2()
+    # Traitements relus si le stockage a changé (ajout / suppression depuis une autre page)
+    systeme.traitements.rafraichir_historique()
+    # Forcer le rafraîchissement des produits
+    if hasattr(systeme.traitements, 'rafraichir_produits'):
+        systeme.traitements.rafraichir_produits()
 
-    # TAB 3 : Statistiques
+    # Gérer la navigation par onglets via session_state pour éviter les resets
+    tab_titles = ["➕ Ajouter un Traitement", "📋 Registre & Historique", "📊 Statistiques"]
+    if "active_tab_traitements" not in st.session_state:
+        st.session_state.active_tab_traitements = tab_titles[0]
+
+    selected_tab = st.radio("Navigation", tab_titles, index=tab_titles.index(st.session_state.active_tab_traitements), horizontal=True, label_visibility="collapsed")
+    st.session_state.active_tab_traitements = selected_tab
+
+    st.markdown("---")
+
+    # Chaque onglet est un fragment : ses widgets ne relancent que l'onglet affiché
+    if selected_tab == tab_titles[0]:
+        _tab_ajout(systeme)
+    elif selected_tab == tab_titles[1]:
+        _tab_registre(systeme)
     elif selected_tab == tab_titles[2]:
-        st.subheader("📊 Statistiques & IFT")
-        # Garder la logique de stats existante (simplifiée ici pour la démo)
-        traitements = systeme.traitements.historique.get('traitements', [])
-        if traitements:
-            annee = st.selectbox("Année de référence", list(range(datetime.now().year, 2020, -1)))
-            date_debut = f"{annee}-01-01"
-            date_fin = f"{annee}-12-31"
-
-            traitements_annee = [t for t in traitements if date_debut <= t['date'] <= date_fin]
-
-            if traitements_annee:
-                ift = systeme.traitements.calculer_ift_periode(date_debut, date_fin, systeme.config.surface_totale)
-
-                col_s1, col_s2, col_s3 = st.columns(3)
-                col_s1.metric("Traitements", len(traitements_annee))
-                col_s2.metric("IFT Annuel Total", f"{ift['ift_total']:.2f}")
-                col_s3.metric("IFT moyen / ha", f"{ift['ift_total']/systeme.config.surface_totale:.2f}")
-
-                st.markdown("---")
-                st.subheader("Détail des calculs IFT")
-                st.dataframe(pd.DataFrame(ift['details']), use_container_width=True, hide_index=True)
-            else:
-                st.info(f"Aucune donnée pour l'année {annee}")
+        _tab_statistiques(systeme)
+
+    # Écritures Google Sheets de ce rerun : attendre leur fin et signaler les échecs
+    systeme.traitements.storage.flush()
 
 except Exception as e:
     st.error(f"❌ Erreur : {str(e)}")
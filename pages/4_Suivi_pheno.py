@@ -4,9 +4,11 @@ import ee
 import geopandas as gpd
 import datetime
 import pandas as pd
+import numpy as np
 import json
 import sys
 import os
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Tuple
 import plotly.graph_objects as go
 try:
@@ -49,6 +51,9 @@ REFERENCE_TABLE = {
 # ⚠️ REMPLACER CECI par votre ID de projet Google Cloud/Earth Engine
 EE_PROJECT_ID = 'phenologie-477519'  # Mettez votre ID de projet ici
 
+# Extraction découpée par mois : nombre maximal de requêtes Earth Engine simultanées
+EXTRACTION_THREADS_MAX = 6
+
 
 if "ee_initialized" not in st.session_state:
     try:
@@ -79,41 +84,38 @@ if "ee_initialized" not in st.session_state:
         st.stop()
 
 
+# Table de référence en DataFrame, construite une fois : point de départ au 1er janvier (valeurs de janvier)
+# puis une ligne au 15 de chaque mois ; seules les dates dépendent de l'année
+_REF_MOIS = [1] + list(range(1, 13))
+_REF_JOURS = [1] + [15] * 12
+_REF_DF = pd.DataFrame.from_dict(REFERENCE_TABLE, orient='index').loc[_REF_MOIS]
+
+
 @st.cache_data
 def get_reference_df(year=2025):
     """Crée un DataFrame de référence pour l'année, avec une date au 15 de chaque mois."""
-
-    # --- CORRECTION ICI ---
-    # Remplacer datetime.date par pd.Timestamp pour correspondre au type
-    # des données satellite (pd.to_datetime)
-    dates = [pd.Timestamp(year, month, 15) for month in range(1, 13)]
-    data = [REFERENCE_TABLE[month] for month in range(1, 13)]
-    df = pd.DataFrame(data, index=dates)
-
-    # --- CORRECTION ICI AUSSI ---
-    # Assurer que le point de départ utilise aussi pd.Timestamp
-    df_start = pd.DataFrame([REFERENCE_TABLE[1]], index=[pd.Timestamp(year, 1, 1)])
-
-    df = pd.concat([df_start, df])
+    # pd.Timestamp pour correspondre au type des données satellite (pd.to_datetime)
+    df = _REF_DF.copy()
+    df.index = pd.DatetimeIndex([pd.Timestamp(year, m, j) for m, j in zip(_REF_MOIS, _REF_JOURS)])
     return df
 
 
 @st.cache_data
-def load_and_prepare_data():
-    """Charge le GeoJSON local et fusionne avec les données de ConfigVignoble."""
+def _load_gdf():
+    """Charge le GeoJSON local et fusionne avec les données de ConfigVignoble (données sérialisables)."""
     try:
         config = ConfigVignoble()
         df_config = pd.DataFrame(config.parcelles)
     except Exception as e:
         st.error(f"Erreur de chargement ConfigVignoble : {e}")
-        return None, None, None
+        return None
 
     current_dir = os.path.dirname(os.path.abspath(__file__))
     geojson_path = os.path.join(current_dir, '..', 'map.geojson')
 
     if not os.path.exists(geojson_path):
         st.error(f"❌ Fichier GeoJSON non trouvé au chemin calculé : {geojson_path}. Vérifiez l'emplacement.")
-        return None, None, None
+        return None
 
     try:
         gdf = gpd.read_file(geojson_path)
@@ -128,7 +130,7 @@ def load_and_prepare_data():
         geom_types = gdf.geometry.geom_type.unique()
         if not all(gtype in ['Polygon', 'MultiPolygon'] for gtype in geom_types):
             st.error(f"❌ Erreur de Géométrie : Votre GeoJSON contient des types non-valides ({geom_types}).")
-            return None, None, None
+            return None
 
         gdf_merged = gdf.merge(df_config[['nom', 'stade_actuel']],
                                left_on='Nom', right_on='nom', how='left').drop(columns=['nom']).rename(
@@ -136,24 +138,46 @@ def load_and_prepare_data():
 
         gdf_merged['Stade'] = gdf_merged['Stade'].fillna('repos')
 
-        ee_features = []
-        for index, row in gdf_merged.iterrows():
-            geom = ee.Geometry(row.geometry.__geo_interface__)
-            ee_features.append(ee.Feature(geom, {'Nom': row['Nom'], 'Stade': row['Stade']}))
+        return gdf_merged
+
+    except Exception as e:
+        st.error(f"Erreur lors du traitement du GeoJSON ou de la fusion : {e}")
+        st.exception(e)
+        return None
+
 
-        ee_feature_collection = ee.FeatureCollection(ee_features)
-        geom_envelope = ee_feature_collection.geometry().bounds()
+@st.cache_resource
+def _build_ee_fc(geojson_str: str):
+    """
+    Construit la FeatureCollection Earth Engine et son emprise à partir des parcelles (GeoJSON).
+    Objets EE non sérialisables : mis en cache comme ressource, partagés entre les sessions.
+    La collection est créée en un seul appel depuis le GeoJSON complet (propriétés Nom / Stade).
+    """
+    ee_feature_collection = ee.FeatureCollection(json.loads(geojson_str))
+    geom_envelope = ee_feature_collection.geometry().bounds()
+    return ee_feature_collection, geom_envelope
 
-        return gdf_merged, ee_feature_collection, geom_envelope
 
+def load_and_prepare_data():
+    """Charge le GeoJSON local, fusionne avec les données de ConfigVignoble et prépare les objets EE."""
+    gdf_merged = _load_gdf()
+    if gdf_merged is None:
+        return None, None, None
+    try:
+        ee_feature_collection, geom_envelope = _build_ee_fc(gdf_merged[['Nom', 'Stade', 'geometry']].to_json())
     except Exception as e:
-        st.error(f"Erreur lors du traitement du GeoJSON ou de la fusion : {e}")
+        st.error(f"Erreur lors de la construction des parcelles Earth Engine : {e}")
         st.exception(e)
         return None, None, None
+    return gdf_merged, ee_feature_collection, geom_envelope
 
 
-def mask_s2_clouds(image):
-    """Masquage des nuages via la bande SCL (Scene Classification Layer) et mise à l'échelle."""
+def indices_s2(image):
+    """
+    Calcul des indices NDVI et NDMI sur les pixels non nuageux (bande SCL), en une seule étape.
+    Seules les deux bandes d'indices sont conservées : mosaïque, médiane et réduction par parcelle
+    ne portent pas sur toute la pile B1-B12.
+    """
     # SCL est la bande de classification de scène fournie avec Sentinel-2 L2A.
     scl = image.select('SCL')
 
@@ -161,15 +185,12 @@ def mask_s2_clouds(image):
     # On exclut : 3 (ombres), 8-9-10 (nuages), 11 (neige).
     mask = scl.gte(4).And(scl.lte(7))
 
-    # Appliquer le masque et diviser par 10000 pour obtenir des réflectances entre 0 et 1.
-    return image.updateMask(mask).divide(10000).copyProperties(image, ["system:time_start", "date"])
-
-
-def add_indices(image):
-    """Calcul des indices NDVI et NDMI."""
+    # Différences normalisées : indépendantes de la mise à l'échelle des réflectances (/10000)
     ndvi = image.normalizedDifference(["B8", "B4"]).rename("NDVI")
     ndmi = image.normalizedDifference(["B8A", "B11"]).rename("NDMI")
-    return image.addBands([ndvi, ndmi]).set("date", image.date().format("YYYY-MM-dd"))
+    return (ndvi.addBands(ndmi).updateMask(mask)
+            .copyProperties(image, ["system:time_start"])
+            .set("date", image.date().format("YYYY-MM-dd")))
 
 
 def get_mean_value_zonal(image, ee_feature_collection):
@@ -180,29 +201,146 @@ def get_mean_value_zonal(image, ee_feature_collection):
     )
     return mean_stats.map(lambda f: f.set('date', image.get('date')))
 
-def smooth_series(df, column, window_length=5, polyorder=2):
-    """Lissage de la série temporelle."""
-    if df.empty or column not in df.columns:
-        return pd.Series(dtype=float)
 
-    if savgol_filter and len(df) >= window_length:
+def extraire_indices_periode(debut, fin, geom_envelope, ee_feature_collection):
+    """
+    Moyennes NDVI / NDMI par parcelle et par jour sur [debut, fin[ (un segment de la période analysée).
+    Aucun appel Streamlit : exécutable dans un thread. Période sans image -> DataFrame vide.
+    """
+    s2 = (
+        ee.ImageCollection("COPERNICUS/S2_SR")
+        .filterBounds(geom_envelope)
+        .filterDate(str(debut), str(fin))
+        .filter(ee.Filter.lt("CLOUDY_PIXEL_PERCENTAGE", 80))
+        .sort("system:time_start")
+    )
+
+    # Application du masque de nuages et calcul des indices (bandes NDVI / NDMI seules)
+    s2_indices = s2.map(indices_s2)
+
+    # Une image par jour (mosaïque des tuiles du même jour) : pas de doublon (Nom, date) à rapatrier
+    jours = s2_indices.aggregate_array('date').distinct()
+    s2_indices = ee.ImageCollection(jours.map(
+        lambda jour: s2_indices.filter(ee.Filter.eq('date', jour)).mosaic().set('date', jour)
+    ))
+
+    zonal_stats = s2_indices.map(
+        lambda img: get_mean_value_zonal(img, ee_feature_collection)
+    ).flatten()
+
+    # Réduction calculée côté serveur, téléchargée en un seul CSV (colonnes utiles uniquement)
+    # plutôt que rapatriée feature par feature en JSON via getInfo()
+    # (pas de comptage préalable des images : une période sans image donne un CSV vide)
+    url_csv = zonal_stats.getDownloadURL(filetype='CSV', selectors=['Nom', 'date', 'NDVI', 'NDMI'])
+    try:
+        return pd.read_csv(url_csv)
+    except pd.errors.EmptyDataError:
+        return pd.DataFrame()
+
+@st.cache_resource(show_spinner=False)
+def image_mediane(emprise, debut, fin, _geom_envelope):
+    """
+    Image médiane des indices NDVI / NDMI sur [debut, fin[, par emprise des parcelles (bornes du GeoJSON)
+    et période : le choix de l'indice affiché n'en dépend pas.
+    """
+    return (
+        ee.ImageCollection("COPERNICUS/S2_SR")
+        .filterBounds(_geom_envelope)
+        .filterDate(debut, fin)
+        .filter(ee.Filter.lt("CLOUDY_PIXEL_PERCENTAGE", 80))
+        .map(indices_s2)
+        .median()
+    )
+
+# Visualisation de la carte médiane par indice : (paramètres EE, titre de légende, légende)
+VISU_INDICES = {
+    "NDVI": ({"bands": ["NDVI"], "min": 0, "max": 0.8, "palette": ["brown", "yellow", "green"]},
+             "NDVI Médian", {'0.1': 'brown', '0.3': 'yellow', '0.6': 'green', '0.8': 'green'}),
+    "NDMI": ({"bands": ["NDMI"], "min": -0.5, "max": 0.4, "palette": ["red", "yellow", "#00441b"]},
+             "NDMI Médian (Humidité)", {'-0.4': 'red', '0.0': 'yellow', '0.4': '#00441b'}),
+}
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def tuiles_mediane(emprise, debut, fin, _geom_envelope):
+    """URL des tuiles de l'image médiane pour chaque indice (identifiants de carte EE, valables quelques heures)."""
+    image = image_mediane(emprise, debut, fin, _geom_envelope)
+    return {
+        indice: image.select(indice).getMapId(vis)['tile_fetcher'].url_format
+        for indice, (vis, _, _) in VISU_INDICES.items()
+    }
+
+def _smooth_values(serie, window_length=5, polyorder=2):
+    """Lissage d'une série (Savitzky-Golay si possible, sinon moyenne glissante centrée)."""
+    if savgol_filter and len(serie) >= window_length:
         try:
             # Savgol filter returns a numpy array
-            return savgol_filter(df[column], window_length=window_length, polyorder=polyorder)
-        except:
-            return df[column].rolling(window=3, center=True, min_periods=1).mean()
-    else:
-        return df[column].rolling(window=3, center=True, min_periods=1).mean()
+            return pd.Series(savgol_filter(serie.to_numpy(), window_length=window_length, polyorder=polyorder),
+                             index=serie.index)
+        except Exception:
+            pass
+    return serie.rolling(window=3, center=True, min_periods=1).mean()
+
+def smooth_series(df, column, window_length=5, polyorder=2, by=None):
+    """
+    Lissage de la série temporelle (lignes triées par date).
+    Avec `by` (ex. 'Nom'), chaque parcelle est lissée séparément en un seul groupby sur tout le tableau.
+    """
+    if df.empty or column not in df.columns:
+        return pd.Series(dtype=float)
+    if by is None:
+        return _smooth_values(df[column], window_length, polyorder)
+    return df.groupby(by, sort=False, observed=True)[column].transform(_smooth_values, window_length, polyorder)
+
+# Nombre maximal de points par courbe envoyés au graphique (au-delà : sous-échantillonnage LTTB)
+LTTB_POINTS_MAX = 2000
+# Au-delà de ce nombre de mesures, les courbes mesurées sont tracées en WebGL (go.Scattergl)
+SCATTERGL_SEUIL = 500
+
+def lttb_indices(x, y, n_out):
+    """
+    Indices des points retenus par Largest-Triangle-Three-Buckets : premier et dernier points conservés,
+    puis dans chaque intervalle le point formant le plus grand triangle avec le point retenu précédent
+    et la moyenne de l'intervalle suivant (la forme de la courbe est préservée).
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    bornes = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    indices = np.empty(n_out, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        debut, fin = bornes[i], bornes[i + 1]
+        suivant_debut, suivant_fin = (bornes[i + 1], bornes[i + 2]) if i + 2 < n_out - 1 else (n - 1, n)
+        x_moy = x[suivant_debut:suivant_fin].mean()
+        y_moy = y[suivant_debut:suivant_fin].mean()
+        aires = np.abs((x[a] - x_moy) * (y[debut:fin] - y[a]) - (x[a] - x[debut:fin]) * (y_moy - y[a]))
+        a = debut + int(np.argmax(aires))
+        indices[i + 1] = a
+    return indices
+
+def serie_affichage(serie, n_max=LTTB_POINTS_MAX):
+    """Série (index dates) réduite à n_max points pour le tracé ; inchangée si elle est plus courte."""
+    if len(serie) <= n_max:
+        return serie
+    x = serie.index.values.astype('datetime64[ns]').astype(np.int64).astype(float)
+    return serie.iloc[lttb_indices(x, serie.to_numpy(dtype=float), n_max)]
+
+# Mois de dormance : Nov, Dec, Jan, Fev
+_DORMANCY = frozenset({11, 12, 1, 2})
 
 def flag_grass_noise(df):
     """Identifie les points potentiellement bruités par l'enherbement inter-rang."""
     if df.empty:
         return df
-    # Mois de dormance : Nov, Dec, Jan, Fev
-    dormancy_months = [11, 12, 1, 2]
+    # Mois précalculé à la lecture des données (colonne 'month'), sinon tiré des dates
+    if 'month' in df.columns:
+        months = df['month']
+    else:
+        months = df['date'].dt.month if 'date' in df.columns else df.index.month.to_series(index=df.index)
     # Si on est en dormance et que le NDVI est élevé, c'est probablement de l'herbe
     # On utilise un seuil empirique de 0.18 pour la vigne en dormance
-    df['grass_noise'] = (df.index.month.isin(dormancy_months)) & (df['NDVI'] > 0.18)
+    df['grass_noise'] = months.isin(_DORMANCY) & df['NDVI'].gt(0.18)
     return df
 
 
@@ -243,39 +381,43 @@ if st.button("🚀 Lancer l'Analyse Satellite (Sentinel-2)", type="primary"):
             # Calcul de la date de fin inclusive (+1 jour)
             end_date_plus_1 = end_date + datetime.timedelta(days=1)
 
-            s2 = (
-                ee.ImageCollection("COPERNICUS/S2_SR")
-                .filterBounds(geom_envelope)
-                .filterDate(str(start_date), str(end_date_plus_1))
-                .filter(ee.Filter.lt("CLOUDY_PIXEL_PERCENTAGE", 80))
-                .sort("system:time_start")
-            )
-
-            if s2.size().getInfo() == 0:
-                st.error("❌ Aucune image Sentinel-2 exploitable trouvée sur cette période (trop de nuages).")
-                st.session_state['analyse_lancee'] = False
-                st.stop()
-
-            # Application du masque de nuages et calcul des indices
-            s2_indices = s2.map(mask_s2_clouds).map(add_indices)
+            # Découpage de la période par mois calendaire : requêtes plus petites, lancées en parallèle
+            bornes = [start_date] + [
+                d.date() for d in pd.date_range(start_date, end_date, freq='MS') if d.date() > start_date
+            ] + [end_date_plus_1]
+            segments = list(zip(bornes[:-1], bornes[1:]))
 
-            results_dict = s2_indices.map(
-                lambda img: get_mean_value_zonal(img, ee_feature_collection)
-            ).flatten().getInfo()
+            with ThreadPoolExecutor(max_workers=min(EXTRACTION_THREADS_MAX, len(segments))) as pool:
+                resultats = list(pool.map(
+                    lambda seg: extraire_indices_periode(seg[0], seg[1], geom_envelope, ee_feature_collection),
+                    segments
+                ))
+            resultats = [df for df in resultats if not df.empty]
+            df_ee = pd.concat(resultats, ignore_index=True) if resultats else pd.DataFrame()
 
-            if results_dict and 'features' in results_dict:
+            if not df_ee.empty:
 
-                actual_feature_list = results_dict['features']
-                df_ee = pd.DataFrame([f['properties'] for f in actual_feature_list])
                 df_ee['date'] = pd.to_datetime(df_ee['date'])
-
-                st.session_state['df_series'] = df_ee.dropna(subset=['NDVI', 'NDMI']).drop_duplicates(
-                    subset=['Nom', 'date'])
+                df_ee['month'] = df_ee['date'].dt.month.astype('int8')
+                # Noms de parcelles répétés à chaque date : colonne catégorielle
+                df_ee['Nom'] = df_ee['Nom'].astype('category')
+
+                df_series = df_ee.dropna(subset=['NDVI', 'NDMI']).sort_values(['Nom', 'date'], kind='stable')
+                # Bruit enherbement et lissages calculés une fois pour toutes les parcelles
+                df_series = flag_grass_noise(df_series)
+                df_series['NDVI_smooth'] = smooth_series(df_series, 'NDVI', by='Nom')
+                df_series['NDMI_smooth'] = smooth_series(df_series, 'NDMI', by='Nom')
+                # Séries par parcelle (indexées par date, déjà triées) : la sélection n'est plus qu'une lecture
+                st.session_state['series_par_parcelle'] = {
+                    nom: groupe.set_index('date')
+                    for nom, groupe in df_series.groupby('Nom', sort=False, observed=True)
+                }
                 st.session_state['analyse_complete'] = True
                 st.success("✅ Analyse complétée. Données des séries temporelles extraites.")
 
             else:
-                st.error("❌ Erreur : Les résultats d'Earth Engine sont vides ou mal formés.")
+                st.error("❌ Aucune image Sentinel-2 exploitable trouvée sur cette période (trop de nuages).")
+                st.session_state['analyse_lancee'] = False
                 st.session_state['analyse_complete'] = False
 
         except ee.EEException as e:
@@ -288,67 +430,69 @@ if st.button("🚀 Lancer l'Analyse Satellite (Sentinel-2)", type="primary"):
 # --- 5️⃣ Visualisation et Alertes (MODIFIÉ) ---
 # ==============================================================================
 
-if st.session_state.get('analyse_complete', False) and 'df_series' in st.session_state:
+if st.session_state.get('analyse_complete', False) and 'series_par_parcelle' in st.session_state:
 
-    df_chart = st.session_state['df_series']
+    series_par_parcelle = st.session_state['series_par_parcelle']
 
     st.markdown("---")
     st.subheader("📈 Analyse de Tendance vs Références Phénologiques")
 
     parcelle_select = st.selectbox(
         "📍 Sélectionnez la parcelle à visualiser",
-        df_chart['Nom'].unique(),
+        list(series_par_parcelle),
         key='select_parcelle_chart'
     )
 
     # Filtrer par parcelle
-    df_parcelle = df_chart[df_chart['Nom'] == parcelle_select].set_index('date').sort_index()
+    df_parcelle = series_par_parcelle.get(parcelle_select, pd.DataFrame())
 
     if df_parcelle.empty:
         st.warning(f"Aucune donnée satellite trouvée pour la parcelle '{parcelle_select}' après filtrage.")
     else:
-        # --- NOUVEAU : Traitement des données ---
-        df_parcelle = flag_grass_noise(df_parcelle)
-        df_parcelle['NDVI_smooth'] = smooth_series(df_parcelle, 'NDVI')
-        df_parcelle['NDMI_smooth'] = smooth_series(df_parcelle, 'NDMI')
-
+        # Bruit enherbement et séries lissées déjà calculés à l'analyse (cf. series_par_parcelle)
         # Récupérer l'année de l'analyse pour la courbe de référence
         analysis_year = df_parcelle.index[0].year
         ref_df = get_reference_df(analysis_year)
 
         last_date = df_parcelle.index[-1]
         last_month = last_date.month
+        # Références du mois de la dernière mesure (seuils d'alerte NDVI / NDMI)
+        ref_row = REFERENCE_TABLE[last_month]
 
         # --- FONCTION DE VISUALISATION PLOTLY ---
-        def create_index_chart(df, ref_df, index_name, title, color_map, y_min, y_max):
+        # Zones de dormance (bandes verticales grises), communes aux graphiques NDVI et NDMI
+        zones_dormance = [
+            dict(type='rect', xref='x', yref='paper', x0=x0, x1=x1, y0=0, y1=1,
+                 fillcolor="rgba(200, 200, 200, 0.3)", layer="below", line_width=0)
+            for year in df_parcelle.index.year.unique()
+            for x0, x1 in ((pd.Timestamp(year, 11, 1), pd.Timestamp(year, 12, 31)),
+                           (pd.Timestamp(year, 1, 1), pd.Timestamp(year, 2, 28)))
+        ]
+
+        def create_index_chart(df, ref_df, index_name, title, color_map, y_min, y_max, dormancy_shapes):
             fig = go.Figure()
-            # Zones de dormance
-            years = df.index.year.unique()
-            for year in years:
-                fig.add_vrect(
-                    x0=pd.Timestamp(year, 11, 1), x1=pd.Timestamp(year, 12, 31),
-                    fillcolor="rgba(200, 200, 200, 0.3)", layer="below", line_width=0
-                )
-                fig.add_vrect(
-                    x0=pd.Timestamp(year, 1, 1), x1=pd.Timestamp(year, 2, 28),
-                    fillcolor="rgba(200, 200, 200, 0.3)", layer="below", line_width=0
-                )
+            # Zones de dormance : toutes les bandes verticales passées en une seule mise à jour du layout
+            fig.update_layout(shapes=dormancy_shapes)
             # Références
             fig.add_trace(go.Scatter(x=ref_df.index, y=ref_df[f'{index_name}_moy'],
                                      name='Réf. Moyenne', line=dict(color='#ffa500', dash='dash')))
             fig.add_trace(go.Scatter(x=ref_df.index, y=ref_df[f'{index_name}_min'],
                                      name='Réf. Minimum', line=dict(color='#ff0000', dash='dot')))
-            # Brut
-            fig.add_trace(go.Scatter(x=df.index, y=df[index_name],
+            # Séries mesurées : rendu WebGL au-delà de SCATTERGL_SEUIL points (SVG pour les séries courtes)
+            trace_mesure = go.Scattergl if len(df) > SCATTERGL_SEUIL else go.Scatter
+            # Brut (séries longues sous-échantillonnées, cf. serie_affichage)
+            brut = serie_affichage(df[index_name])
+            fig.add_trace(trace_mesure(x=brut.index, y=brut,
                                      name='Mesuré (Brut)', mode='markers',
                                      marker=dict(color=color_map['raw'], size=5, opacity=0.4)))
             # Lissé
-            fig.add_trace(go.Scatter(x=df.index, y=df[f'{index_name}_smooth'],
+            lisse = serie_affichage(df[f'{index_name}_smooth'])
+            fig.add_trace(trace_mesure(x=lisse.index, y=lisse,
                                      name='Mesuré (Lissé)', line=dict(color=color_map['smooth'], width=3)))
             # Bruit herbe
             grass_df = df[df['grass_noise']]
             if not grass_df.empty:
-                fig.add_trace(go.Scatter(x=grass_df.index, y=grass_df[index_name],
+                fig.add_trace(trace_mesure(x=grass_df.index, y=grass_df[index_name],
                                          name='Bruit Enherbement', mode='markers',
                                          marker=dict(color='purple', size=8, symbol='x')))
             fig.update_layout(
@@ -365,17 +509,17 @@ if st.session_state.get('analyse_complete', False) and 'df_series' in st.session
         with col_g1:
             fig_ndvi = create_index_chart(
                 df_parcelle, ref_df, 'NDVI', "Vigueur (NDVI)",
-                {'raw': '#1f77b4', 'smooth': '#00008b'}, 0, 0.6
+                {'raw': '#1f77b4', 'smooth': '#00008b'}, 0, 0.6, zones_dormance
             )
             st.plotly_chart(fig_ndvi, use_container_width=True)
 
             # Logique d'alerte basée sur la dernière mesure vs le min du mois
             last_ndvi = df_parcelle['NDVI_smooth'].iloc[-1]
-            ref_min_ndvi = REFERENCE_TABLE[last_month]['NDVI_min']
+            ref_min_ndvi = ref_row['NDVI_min']
 
-            if last_ndvi < ref_min_ndvi and REFERENCE_TABLE[last_month]['Stade'] != 'dormance':
+            if last_ndvi < ref_min_ndvi and ref_row['Stade'] != 'dormance':
                 st.error(
-                    f"🚨 ALERTE VIGUEUR : NDVI récent ({last_ndvi:.2f}) est **sous la normale** ({ref_min_ndvi}) pour ce mois-ci ({REFERENCE_TABLE[last_month]['Stade']}).")
+                    f"🚨 ALERTE VIGUEUR : NDVI récent ({last_ndvi:.2f}) est **sous la normale** ({ref_min_ndvi}) pour ce mois-ci ({ref_row['Stade']}).")
             else:
                 st.success(f"✅ Vigueur (NDVI : {last_ndvi:.2f}) conforme pour ce mois-ci.")
 
@@ -383,15 +527,15 @@ if st.session_state.get('analyse_complete', False) and 'df_series' in st.session
         with col_g2:
             fig_ndmi = create_index_chart(
                 df_parcelle, ref_df, 'NDMI', "Humidité Foliaire (NDMI)",
-                {'raw': '#ff7f0e', 'smooth': '#d62728'}, -0.1, 0.2
+                {'raw': '#ff7f0e', 'smooth': '#d62728'}, -0.1, 0.2, zones_dormance
             )
             st.plotly_chart(fig_ndmi, use_container_width=True)
 
             # Logique d'alerte
             last_ndmi = df_parcelle['NDMI_smooth'].iloc[-1]
-            ref_min_ndmi = REFERENCE_TABLE[last_month]['NDMI_min']
+            ref_min_ndmi = ref_row['NDMI_min']
 
-            if last_ndmi < ref_min_ndmi and REFERENCE_TABLE[last_month]['Stade'] != 'dormance':
+            if last_ndmi < ref_min_ndmi and ref_row['Stade'] != 'dormance':
                 st.warning(
                     f"💧 ALERTE SÉCHERESSE : NDMI récent ({last_ndmi:.2f}) est **sous le seuil de stress** ({ref_min_ndmi}) pour ce mois-ci.")
             else:
@@ -401,47 +545,43 @@ if st.session_state.get('analyse_complete', False) and 'df_series' in st.session
         st.markdown("---")
         st.subheader("🗺️ Carte de Synthèse (Image Médiane)")
 
-        col_map1, col_map2 = st.columns([1, 4])
+        # Carte construite (tuiles Earth Engine + HTML geemap) seulement à la demande :
+        # un expander fermé exécuterait quand même son contenu à chaque rerun
+        afficher_carte = st.toggle("Afficher la carte de synthèse", value=False, key='afficher_carte')
 
-        with col_map1:
-            index_type = st.radio(
-                "📊 Indice à visualiser :",
-                ["NDVI", "NDMI"],
-                horizontal=False,
-                key='map_index'
-            )
+        if afficher_carte:
+            col_map1, col_map2 = st.columns([1, 4])
 
-        run_start_date = st.session_state.get('start_date_sat_run', start_date)
-        run_end_date = st.session_state.get('end_date_sat_run', end_date)
+            with col_map1:
+                index_type = st.radio(
+                    "📊 Indice à visualiser :",
+                    ["NDVI", "NDMI"],
+                    horizontal=False,
+                    key='map_index'
+                )
 
-        # Calcul de la date de fin inclusive (+1 jour)
-        run_end_date_plus_1 = run_end_date + datetime.timedelta(days=1)
+            run_start_date = st.session_state.get('start_date_sat_run', start_date)
+            run_end_date = st.session_state.get('end_date_sat_run', end_date)
 
-        s2_collection = (
-            ee.ImageCollection("COPERNICUS/S2_SR")
-            .filterBounds(geom_envelope)
-            .filterDate(str(run_start_date), str(run_end_date_plus_1))
-            .filter(ee.Filter.lt("CLOUDY_PIXEL_PERCENTAGE", 80))
-            .map(mask_s2_clouds)
-            .map(add_indices)
-        )
+            # Calcul de la date de fin inclusive (+1 jour)
+            run_end_date_plus_1 = run_end_date + datetime.timedelta(days=1)
 
-        median_image = s2_collection.median()
+            # Emprise des parcelles (min_x, min_y, max_x, max_y) : clé des tuiles et centre de la carte
+            emprise = tuple(gdf_merged.total_bounds)
 
-        m = geemap.Map(center=[gdf_merged.centroid.y.mean(), gdf_merged.centroid.x.mean()], zoom=13)
+            # Tuiles de la médiane (NDVI + NDMI) en cache par emprise et période
+            tuiles = tuiles_mediane(emprise, str(run_start_date), str(run_end_date_plus_1), geom_envelope)
 
-        if index_type == "NDVI":
-            vis_params = {"bands": ["NDVI"], "min": 0, "max": 0.8, "palette": ["brown", "yellow", "green"]}
-            legend_title = "NDVI Médian"
-            legend_dict = {'0.1': 'brown', '0.3': 'yellow', '0.6': 'green', '0.8': 'green'}
-        else:
-            vis_params = {"bands": ["NDMI"], "min": -0.5, "max": 0.4, "palette": ["red", "yellow", "#00441b"]}
-            legend_title = "NDMI Médian (Humidité)"
-            legend_dict = {'-0.4': 'red', '0.0': 'yellow', '0.4': '#00441b'}
+            # Centre de l'emprise : pas de calcul de centroïde par parcelle à chaque rerun
+            m = geemap.Map(center=[(emprise[1] + emprise[3]) / 2, (emprise[0] + emprise[2]) / 2], zoom=13)
+
+            _, legend_title, legend_dict = VISU_INDICES[index_type]
 
-        m.addLayer(median_image.select(index_type), vis_params, f'Image Médiane ({index_type})')
-        m.add_legend(title=legend_title, legend_dict=legend_dict)
-        m.add_gdf(gdf_merged, layer_name="Parcelles Viticoles")
+            # Tuiles des deux indices préparées ensemble : la bascule NDVI / NDMI ne refait pas d'appel Earth Engine
+            m.add_tile_layer(url=tuiles[index_type], name=f'Image Médiane ({index_type})',
+                             attribution='Google Earth Engine')
+            m.add_legend(title=legend_title, legend_dict=legend_dict)
+            m.add_gdf(gdf_merged, layer_name="Parcelles Viticoles")
 
-        with col_map2:
-            m.to_streamlit(height=600)
\ No newline at end of file
+            with col_map2:
+                m.to_streamlit(height=600)
\ No newline at end of file
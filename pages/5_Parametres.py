@@ -9,6 +9,7 @@ import sys
 import os
 import pandas as pd
 import json
+import copy
 from datetime import datetime
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -19,10 +20,36 @@ st.set_page_config(page_title="Paramètres", page_icon="⚙️", layout="wide")
 
 st.title("⚙️ Paramètres de l'Exploitation")
 
-# Initialiser les composants
-storage = DataManager()
-config_vignoble = ConfigVignoble()
-gestion_traitements = GestionTraitements()
+# Listes des formulaires produits (ajout et modification) et position de chaque valeur
+PRODUIT_TYPES = ("contact", "penetrant", "systemique", "engrais solide", "engrais foliaire", "amendement", "autre")
+PRODUIT_TYPE_IDX = {t: i for i, t in enumerate(PRODUIT_TYPES)}
+TYPES_APPLICATION = ("Sol", "Foliaire")
+TYPES_APPLICATION_IDX = {t: i for i, t in enumerate(TYPES_APPLICATION)}
+# Colonnes du tableau des produits, dans l'ordre d'affichage
+COLONNES_PRODUITS = ('nom', 'n_amm', 'type', 'persistance_jours', 'lessivage_seuil_mm', 'dose_reference_kg_ha', 'bio')
+
+# Initialiser les composants (gardés entre les reruns ; le cache est vidé après chaque sauvegarde)
+@st.cache_resource
+def init_composants():
+    return DataManager(), ConfigVignoble(), GestionTraitements()
+
+storage, config_vignoble, gestion_traitements = init_composants()
+
+def parcelles_modifiables():
+    """Copie de session des parcelles à modifier (la configuration en cache n'est jamais modifiée avant sauvegarde)"""
+    if 'parcelles_en_attente' not in st.session_state:
+        return copy.deepcopy(config_vignoble.parcelles)
+    return st.session_state['parcelles_en_attente']
+
+def index_produit(produits, produit_id, nom):
+    """Position d'un produit stocké : par id, sinon par nom (premier de la liste en cas de doublon) ; None si absent"""
+    par_id, par_nom = {}, {}
+    for i, p in enumerate(produits):
+        if p.get('id') is not None:
+            par_id.setdefault(p['id'], i)
+        par_nom.setdefault(p.get('nom'), i)
+    idx = par_id.get(produit_id) if produit_id is not None else None
+    return idx if idx is not None else par_nom.get(nom)
 
 # Gérer la navigation par onglets via session_state
 tab_titles = ["🍇 Configuration Vignoble", "💊 Liste Produits", "🌾 Besoins Cépages"]
@@ -42,13 +69,29 @@ st.markdown("---")
 if selected_tab == tab_titles[0]:
     st.subheader("📍 Gestion des Parcelles")
 
-    parcelles = config_vignoble.parcelles
+    # Ajouts / modifications / suppressions de parcelles gardés dans une copie propre à la session,
+    # écrits en une fois : la configuration en cache est partagée entre toutes les sessions.
+    parcelles = st.session_state.get('parcelles_en_attente', config_vignoble.parcelles)
 
     # Affichage de la liste actuelle
     if parcelles:
         df_parcelles = pd.DataFrame(parcelles)
         st.dataframe(df_parcelles, use_container_width=True, hide_index=True)
 
+    if 'parcelles_en_attente' in st.session_state:
+        st.warning("⚠️ Modifications de parcelles non enregistrées.")
+        col_save1, col_save2 = st.columns(2)
+        if col_save1.button("💾 Sauvegarder les parcelles", type="primary", use_container_width=True):
+            config_vignoble.parcelles = st.session_state.pop('parcelles_en_attente')
+            config_vignoble.sauvegarder_config()
+            st.cache_resource.clear()
+            st.cache_data.clear()
+            if storage.flush():
+                st.rerun()
+        if col_save2.button("↩️ Annuler les modifications", use_container_width=True):
+            st.session_state.pop('parcelles_en_attente', None)
+            st.rerun()
+
     st.markdown("---")
 
     col_add, col_edit = st.columns(2)
@@ -79,11 +122,8 @@ if selected_tab == tab_titles[0]:
                         "objectif_rdt": new_obj_rdt,
                         "broyage_sarments": new_broyage
                     }
-                    config_vignoble.parcelles.append(new_parcelle)
-                    config_vignoble.sauvegarder_config()
-                    st.cache_resource.clear()
-                    st.cache_data.clear()
-                    st.success(f"✅ Parcelle '{new_nom}' ajoutée.")
+                    st.session_state['parcelles_en_attente'] = parcelles_modifiables() + [new_parcelle]
+                    st.success(f"✅ Parcelle '{new_nom}' ajoutée (à sauvegarder).")
                     st.session_state.active_tab_params = tab_titles[0]
                     st.rerun()
                 else:
@@ -109,25 +149,21 @@ if selected_tab == tab_titles[0]:
                 submit_del = col_btn2.form_submit_button("🗑️ Supprimer", use_container_width=True)
 
                 if submit_edit:
+                    st.session_state['parcelles_en_attente'] = parcelles_modifiables()
+                    parcelle_to_edit = next(p for p in st.session_state['parcelles_en_attente'] if p['nom'] == nom_edit)
                     parcelle_to_edit['nom'] = edit_nom
                     parcelle_to_edit['surface_ha'] = edit_surface
                     parcelle_to_edit['cepages'] = [c.strip() for c in edit_cepages.split(',')]
                     parcelle_to_edit['rfu_max_mm'] = edit_rfu_max
                     parcelle_to_edit['objectif_rdt'] = edit_obj_rdt
                     parcelle_to_edit['broyage_sarments'] = edit_broyage
-                    config_vignoble.sauvegarder_config()
-                    st.cache_resource.clear()
-                    st.cache_data.clear()
-                    st.success("✅ Modifications enregistrées.")
+                    st.success("✅ Modifications en attente de sauvegarde.")
                     st.session_state.active_tab_params = tab_titles[0]
                     st.rerun()
 
                 if submit_del:
-                    config_vignoble.parcelles = [p for p in config_vignoble.parcelles if p['nom'] != nom_edit]
-                    config_vignoble.sauvegarder_config()
-                    st.cache_resource.clear()
-                    st.cache_data.clear()
-                    st.warning(f"🗑️ Parcelle '{nom_edit}' supprimée.")
+                    st.session_state['parcelles_en_attente'] = [p for p in parcelles_modifiables() if p['nom'] != nom_edit]
+                    st.warning(f"🗑️ Parcelle '{nom_edit}' supprimée (à sauvegarder).")
                     st.session_state.active_tab_params = tab_titles[0]
                     st.rerun()
         else:
@@ -148,12 +184,14 @@ if selected_tab == tab_titles[0]:
         config_vignoble.longitude = lon
         config_vignoble.parametres['t_base_gdd'] = t_base
         config_vignoble.parametres['rfu_max_mm_default'] = rfu_def
+        # Les parcelles en attente restent dans la session : seules les parcelles déjà sauvegardées sont écrites
         config_vignoble.sauvegarder_config()
         st.cache_resource.clear()
         st.cache_data.clear()
-        st.success("✅ Paramètres généraux sauvegardés.")
-        st.session_state.active_tab_params = tab_titles[0]
-        st.rerun()
+        if storage.flush():
+            st.success("✅ Paramètres généraux sauvegardés.")
+            st.session_state.active_tab_params = tab_titles[0]
+            st.rerun()
 
 # ==============================================================================
 # TAB 2 : LISTE PRODUITS
@@ -161,15 +199,23 @@ if selected_tab == tab_titles[0]:
 elif selected_tab == tab_titles[1]:
     st.subheader("🧪 Gestion des Produits (Phyto, Engrais, etc.)")
 
-    # Charger les produits
-    produits_dict = gestion_traitements.FONGICIDES
+    # Charger les produits (relus seulement si le fichier produits a changé depuis le dernier chargement)
+    produits_dict = gestion_traitements.rafraichir_produits()
     produits_list = list(produits_dict.values())
 
     if produits_list:
-        df_produits = pd.DataFrame(produits_list)
-        # Réorganiser colonnes pour lisibilité
-        cols = ['nom', 'n_amm', 'type', 'persistance_jours', 'lessivage_seuil_mm', 'dose_reference_kg_ha', 'bio']
-        st.dataframe(df_produits[[c for c in cols if c in df_produits.columns]], use_container_width=True, hide_index=True)
+        # Tableau construit avec les seules colonnes affichées, noms des produits (tuple) et index nom -> produit
+        # (en cas de doublon de nom, le premier produit de la liste est retenu), gardés tant que le catalogue n'est pas rechargé
+        memo = st.session_state.get('df_produits')
+        if memo is None or memo[0] is not produits_dict:
+            presentes = set().union(*produits_list)
+            memo = (produits_dict,
+                    pd.DataFrame.from_records(produits_list, columns=[c for c in COLONNES_PRODUITS if c in presentes]),
+                    tuple(p['nom'] for p in produits_list),
+                    {p['nom']: p for p in reversed(produits_list)})
+            st.session_state['df_produits'] = memo
+        _, df_produits, produits_noms, produits_par_nom = memo
+        st.dataframe(df_produits, use_container_width=True, hide_index=True)
 
     st.markdown("---")
 
@@ -177,8 +223,8 @@ elif selected_tab == tab_titles[1]:
 
     with col_p_add:
         st.markdown("### ➕ Ajouter un Produit")
-        p_type = st.selectbox("Type *", ["contact", "penetrant", "systemique", "engrais solide", "engrais foliaire", "amendement", "autre"], key="add_p_type")
-        is_phyto = p_type in ["contact", "penetrant", "systemique", "autre"]
+        p_type = st.selectbox("Type *", PRODUIT_TYPES, key="add_p_type")
+        is_phyto = p_type in GestionTraitements.TYPES_PHYTO
 
         with st.form("form_add_produit", clear_on_submit=True):
             p_nom = st.text_input("Nom commercial *")
@@ -207,7 +253,7 @@ elif selected_tab == tab_titles[1]:
             p_mn = col_oligo4.number_input("Manganèse %", min_value=0.0, value=0.0, step=0.1)
 
             col_app1, col_app2 = st.columns(2)
-            p_app_type = col_app1.selectbox("Application", ["Sol", "Foliaire"])
+            p_app_type = col_app1.selectbox("Application", TYPES_APPLICATION)
             p_bio = col_app2.checkbox("Mention Bio (UAB)")
 
             submit_p_add = st.form_submit_button("Ajouter le Produit", type="primary")
@@ -233,25 +279,25 @@ elif selected_tab == tab_titles[1]:
                     data = storage.load_data('produits', default_factory=lambda: {'produits': []})
                     data['produits'].append(new_produit)
                     storage.save_data('produits', data)
-                    st.cache_resource.clear()
-                    st.cache_data.clear()
-                    st.success(f"✅ Produit '{p_nom}' ajouté.")
-                    st.session_state.active_tab_params = tab_titles[1]
-                    st.rerun()
+                    # Pas de vidage global des caches : les catalogues produits (ici et dans les autres pages)
+                    # se rechargent d'après la version du fichier (rafraichir_produits)
+                    if storage.flush():
+                        st.success(f"✅ Produit '{p_nom}' ajouté.")
+                        st.session_state.active_tab_params = tab_titles[1]
+                        st.rerun()
                 else:
                     st.error("⚠️ Le nom commercial est obligatoire.")
 
     with col_p_edit:
         st.markdown("### 📝 Modifier / Supprimer")
         if produits_list:
-            p_select_nom = st.selectbox("Sélectionner un produit", [p['nom'] for p in produits_list])
-            p_to_edit = next(p for p in produits_list if p['nom'] == p_select_nom)
+            p_select_nom = st.selectbox("Sélectionner un produit", produits_noms, key="edit_p_nom")
+            p_to_edit = produits_par_nom[p_select_nom]
 
-            all_types = ["contact", "penetrant", "systemique", "engrais solide", "engrais foliaire", "amendement", "autre"]
-            pe_type = st.selectbox("Type", all_types,
-                                   index=all_types.index(p_to_edit.get('type', 'contact')) if p_to_edit.get('type') in all_types else 0,
+            pe_type = st.selectbox("Type", PRODUIT_TYPES,
+                                   index=PRODUIT_TYPE_IDX.get(p_to_edit.get('type'), 0),
                                    key="edit_p_type")
-            is_phyto_edit = pe_type in ["contact", "penetrant", "systemique", "autre"]
+            is_phyto_edit = pe_type in GestionTraitements.TYPES_PHYTO
 
             with st.form("form_edit_produit"):
                 pe_nom = st.text_input("Nom commercial", value=p_to_edit['nom'])
@@ -280,8 +326,8 @@ elif selected_tab == tab_titles[1]:
                 pe_mn = col_eoligo4.number_input("Manganèse %", min_value=0.0, value=float(p_to_edit.get('mn', 0.0)), step=0.1)
 
                 col_eapp1, col_eapp2 = st.columns(2)
-                pe_app_type = col_eapp1.selectbox("Application", ["Sol", "Foliaire"],
-                                                  index=["Sol", "Foliaire"].index(p_to_edit.get('type_application', 'Sol')) if p_to_edit.get('type_application') in ["Sol", "Foliaire"] else 0)
+                pe_app_type = col_eapp1.selectbox("Application", TYPES_APPLICATION,
+                                                  index=TYPES_APPLICATION_IDX.get(p_to_edit.get('type_application'), 0))
                 pe_bio = col_eapp2.checkbox("Mention Bio (UAB)", value=bool(p_to_edit.get('bio', False)))
 
                 col_pb1, col_pb2 = st.columns(2)
@@ -290,40 +336,41 @@ elif selected_tab == tab_titles[1]:
 
                 if submit_pe_edit:
                     data = storage.load_data('produits')
-                    for prod in data['produits']:
-                        if prod.get('id') == p_to_edit.get('id') or prod.get('nom') == p_select_nom:
-                            prod['nom'] = pe_nom
-                            prod['n_amm'] = pe_amm
-                            prod['type'] = pe_type
-                            prod['persistance_jours'] = pe_pers
-                            prod['lessivage_seuil_mm'] = pe_less
-                            prod['dose_reference_kg_ha'] = pe_dose
-                            prod['n'] = pe_n
-                            prod['p'] = pe_p
-                            prod['k'] = pe_k
-                            prod['mgo'] = pe_mgo
-                            prod['bore'] = pe_bore
-                            prod['zinc'] = pe_zinc
-                            prod['mn'] = pe_mn
-                            prod['type_application'] = pe_app_type
-                            prod['bio'] = pe_bio
-                            break
+                    idx = index_produit(data['produits'], p_to_edit.get('id'), p_select_nom)
+                    if idx is not None:
+                        data['produits'][idx].update({
+                            'nom': pe_nom,
+                            'n_amm': pe_amm,
+                            'type': pe_type,
+                            'persistance_jours': pe_pers,
+                            'lessivage_seuil_mm': pe_less,
+                            'dose_reference_kg_ha': pe_dose,
+                            'n': pe_n,
+                            'p': pe_p,
+                            'k': pe_k,
+                            'mgo': pe_mgo,
+                            'bore': pe_bore,
+                            'zinc': pe_zinc,
+                            'mn': pe_mn,
+                            'type_application': pe_app_type,
+                            'bio': pe_bio
+                        })
                     storage.save_data('produits', data)
-                    st.cache_resource.clear()
-                    st.cache_data.clear()
-                    st.success("✅ Modifications enregistrées.")
-                    st.session_state.active_tab_params = tab_titles[1]
-                    st.rerun()
+                    if storage.flush():
+                        st.success("✅ Modifications enregistrées.")
+                        st.session_state.active_tab_params = tab_titles[1]
+                        st.rerun()
 
                 if submit_pe_del:
                     data = storage.load_data('produits')
-                    data['produits'] = [p for p in data['produits'] if (p.get('id') != p_to_edit.get('id') and p.get('nom') != p_select_nom)]
+                    idx = index_produit(data['produits'], p_to_edit.get('id'), p_select_nom)
+                    if idx is not None:
+                        data['produits'].pop(idx)
                     storage.save_data('produits', data)
-                    st.cache_resource.clear()
-                    st.cache_data.clear()
-                    st.warning(f"🗑️ Produit '{p_select_nom}' supprimé.")
-                    st.session_state.active_tab_params = tab_titles[1]
-                    st.rerun()
+                    if storage.flush():
+                        st.warning(f"🗑️ Produit '{p_select_nom}' supprimé.")
+                        st.session_state.active_tab_params = tab_titles[1]
+                        st.rerun()
         else:
             st.info("Aucun produit à modifier.")
 
@@ -371,6 +418,10 @@ elif selected_tab == tab_titles[2]:
             storage.save_data('besoins', export_coefs)
             st.cache_resource.clear()
             st.cache_data.clear()
-            st.success(f"✅ Coefficients mis à jour pour {c_selected}.")
-            st.session_state.active_tab_params = tab_titles[2]
-            st.rerun()
+            if storage.flush():
+                st.success(f"✅ Coefficients mis à jour pour {c_selected}.")
+                st.session_state.active_tab_params = tab_titles[2]
+                st.rerun()
+
+# Écritures Google Sheets de ce rerun : attendre leur fin et signaler les échecs
+storage.flush()
@@ -9,8 +9,7 @@ import sys
 import os
 import pandas as pd
 from datetime import datetime, date
-import plotly.graph_objects as go
-import plotly.express as px
+from functools import lru_cache
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from mildiou_prevention import SystemeDecision, GestionFertilisation
@@ -20,15 +19,92 @@ st.set_page_config(page_title="Fertilisation", page_icon="🌱", layout="wide")
 
 st.title("🌱 Fertilisation et Amendements")
 
+# Types de produits proposés pour un apport
+ENGRAIS_TYPES = frozenset({"engrais solide", "engrais foliaire", "amendement"})
+# Nombre d'apports (les plus récents) affichés par défaut dans l'historique détaillé
+HISTORIQUE_LIGNES_MAX = 200
+# Colonnes de l'historique détaillé -> libellés affichés
+COLONNES_HISTORIQUE = {
+    'date': 'Date',
+    'parcelle': 'Parcelle',
+    'produit_nom': 'Produit',
+    'quantite_ha': 'Qté/ha',
+    'u_n': 'U. N',
+    'u_p': 'U. P',
+    'u_k': 'U. K',
+    'u_mgo': 'U. MgO',
+    'type_application': 'Type',
+    'bio': 'Bio'
+}
+
+# Alertes de pilotage par élément : (condition(couverture %, objectif hl/ha, cépages), niveau st.*, message),
+# la première règle vérifiée d'un groupe est affichée
+ALERTES_PILOTAGE = (
+    # Azote > 120% (spécial Grenache)
+    (
+        (lambda couv, obj, cepages: couv['n'] > 120 and "Grenache" in cepages, "error",
+         "🔴 **ALERTE VIGUEUR EXTRÊME (Grenache) :** Couverture Azote à {n}%. Risque élevé de coulure et de sensibilité aux maladies."),
+        (lambda couv, obj, cepages: couv['n'] > 120, "warning",
+         "🟠 **Surplus Azote :** Couverture à {n}%. Surveillez la vigueur de la végétation."),
+    ),
+    # Potasse < 50%, critique pour les gros objectifs
+    (
+        (lambda couv, obj, cepages: couv['k'] < 50 and obj >= 60, "error",
+         "🔴 **ALERTE CARENCE POTASSE :** Couverture K à {k}% pour un objectif ambitieux de {obj} hl/ha. Risque de blocage de maturité."),
+        (lambda couv, obj, cepages: couv['k'] < 50, "warning",
+         "🟠 **Carence Potasse potentielle :** Couverture K à {k}%."),
+    ),
+)
+
 # Initialiser les composants
 @st.cache_resource
 def init_systeme_v2():
     return SystemeDecision()
 
+@st.cache_resource
+def init_gestion_fert():
+    return GestionFertilisation()
+
+def annees_apports(apports):
+    """Années ayant des apports (plus l'année en cours), de la plus récente à la plus ancienne"""
+    # Dates au format 'AAAA-MM-JJ' : l'année est lue directement, sans strptime
+    return sorted({int(a['date'][:4]) for a in apports} | {datetime.now().year}, reverse=True)
+
+@lru_cache(maxsize=64)
+def gauge_spec(val, name, color):
+    """Jauge de couverture (%) sous forme de dict Plotly, gardée par (valeur, nom, couleur)"""
+    import plotly.graph_objects as go
+
+    fig = go.Figure(go.Indicator(
+        mode = "gauge+number",
+        value = val,
+        title = {'text': f"Couverture {name} (%)"},
+        domain = {'x': [0, 1], 'y': [0, 1]},
+        gauge = {
+            'axis': {'range': [0, 150]},
+            'bar': {'color': color},
+            'steps': [
+                {'range': [0, 80], 'color': "rgba(255, 0, 0, 0.1)"},
+                {'range': [80, 120], 'color': "rgba(0, 255, 0, 0.1)"},
+                {'range': [120, 150], 'color': "rgba(255, 165, 0, 0.1)"}
+            ],
+            'threshold': {
+                'line': {'color': "black", 'width': 4},
+                'thickness': 0.75,
+                'value': 100
+            }
+        }
+    ))
+    fig.update_layout(height=250, margin=dict(l=20, r=20, t=50, b=20), template="plotly_dark")
+    return fig.to_dict()
+
 try:
     systeme = init_systeme_v2()
-    # On utilise directement GestionFertilisation
-    gestion_fert = GestionFertilisation()
+    # Traitements relus si le stockage a changé (ajout / suppression depuis une autre page)
+    systeme.traitements.rafraichir_historique()
+    # On utilise directement GestionFertilisation (gardée entre les reruns, relue si le fichier a changé)
+    gestion_fert = init_gestion_fert()
+    gestion_fert.rafraichir()
 
     # Gérer la navigation par onglets via session_state
     tab_titles = ["➕ Nouvel Apport", "📊 Historique et Suivi", "🎯 Pilotage & Objectifs"]
@@ -51,24 +127,32 @@ try:
         with col_form:
             with st.form("form_apport", clear_on_submit=True):
                 # Parcelle
-                parcelle_names = [p['nom'] for p in systeme.config.parcelles]
+                parcelle_names = systeme.config.noms_parcelles()
                 parcelle = st.selectbox("📍 Parcelle *", parcelle_names)
 
                 col1, col2 = st.columns(2)
                 apport_date = col1.date_input("📅 Date *", value=date.today())
 
                 # Produits - filtrer pour engrais/amendements
-                produits_dict = systeme.traitements.charger_produits()
-                engrais_ids = [k for k, v in produits_dict.items() if v.get('type') in ["engrais solide", "engrais foliaire", "amendement"]]
-
-                if not engrais_ids:
+                produits_dict = systeme.traitements.rafraichir_produits()
+                # Nom -> (id, produit), dans l'ordre du catalogue (premier produit retenu pour un nom en double),
+                # et noms figés en tuple ; gardés tant que le catalogue n'est pas rechargé
+                memo = st.session_state.get('engrais_fert')
+                if memo is None or memo[0] is not produits_dict:
+                    engrais = {}
+                    for k, v in produits_dict.items():
+                        if v.get('type') in ENGRAIS_TYPES:
+                            engrais.setdefault(v['nom'], (k, v))
+                    memo = (produits_dict, engrais, tuple(engrais))
+                    st.session_state['engrais_fert'] = memo
+                _, engrais, engrais_noms = memo
+
+                if not engrais:
                     st.warning("⚠️ Aucun engrais ou amendement trouvé dans la bibliothèque de produits. Allez dans 'Paramètres' pour en ajouter.")
-                    produit_selectionne = None
+                    nom_selectionne = None
                 else:
-                    engrais_noms = [produits_dict[k]['nom'] for k in engrais_ids]
-                    nom_selectionne = col2.selectbox("🧪 Produit *", engrais_noms)
-                    produit_id = engrais_ids[engrais_noms.index(nom_selectionne)]
-                    produit_info = produits_dict[produit_id]
+                    nom_selectionne = col2.selectbox("🧪 Produit *", engrais_noms, key="produit_fert")
+                    produit_id, produit_info = engrais[nom_selectionne]
 
                     qty = st.number_input("⚖️ Quantité par hectare (kg/ha ou L/ha) *", min_value=0.0, value=float(produit_info.get('dose_reference_kg_ha', 0.0)), step=1.0)
 
@@ -85,11 +169,11 @@ try:
                             produit_info=produit_info,
                             quantite_ha=qty
                         )
-                        st.cache_resource.clear()
-                        st.cache_data.clear()
-                        st.success(f"✅ Apport enregistré : {apport['u_n']} unités N, {apport['u_p']} unités P, {apport['u_k']} unités K, {apport['u_mgo']} unités MgO.")
-                        st.session_state.active_tab_fert = tab_titles[1] # Aller à l'historique
-                        st.rerun()
+                        # Apport déjà ajouté aux données et aux cumuls en mémoire : pas de vidage des caches
+                        if gestion_fert.storage.flush():
+                            st.success(f"✅ Apport enregistré : {apport['u_n']} unités N, {apport['u_p']} unités P, {apport['u_k']} unités K, {apport['u_mgo']} unités MgO.")
+                            st.session_state.active_tab_fert = tab_titles[1] # Aller à l'historique
+                            st.rerun()
                     else:
                         st.error("⚠️ La quantité doit être supérieure à 0.")
 
@@ -112,7 +196,7 @@ try:
     elif selected_tab == tab_titles[1]:
         st.subheader("📊 Récapitulatif Annuel par Parcelle")
 
-        annee_sel = st.selectbox("Année", sorted(list(set([datetime.strptime(a['date'], '%Y-%m-%d').year for a in gestion_fert.donnees['apports']] + [datetime.now().year])), reverse=True))
+        annee_sel = st.selectbox("Année", annees_apports(gestion_fert.donnees['apports']))
 
         bilan = gestion_fert.get_bilan_annuel(annee_sel)
 
@@ -121,14 +205,12 @@ try:
         else:
             # Préparer données pour tableau et graphique
             data_bilan = []
+            # Parcelles fertilisées l'année précédente, relevées en un seul passage
+            annee_prec = str(annee_sel - 1)
+            parcelles_annee_prec = {a['parcelle'] for a in gestion_fert.donnees['apports'] if a['date'][:4] == annee_prec}
+            col_annee_prec = f'Fertilisée {annee_prec}'
             for p_nom, stats in bilan.items():
-                # Vérifier si fertilisée l'année précédente
-                has_prev = False
-                for a in gestion_fert.donnees['apports']:
-                    d = datetime.strptime(a['date'], '%Y-%m-%d')
-                    if d.year == annee_sel - 1 and a['parcelle'] == p_nom:
-                        has_prev = True
-                        break
+                has_prev = p_nom in parcelles_annee_prec
 
                 data_bilan.append({
                     'Parcelle': p_nom,
@@ -137,7 +219,7 @@ try:
                     'K (Potasse)': stats['k'],
                     'MgO (Magnésie)': stats.get('mgo', 0),
                     'Passages': stats['nb_passages'],
-                    f'Fertilisée {annee_sel-1}': "✅" if has_prev else "❌"
+                    col_annee_prec: "✅" if has_prev else "❌"
                 })
 
             df_bilan = pd.DataFrame(data_bilan)
@@ -146,49 +228,55 @@ try:
             st.markdown("---")
             st.subheader("📈 Comparatif N-P-K (Unités / Ha)")
 
-            fig = go.Figure()
-            fig.add_trace(go.Bar(x=df_bilan['Parcelle'], y=df_bilan['N (Azote)'], name='N (Azote)', marker_color='#2ca02c'))
-            fig.add_trace(go.Bar(x=df_bilan['Parcelle'], y=df_bilan['P (Phosphore)'], name='P (Phosphore)', marker_color='#ff7f0e'))
-            fig.add_trace(go.Bar(x=df_bilan['Parcelle'], y=df_bilan['K (Potasse)'], name='K (Potasse)', marker_color='#1f77b4'))
-            fig.add_trace(go.Bar(x=df_bilan['Parcelle'], y=df_bilan['MgO (Magnésie)'], name='MgO (Magnésie)', marker_color='#9467bd'))
-
-            fig.update_layout(barmode='group', template="plotly_dark", height=400)
+            # Plotly importé seulement à l'affichage des graphiques (inutile à l'onglet de saisie)
+            import plotly.express as px
+
+            # Tableau en format long : une seule figure Plotly Express, une couleur par élément
+            couleurs = {'N (Azote)': '#2ca02c', 'P (Phosphore)': '#ff7f0e', 'K (Potasse)': '#1f77b4',
+                        'MgO (Magnésie)': '#9467bd'}
+            df_long = df_bilan.melt(id_vars='Parcelle', value_vars=list(couleurs),
+                                    var_name='Élément', value_name='Unités / Ha')
+            fig = px.bar(df_long, x='Parcelle', y='Unités / Ha', color='Élément', barmode='group',
+                         color_discrete_map=couleurs, category_orders={'Élément': list(couleurs)},
+                         template="plotly_dark", height=400)
             st.plotly_chart(fig, use_container_width=True)
 
         st.markdown("---")
         st.subheader("📜 Historique détaillé")
-        if gestion_fert.donnees['apports']:
-            df_hist = pd.DataFrame(gestion_fert.donnees['apports'])
-            df_hist = df_hist.sort_values('date', ascending=False)
-
-            # S'assurer que toutes les colonnes attendues existent
-            for col in ['u_n', 'u_p', 'u_k', 'u_mgo', 'bio', 'type_application']:
-                if col not in df_hist.columns:
-                    df_hist[col] = 0.0 if col.startswith('u_') else ""
-
-            # Formater les colonnes
-            cols_show = {
-                'date': 'Date',
-                'parcelle': 'Parcelle',
-                'produit_nom': 'Produit',
-                'quantite_ha': 'Qté/ha',
-                'u_n': 'U. N',
-                'u_p': 'U. P',
-                'u_k': 'U. K',
-                'u_mgo': 'U. MgO',
-                'type_application': 'Type',
-                'bio': 'Bio'
-            }
-            # Filtrer seulement les colonnes qui existent vraiment maintenant
-            cols_to_use = [c for c in cols_show.keys() if c in df_hist.columns]
-            st.dataframe(df_hist[cols_to_use].rename(columns=cols_show), use_container_width=True, hide_index=True)
-
-            if st.button("🗑️ Vider l'historique de fertilisation"):
-                if st.checkbox("Confirmer la suppression totale"):
-                    gestion_fert.donnees['apports'] = []
-                    gestion_fert.sauvegarder()
-                    st.success("Historique vidé.")
-                    st.rerun()
+        apports = gestion_fert.donnees['apports']
+        if apports:
+            # Vue triée et renommée, gardée tant que la liste des apports n'a pas changé (rechargement ou ajout)
+            memo = st.session_state.get('historique_fert')
+            if memo is None or memo[0] is not apports or memo[1] != len(apports):
+                df_hist = pd.DataFrame(apports).sort_values('date', ascending=False)
+                # S'assurer que toutes les colonnes attendues existent
+                for col in ['u_n', 'u_p', 'u_k', 'u_mgo', 'bio', 'type_application']:
+                    if col not in df_hist.columns:
+                        df_hist[col] = 0.0 if col.startswith('u_') else ""
+                # Seulement les colonnes qui existent vraiment, renommées pour l'affichage
+                df_hist = df_hist[[c for c in COLONNES_HISTORIQUE if c in df_hist.columns]].rename(columns=COLONNES_HISTORIQUE)
+                memo = (apports, len(apports), df_hist)
+                st.session_state['historique_fert'] = memo
+            df_hist = memo[2]
+
+            # Apports les plus récents seulement, sauf demande explicite (historique complet envoyé au navigateur)
+            if len(df_hist) > HISTORIQUE_LIGNES_MAX:
+                if not st.checkbox(f"Afficher tout l'historique ({len(df_hist)} apports)", key="hist_fert_complet"):
+                    df_hist = df_hist.head(HISTORIQUE_LIGNES_MAX)
+            st.dataframe(df_hist, use_container_width=True, hide_index=True, height=400)
+
+            # Confirmation et validation dans un même formulaire : une seule exécution du script
+            with st.form("form_vider_historique_fert"):
+                confirmer = st.checkbox("Confirmer la suppression totale")
+                if st.form_submit_button("🗑️ Vider l'historique de fertilisation"):
+                    if confirmer:
+                        gestion_fert.donnees['apports'] = []
+                        gestion_fert.sauvegarder()
+                        if gestion_fert.storage.flush():
+                            st.success("Historique vidé.")
+                            st.rerun()
+                    else:
+                        st.warning("Cochez la confirmation pour vider l'historique.")
         else:
             st.info("Aucun historique disponible.")
 
@@ -197,10 +285,11 @@ try:
     # ==============================================================================
     elif selected_tab == tab_titles[2]:
         st.subheader("🎯 Pilotage des Besoins Nutritionnels")
+        import plotly.graph_objects as go
 
         # Sélection parcelle
-        parcelle_pilot = st.selectbox("📍 Sélectionner une parcelle pour le pilotage", [p['nom'] for p in systeme.config.parcelles], key="sel_pilot")
-        annee_pilot = st.selectbox("Année", sorted(list(set([datetime.strptime(a['date'], '%Y-%m-%d').year for a in gestion_fert.donnees['apports']] + [datetime.now().year])), reverse=True), key="annee_pilot")
+        parcelle_pilot = st.selectbox("📍 Sélectionner une parcelle pour le pilotage", systeme.config.noms_parcelles(), key="sel_pilot")
+        annee_pilot = st.selectbox("Année", annees_apports(gestion_fert.donnees['apports']), key="annee_pilot")
 
         # Calcul du bilan
         bilan_pilot = gestion_fert.calculer_bilan_pilotage(parcelle_pilot, annee_pilot, systeme.config)
@@ -278,34 +367,10 @@ try:
             # --- GAUGES ---
             col_g1, col_g2, col_g3, col_g4 = st.columns(4)
 
-            def create_gauge(val, name, color):
-                fig = go.Figure(go.Indicator(
-                    mode = "gauge+number",
-                    value = val,
-                    title = {'text': f"Couverture {name} (%)"},
-                    domain = {'x': [0, 1], 'y': [0, 1]},
-                    gauge = {
-                        'axis': {'range': [0, 150]},
-                        'bar': {'color': color},
-                        'steps': [
-                            {'range': [0, 80], 'color': "rgba(255, 0, 0, 0.1)"},
-                            {'range': [80, 120], 'color': "rgba(0, 255, 0, 0.1)"},
-                            {'range': [120, 150], 'color': "rgba(255, 165, 0, 0.1)"}
-                        ],
-                        'threshold': {
-                            'line': {'color': "black", 'width': 4},
-                            'thickness': 0.75,
-                            'value': 100
-                        }
-                    }
-                ))
-                fig.update_layout(height=250, margin=dict(l=20, r=20, t=50, b=20), template="plotly_dark")
-                return fig
-
-            col_g1.plotly_chart(create_gauge(couv['n'], "N (Azote)", "#2ca02c"), use_container_width=True)
-            col_g2.plotly_chart(create_gauge(couv['p'], "P (Phosphore)", "#ff7f0e"), use_container_width=True)
-            col_g3.plotly_chart(create_gauge(couv['k'], "K (Potasse)", "#1f77b4"), use_container_width=True)
-            col_g4.plotly_chart(create_gauge(couv['mgo'], "MgO", "#9467bd"), use_container_width=True)
+            col_g1.plotly_chart(gauge_spec(couv['n'], "N (Azote)", "#2ca02c"), use_container_width=True)
+            col_g2.plotly_chart(gauge_spec(couv['p'], "P (Phosphore)", "#ff7f0e"), use_container_width=True)
+            col_g3.plotly_chart(gauge_spec(couv['k'], "K (Potasse)", "#1f77b4"), use_container_width=True)
+            col_g4.plotly_chart(gauge_spec(couv['mgo'], "MgO", "#9467bd"), use_container_width=True)
 
             # --- DETAILS TABLE ---
             st.markdown("### 📋 Détail du Bilan (Unités / Ha)")
@@ -320,29 +385,22 @@ try:
             # --- ALERTS ---
             st.markdown("### ⚠️ Alertes de Pilotage")
 
+            # Au plus une alerte par élément : la première règle vérifiée de chaque groupe
+            parcelle_obj = systeme.config.get_parcelle(parcelle_pilot)
             alerts_found = False
-
-            # Alerte N > 120% (spécial Grenache)
-            parcelle_obj = next(p for p in systeme.config.parcelles if p['nom'] == parcelle_pilot)
-            if couv['n'] > 120:
-                if "Grenache" in parcelle_obj['cepages']:
-                    st.error(f"🔴 **ALERTE VIGUEUR EXTRÊME (Grenache) :** Couverture Azote à {couv['n']}%. Risque élevé de coulure et de sensibilité aux maladies.")
-                    alerts_found = True
-                else:
-                    st.warning(f"🟠 **Surplus Azote :** Couverture à {couv['n']}%. Surveillez la vigueur de la végétation.")
-                    alerts_found = True
-
-            # Alerte K < 50% pour gros objectifs
-            if couv['k'] < 50 and obj >= 60:
-                st.error(f"🔴 **ALERTE CARENCE POTASSE :** Couverture K à {couv['k']}% pour un objectif ambitieux de {obj} hl/ha. Risque de blocage de maturité.")
-                alerts_found = True
-            elif couv['k'] < 50:
-                st.warning(f"🟠 **Carence Potasse potentielle :** Couverture K à {couv['k']}%.")
-                alerts_found = True
+            for regles in ALERTES_PILOTAGE:
+                for condition, niveau, message in regles:
+                    if condition(couv, obj, parcelle_obj['cepages']):
+                        getattr(st, niveau)(message.format(n=couv['n'], k=couv['k'], obj=obj))
+                        alerts_found = True
+                        break
 
             if not alerts_found:
                 st.success("✅ Équilibre nutritionnel satisfaisant.")
 
+    # Écritures Google Sheets de ce rerun : attendre leur fin et signaler les échecs
+    DataManager().flush()
+
 except Exception as e:
     st.error(f"❌ Erreur : {str(e)}")
     import traceback
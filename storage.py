@@ -1,22 +1,88 @@
 import streamlit as st
 import pandas as pd
 import json
+import hashlib
 import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 try:
-    from streamlit_gsheets import GSheetsConnection
-    GSHEETS_AVAILABLE = True
+    import orjson
+    ORJSON_AVAILABLE = True
 except ImportError:
-    GSHEETS_AVAILABLE = False
+    ORJSON_AVAILABLE = False
+
+def _json_loads(content):
+    """Décode du JSON (orjson si disponible, sinon json standard)."""
+    if ORJSON_AVAILABLE:
+        try:
+            return orjson.loads(content)
+        except orjson.JSONDecodeError:
+            pass  # orjson est plus strict (NaN, Infinity...) : repli sur json
+    return json.loads(content)
+
+
+def _json_bytes(data):
+    """JSON indenté en UTF-8 (contenu d'un fichier local)."""
+    if ORJSON_AVAILABLE:
+        try:
+            return orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS
+                                | orjson.OPT_SERIALIZE_NUMPY)
+        except TypeError:
+            pass  # Type non supporté par orjson : repli sur json
+    return json.dumps(data, indent=2, ensure_ascii=False).encode('utf-8')
+
+
+def _json_dumps(data):
+    """Sérialise en chaîne JSON (cellules Google Sheets), orjson si disponible."""
+    if ORJSON_AVAILABLE:
+        try:
+            return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY).decode('utf-8')
+        except TypeError:
+            pass  # Type non supporté par orjson : repli sur json
+    return json.dumps(data, ensure_ascii=False)
+
+
+def _json_cellule(val):
+    """Décode une cellule contenant un objet JSON (texte commençant par '{') ; les autres valeurs sont inchangées."""
+    if isinstance(val, str) and val.strip().startswith('{'):
+        try:
+            return _json_loads(val)
+        except ValueError:
+            pass
+    return val
+
+
+# Fraîcheur des lectures Google Sheets (secondes) : les feuilles peuvent être éditées hors de l'application
+GSHEETS_TTL = 10
+
+# Écritures Google Sheets en arrière-plan, communes à tous les DataManager : les sauvegardes de
+# plusieurs onglets partent en parallèle ; pour un même onglet, elles restent dans l'ordre
+GSHEETS_ECRITURES_MAX = 4
+_ecritures_gsheets = ThreadPoolExecutor(max_workers=GSHEETS_ECRITURES_MAX, thread_name_prefix="gsheets")
+_ecritures_en_cours = {}  # onglet -> Future de la dernière écriture soumise
+_ecritures_lock = threading.Lock()
+# Journaux d'ajouts locaux (append_record) à intégrer à leur fichier principal au prochain flush
+_journaux_en_attente = set()
+_journaux_lock = threading.Lock()
+# Lectures Google Sheets simultanées au préchargement
+GSHEETS_LECTURES_MAX = 8
+
 
 class DataManager:
     """Gestionnaire de données supportant JSON local et Google Sheets."""
 
     def __init__(self):
         self.use_gsheets = False
-        if GSHEETS_AVAILABLE:
-            if self._is_gsheets_configured():
+        if self._is_gsheets_configured():
+            # Import (lourd : gspread, google-auth) seulement si Google Sheets est configuré
+            try:
+                from streamlit_gsheets import GSheetsConnection
+            except ImportError:
+                GSheetsConnection = None
+            if GSheetsConnection is not None:
                 try:
                     self.conn = st.connection("gsheets", type=GSheetsConnection)
                     self.use_gsheets = True
@@ -24,6 +90,8 @@ class DataManager:
                     st.warning(f"Impossible de se connecter à Google Sheets, repli sur JSON: {e}")
 
         self.script_dir = os.path.dirname(os.path.abspath(__file__))
+        # Dernière sauvegarde de chaque clé : (empreinte du contenu, version locale après écriture)
+        self._dernieres_sauvegardes = {}
 
     def _is_gsheets_configured(self):
         """Vérifie si les secrets pour Google Sheets sont présents."""
@@ -32,35 +100,99 @@ class DataManager:
         except Exception:
             return False
 
+    def _lire_json_local(self, filepath):
+        """Lit un fichier JSON local (lève une exception s'il est illisible)."""
+        # Lecture en bytes (décodés directement par orjson / json, sans copie texte intermédiaire)
+        with open(filepath, 'rb') as f:
+            content = f.read()
+        # Fix potential NaN in JSON (remplacements, et donc copies, seulement si nécessaire)
+        if b': NaN' in content or b': nan' in content:
+            content = content.replace(b': NaN', b': null').replace(b': nan', b': null')
+        return _json_loads(content)
+
     def _load_local_json(self, filepath, default_factory):
+        data = None
         if os.path.exists(filepath):
             try:
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                    # Fix potential NaN in JSON
-                    content = content.replace(': NaN', ': null').replace(': nan', ': null')
-                    return json.loads(content)
+                data = self._lire_json_local(filepath)
             except Exception as e:
                 st.error(f"Erreur lors du chargement de {filepath}: {e}")
-        return default_factory()
+        if data is None:
+            data = default_factory()
+        return self._appliquer_journal(os.path.splitext(filepath)[0] + '.jsonl', data)
+
+    def _appliquer_journal(self, journal, data):
+        """Ajoute aux listes de `data` les enregistrements du journal JSON Lines (ajouts pas encore consolidés)."""
+        if not os.path.exists(journal):
+            return data
+        try:
+            with open(journal, 'rb') as f:
+                for ligne in f:
+                    if not ligne.strip():
+                        continue
+                    try:
+                        entree = _json_loads(ligne)
+                    except ValueError:
+                        continue  # Dernière ligne tronquée (écriture interrompue)
+                    for champ, record in entree.items():
+                        data.setdefault(champ, []).append(record)
+        except Exception as e:
+            st.error(f"Erreur lors du chargement de {journal}: {e}")
+        return data
 
     def load_data(self, key, default_factory=dict):
         """Charge les données pour une clé donnée (version avec cache Streamlit)."""
-        return self._load_data_cached(key, default_factory)
-
-    @st.cache_data(ttl=10)
-    def _load_data_cached(_self, key, _default_factory):
-        """Version interne cachée pour éviter les appels redondants."""
+        if self.use_gsheets:
+            # Relire ce qui vient d'être écrit : attendre l'écriture en cours de cet onglet
+            self._attendre_ecriture(self._get_tab_name(key))
+        # La date de modification du fichier local fait partie de la clé de cache :
+        # les relectures successives sont gratuites et une sauvegarde locale invalide le cache.
+        version = self._local_mtime(key)
+        if self.use_gsheets:
+            # Google Sheets : relu au plus toutes les GSHEETS_TTL secondes
+            version = (version, int(time.time() // GSHEETS_TTL))
+        return self._load_data_cached(key, default_factory, version)
+
+    def _local_mtime(self, key):
+        """
+        Date de modification du fichier JSON local d'une clé (None s'il n'existe pas),
+        accompagnée de celle de son journal d'ajouts s'il existe.
+        """
+        try:
+            mtime = os.path.getmtime(os.path.join(self.script_dir, f"{key}.json"))
+        except OSError:
+            mtime = None
+        try:
+            return mtime, os.path.getmtime(os.path.join(self.script_dir, f"{key}.jsonl"))
+        except OSError:
+            return mtime
+
+    def get_version(self, key):
+        """
+        Version des données d'une clé, pour éviter de recharger ce qui n'a pas changé.
+        Basée sur le fichier local ; None si inconnue (ex : Google Sheets, modifiable hors de l'application).
+        """
+        if self.use_gsheets:
+            return None
+        return self._local_mtime(key)
+
+    @st.cache_data(ttl=300, max_entries=64)
+    def _load_data_cached(_self, key, _default_factory, version=None):
+        """
+        Version interne cachée pour éviter les appels redondants.
+        `version` (date de modification locale, et tranche de temps pour Google Sheets) invalide le cache ;
+        le TTL ne sert qu'à libérer la mémoire.
+        """
         json_file = os.path.join(_self.script_dir, f"{key}.json")
 
         if _self.use_gsheets:
             try:
                 tab_name = _self._get_tab_name(key)
                 # TTL court pour permettre la réactivité aux éditions manuelles
-                df = _self.conn.read(worksheet=tab_name, ttl=10)
+                df = _self.conn.read(worksheet=tab_name, ttl=GSHEETS_TTL)
 
                 # 1. Vérifier si l'onglet est TOTALEMENT vide (pas de colonnes nommées)
-                completely_blank = df is None or (len(df.columns) > 0 and all(df.columns.str.contains('^Unnamed')))
+                completely_blank = df is None or (len(df.columns) > 0 and df.columns.str.startswith('Unnamed').all())
 
                 # 2. Vérifier si les colonnes obligatoires manquent
                 mandatory_map = {
@@ -95,22 +227,144 @@ class DataManager:
     def save_data(self, key, data):
         """Sauvegarde les données."""
         json_file = os.path.join(self.script_dir, f"{key}.json")
+        payload = _json_bytes(data)
+        # Contenu identique à notre dernière sauvegarde et fichier inchangé depuis : rien à écrire (ni local, ni GSheets)
+        empreinte = hashlib.blake2b(payload, digest_size=16).digest()
+        if self._dernieres_sauvegardes.get(key) == (empreinte, self._local_mtime(key)):
+            return
+        self._dernieres_sauvegardes.pop(key, None)
         try:
-            with open(json_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
+            # Écriture dans un fichier temporaire puis renommage atomique : une écriture
+            # interrompue ne laisse jamais un fichier JSON tronqué
+            tmp_file = json_file + '.tmp'
+            with open(tmp_file, 'wb') as f:
+                f.write(payload)
+            os.replace(tmp_file, json_file)
+            # Le fichier complet inclut les ajouts du journal : il repart à vide
+            journal = os.path.join(self.script_dir, f"{key}.jsonl")
+            if os.path.exists(journal):
+                os.remove(journal)
+            self._dernieres_sauvegardes[key] = (empreinte, self._local_mtime(key))
         except Exception as e:
             st.error(f"Erreur lors de la sauvegarde locale de {key}: {e}")
 
         if self.use_gsheets:
             try:
                 tab_name = self._get_tab_name(key)
+                # Conversion immédiate (les données peuvent être modifiées ensuite), envoi en arrière-plan
                 df = self._json_to_df(key, data)
-                self.conn.update(worksheet=tab_name, data=df)
-                # Invalider le cache après une écriture
-                st.cache_data.clear()
+                with _ecritures_lock:
+                    precedente = _ecritures_en_cours.get(tab_name)
+                    _ecritures_en_cours[tab_name] = _ecritures_gsheets.submit(
+                        self._ecrire_gsheets, key, tab_name, df, precedente)
             except Exception as e:
                 st.error(f"Erreur lors de la sauvegarde de '{key}' vers GSheets: {e}")
 
+    def _ecrire_gsheets(self, key, tab_name, df, precedente=None):
+        """Écrit un onglet (exécuté en arrière-plan), après l'écriture précédente du même onglet."""
+        if precedente is not None:
+            try:
+                precedente.result()
+            except Exception:
+                pass  # Déjà signalée par _attendre_ecriture ; la nouvelle version remplace l'onglet
+        try:
+            self.conn.update(worksheet=tab_name, data=df)
+        except Exception:
+            # Échec : la prochaine sauvegarde du même contenu ne doit pas être ignorée
+            self._dernieres_sauvegardes.pop(key, None)
+            raise
+
+    def _attendre_ecriture(self, tab_name):
+        """
+        Attend la fin de l'écriture Google Sheets en cours d'un onglet et signale son éventuel échec.
+        Retourne False si l'écriture a échoué.
+        """
+        with _ecritures_lock:
+            ecriture = _ecritures_en_cours.get(tab_name)
+        if ecriture is None:
+            return True
+        reussie = True
+        try:
+            ecriture.result()
+        except Exception as e:
+            st.error(f"Erreur lors de la sauvegarde de '{tab_name}' vers GSheets: {e}")
+            reussie = False
+        with _ecritures_lock:
+            terminee = _ecritures_en_cours.get(tab_name) is ecriture
+            if terminee:
+                del _ecritures_en_cours[tab_name]
+        if terminee:
+            # Invalider le cache après une écriture (depuis le script : le thread d'écriture n'a pas de contexte Streamlit)
+            st.cache_data.clear()
+        return reussie
+
+    def precharger(self, keys):
+        """
+        Google Sheets : lit en parallèle les onglets de plusieurs clés, pour que les load_data qui suivent
+        (séquentiels) soient servis par le cache de lecture de la connexion. Sans effet en JSON local.
+        """
+        if not self.use_gsheets:
+            return
+        onglets = list(dict.fromkeys(self._get_tab_name(k) for k in keys))
+        for tab_name in onglets:
+            self._attendre_ecriture(tab_name)
+        with ThreadPoolExecutor(max_workers=min(len(onglets), GSHEETS_LECTURES_MAX) or 1) as lectures:
+            for lecture in [lectures.submit(self.conn.read, worksheet=t, ttl=GSHEETS_TTL) for t in onglets]:
+                try:
+                    lecture.result()
+                except Exception:
+                    pass  # Erreur signalée par le load_data de la clé
+
+    def flush(self):
+        """
+        Intègre les journaux d'ajouts locaux à leur fichier principal (ils ne survivent pas au rerun),
+        puis attend toutes les écritures Google Sheets en cours (tous onglets) et signale leurs échecs.
+        Retourne False si une écriture a échoué.
+        """
+        with _journaux_lock:
+            for key in list(_journaux_en_attente):
+                self._integrer_journal(key)
+            _journaux_en_attente.clear()
+        with _ecritures_lock:
+            onglets = list(_ecritures_en_cours)
+        return all([self._attendre_ecriture(tab_name) for tab_name in onglets])
+
+    def append_record(self, key, champ, record):
+        """
+        Ajoute un enregistrement à la liste `champ` d'une clé sans réécrire tout le fichier :
+        une ligne JSON ajoutée au journal `{key}.jsonl`, intégré au fichier principal au prochain flush()
+        (fin du rerun) ou à la prochaine sauvegarde complète.
+        Retourne False si l'ajout seul n'est pas possible (Google Sheets) : appeler alors save_data.
+        """
+        if self.use_gsheets:
+            return False
+        journal = os.path.join(self.script_dir, f"{key}.jsonl")
+        try:
+            with _journaux_lock:
+                with open(journal, 'ab') as f:
+                    f.write(_json_dumps({champ: record}).encode('utf-8') + b'\n')
+                    f.flush()
+                    os.fsync(f.fileno())
+                _journaux_en_attente.add(key)
+            return True
+        except Exception as e:
+            st.error(f"Erreur lors de l'ajout local à {key}: {e}")
+            return False
+
+    def _integrer_journal(self, key):
+        """Réécrit le fichier principal d'une clé avec les ajouts de son journal (supprimé par save_data)."""
+        json_file = os.path.join(self.script_dir, f"{key}.json")
+        journal = os.path.join(self.script_dir, f"{key}.jsonl")
+        if not os.path.exists(journal):
+            return
+        try:
+            data = self._lire_json_local(json_file) if os.path.exists(json_file) else None
+        except Exception as e:
+            # Fichier principal illisible : ne pas l'écraser, le journal est gardé
+            st.error(f"Erreur lors de l'intégration du journal de {key}: {e}")
+            return
+        self.save_data(key, self._appliquer_journal(journal, data if data is not None else {}))
+
     def _get_tab_name(self, key):
         mapping = {
             'traitements': 'traitements',
@@ -140,236 +394,289 @@ class DataManager:
             return float(val)
         except: return default
 
+    def _get_num_col(self, df, col, default=0.0):
+        """
+        Équivalent de _get_num pour une colonne entière (Series de floats).
+        Colonne déjà numérique : conversion vectorisée ; sinon (texte, virgules...) conversion cellule par cellule.
+        """
+        if col not in df.columns:
+            return pd.Series(default, index=df.index, dtype=float)
+        s = df[col]
+        if pd.api.types.is_numeric_dtype(s):
+            return s.astype(float).fillna(default)
+        return s.map(lambda v: self._get_num(v, default)).astype(float)
+
     def _df_to_json(self, key, df):
         """Convertit un DataFrame GSheets en structure JSON."""
         if df is None or df.empty:
             return self._get_default_for_key(key)
 
-        df = df.loc[:, ~df.columns.str.contains('^Unnamed')]
-
-        if key == 'produits':
-            return {'produits': df.to_dict(orient='records')}
-
-        if key == 'besoins':
-            # Format attendu: {'Cépage': {'n': 1.0, 'p': 0.4, 'k': 1.3}, ...}
-            if 'Cépage' in df.columns:
-                data = df.set_index('Cépage').to_dict(orient='index')
-                for c in data:
-                    for k in ['n', 'p', 'k', 'mgo']:
-                        if k not in data[c]: data[c][k] = 0.0
-                        else: data[c][k] = self._get_num(data[c][k])
-                return data
-            return {}
-
-        if key == 'fertilisation':
-            recs = df.to_dict(orient='records')
-            for r in recs:
-                for k in ['u_n', 'u_p', 'u_k', 'u_mgo']:
-                    if k not in r: r[k] = 0.0
-                    else: r[k] = self._get_num(r[k])
-            return {'apports': recs}
-
-        if key == 'traitements':
-            recs = df.to_dict(orient='records')
-            for r in recs:
-                if 'caracteristiques' in r and isinstance(r['caracteristiques'], str) and r['caracteristiques'].startswith('{'):
-                    try: r['caracteristiques'] = json.loads(r['caracteristiques'])
-                    except: pass
-                # Coercion numérique pour les nouveaux champs
-                if 'mouillage_pct' in r: r['mouillage_pct'] = self._get_num(r['mouillage_pct'], 100.0)
-                if 'surface_traitee' in r: r['surface_traitee'] = self._get_num(r['surface_traitee'], 0.0)
-                if 'dose_kg_ha' in r: r['dose_kg_ha'] = self._get_num(r['dose_kg_ha'], 0.0)
-            return {'traitements': recs}
-
-        elif key == 'meteo_historique':
-            if 'date' in df.columns:
-                df = df.set_index('date')
-            return df.to_dict(orient='index')
-
-        elif key == 'gdd_historique':
-            if 'date' in df.columns and 'value' in df.columns:
-                return dict(zip(df['date'], df['value']))
-            return {}
-
-        elif key == 'historique_alertes':
-            campagnes = []
-            if 'annee' in df.columns:
-                df['annee'] = pd.to_numeric(df['annee'], errors='coerce')
-                df = df.dropna(subset=['annee'])
-                for annee, group in df.groupby('annee'):
-                    analyses = group.drop(columns=['annee']).to_dict(orient='records')
-                    for a in analyses:
-                        for subkey in ['risque_mildiou', 'risque_oidium', 'protection', 'decision', 'meteo', 'previsions']:
-                            if subkey in a and isinstance(a[subkey], str) and a[subkey].strip().startswith('{'):
-                                try: a[subkey] = json.loads(a[subkey])
-                                except: pass
-                    campagnes.append({'annee': int(annee), 'analyses': analyses})
-            return {'campagnes': campagnes}
-
-        elif key == 'vendanges':
-            campagnes = []
-            if 'annee' in df.columns:
-                df['annee'] = pd.to_numeric(df['annee'], errors='coerce')
-                df = df.dropna(subset=['annee'])
-                for annee, group in df.groupby('annee'):
-                    rows = group.to_dict(orient='records')
-                    tickets_rows = [r for r in rows if r.get('type') == 'TICKET']
-                    params_rows = [r for r in rows if r.get('type') == 'CAMPAGNE']
-
-                    clean_tickets = []
-                    for t in tickets_rows:
-                        clean_t = {
-                            'date': t.get('date'),
-                            'num_ticket': t.get('num_ticket'),
-                            'poids_kg': self._get_num(t.get('poids_kg')),
-                            'degre': self._get_num(t.get('degre')),
-                            'notes': t.get('notes', ''),
-                            'id': self._get_num(t.get('id'))
-                        }
-                        clean_tickets.append(clean_t)
-
-                    campagne = {'annee': int(annee), 'tickets': clean_tickets}
-                    if params_rows:
-                        p = params_rows[0]
-                        campagne['status'] = p.get('status', 'en_cours')
-                        campagne['parametres'] = {
-                            'rendement_theorique': self._get_num(p.get('rdt_theo'), 73.0),
-                            'prix_u': self._get_num(p.get('prix_u'), 100.0),
-                            'prime_u': self._get_num(p.get('prime_u'), 0.0),
-                            'frais_vinif_u': self._get_num(p.get('frais_vinif_u'), 15.73)
-                        }
-                        campagne['surface_vendangee'] = {
-                            'total_ha': self._get_num(p.get('total_ha'), 2.05),
-                            'notes': p.get('notes_surface', '')
-                        }
-                        campagne['validation'] = {
-                            'validee': self._to_bool(p.get('validee')),
-                            'hl_reel': self._get_num(p.get('hl_reel')),
-                            'prix_u_reel': self._get_num(p.get('prix_u_reel')),
-                            'prime_reelle': self._get_num(p.get('prime_reelle')),
-                            'frais_reels': self._get_num(p.get('frais_reels')),
-                            'date_validation': p.get('date_validation')
-                        }
-                        if campagne['validation']['validee']:
-                             campagne['donnees_historiques'] = {
-                                'poids_kg': self._get_num(p.get('poids_kg_hist')),
-                                'hl': self._get_num(p.get('hl_hist')),
-                                'ca_brut': self._get_num(p.get('ca_brut_hist')),
-                                'ca_net': self._get_num(p.get('ca_net_hist')),
-                                'total_ha': self._get_num(p.get('total_ha_hist')),
-                                'euro_hl': self._get_num(p.get('euro_hl_hist')),
-                                'poids_ha': self._get_num(p.get('poids_ha_hist')),
-                                'rendement_reel': self._get_num(p.get('rendement_reel_hist'))
-                             }
-                    campagnes.append(campagne)
-            return {'campagnes': campagnes}
-
-        elif key == 'config_vignoble':
-            if 'json_content' in df.columns and not df.empty:
-                try: return json.loads(df.iloc[0]['json_content'])
-                except: return self._get_default_for_key(key)
-
+        df = df.loc[:, ~df.columns.str.startswith('Unnamed')]
+
+        # Conversion propre à la clé (table construite une fois avec la classe), sinon liste d'enregistrements
+        convertir = self._DF_TO_JSON.get(key)
+        if convertir is None:
+            return df.to_dict(orient='records')
+        return convertir(self, df)
+
+    def _df_to_json_produits(self, df):
+        return {'produits': df.to_dict(orient='records')}
+
+    def _df_to_json_besoins(self, df):
+        # Format attendu: {'Cépage': {'n': 1.0, 'p': 0.4, 'k': 1.3}, ...}
+        if 'Cépage' in df.columns:
+            df = df.assign(**{k: self._get_num_col(df, k) for k in ['n', 'p', 'k', 'mgo']})
+            return df.set_index('Cépage').to_dict(orient='index')
+        return {}
+
+    def _df_to_json_fertilisation(self, df):
+        df = df.assign(**{k: self._get_num_col(df, k) for k in ['u_n', 'u_p', 'u_k', 'u_mgo']})
+        return {'apports': df.to_dict(orient='records')}
+
+    def _df_to_json_traitements(self, df):
+        # Coercion numérique pour les nouveaux champs (colonnes présentes seulement)
+        defauts = {'mouillage_pct': 100.0, 'surface_traitee': 0.0, 'dose_kg_ha': 0.0}
+        df = df.assign(**{k: self._get_num_col(df, k, d) for k, d in defauts.items() if k in df.columns})
+        if 'caracteristiques' in df.columns:
+            df = df.assign(caracteristiques=df['caracteristiques'].map(_json_cellule))
+        return {'traitements': df.to_dict(orient='records')}
+
+    def _df_to_json_meteo_historique(self, df):
+        if 'date' in df.columns:
+            df = df.set_index('date')
+        return df.to_dict(orient='index')
+
+    def _df_to_json_gdd_historique(self, df):
+        if 'date' in df.columns and 'value' in df.columns:
+            return df.set_index('date')['value'].to_dict()
+        return {}
+
+    def _df_to_json_historique_alertes(self, df):
+        campagnes = []
+        if 'annee' in df.columns:
+            df['annee'] = pd.to_numeric(df['annee'], errors='coerce')
+            df = df.dropna(subset=['annee'])
+            # Sous-objets JSON décodés colonne par colonne, avant la conversion en enregistrements
+            subkeys = [c for c in ['risque_mildiou', 'risque_oidium', 'protection', 'decision', 'meteo', 'previsions']
+                       if c in df.columns]
+            df = df.assign(**{c: df[c].map(_json_cellule) for c in subkeys})
+            for annee, group in df.groupby('annee'):
+                analyses = group.drop(columns=['annee']).to_dict(orient='records')
+                campagnes.append({'annee': int(annee), 'analyses': analyses})
+        return {'campagnes': campagnes}
+
+    def _df_to_json_vendanges(self, df):
+        campagnes = []
+        if 'annee' in df.columns:
+            df['annee'] = pd.to_numeric(df['annee'], errors='coerce')
+            df = df.dropna(subset=['annee'])
+            types = df['type'] if 'type' in df.columns else pd.Series(None, index=df.index, dtype=object)
+
+            # Tickets : colonnes converties en une fois, puis regroupés par année
+            tickets = df[types == 'TICKET']
+            tickets_df = pd.DataFrame({
+                'annee': tickets['annee'],
+                'date': tickets['date'] if 'date' in tickets.columns else None,
+                'num_ticket': tickets['num_ticket'] if 'num_ticket' in tickets.columns else None,
+                'poids_kg': self._get_num_col(tickets, 'poids_kg'),
+                'degre': self._get_num_col(tickets, 'degre'),
+                'notes': tickets['notes'] if 'notes' in tickets.columns else '',
+                'id': self._get_num_col(tickets, 'id')
+            }, index=tickets.index)
+            tickets_par_annee = {annee: g.drop(columns=['annee']).to_dict(orient='records')
+                                 for annee, g in tickets_df.groupby('annee')}
+
+            # Paramètres : première ligne CAMPAGNE de chaque année
+            params_par_annee = {p['annee']: p for p in
+                                df[types == 'CAMPAGNE'].drop_duplicates('annee').to_dict(orient='records')}
+
+            for annee in sorted(df['annee'].unique()):
+                clean_tickets = tickets_par_annee.get(annee, [])
+                p = params_par_annee.get(annee)
+
+                campagne = {'annee': int(annee), 'tickets': clean_tickets}
+                if p is not None:
+                    campagne['status'] = p.get('status', 'en_cours')
+                    campagne['parametres'] = {
+                        'rendement_theorique': self._get_num(p.get('rdt_theo'), 73.0),
+                        'prix_u': self._get_num(p.get('prix_u'), 100.0),
+                        'prime_u': self._get_num(p.get('prime_u'), 0.0),
+                        'frais_vinif_u': self._get_num(p.get('frais_vinif_u'), 15.73)
+                    }
+                    campagne['surface_vendangee'] = {
+                        'total_ha': self._get_num(p.get('total_ha'), 2.05),
+                        'notes': p.get('notes_surface', '')
+                    }
+                    campagne['validation'] = {
+                        'validee': self._to_bool(p.get('validee')),
+                        'hl_reel': self._get_num(p.get('hl_reel')),
+                        'prix_u_reel': self._get_num(p.get('prix_u_reel')),
+                        'prime_reelle': self._get_num(p.get('prime_reelle')),
+                        'frais_reels': self._get_num(p.get('frais_reels')),
+                        'date_validation': p.get('date_validation')
+                    }
+                    if campagne['validation']['validee']:
+                         campagne['donnees_historiques'] = {
+                            'poids_kg': self._get_num(p.get('poids_kg_hist')),
+                            'hl': self._get_num(p.get('hl_hist')),
+                            'ca_brut': self._get_num(p.get('ca_brut_hist')),
+                            'ca_net': self._get_num(p.get('ca_net_hist')),
+                            'total_ha': self._get_num(p.get('total_ha_hist')),
+                            'euro_hl': self._get_num(p.get('euro_hl_hist')),
+                            'poids_ha': self._get_num(p.get('poids_ha_hist')),
+                            'rendement_reel': self._get_num(p.get('rendement_reel_hist'))
+                         }
+                campagnes.append(campagne)
+        return {'campagnes': campagnes}
+
+    def _df_to_json_config_vignoble(self, df):
+        if 'json_content' in df.columns and not df.empty:
+            try: return _json_loads(df.iloc[0]['json_content'])
+            except: return self._get_default_for_key('config_vignoble')
         return df.to_dict(orient='records')
 
+    _DF_TO_JSON = {
+        'produits': _df_to_json_produits,
+        'besoins': _df_to_json_besoins,
+        'fertilisation': _df_to_json_fertilisation,
+        'traitements': _df_to_json_traitements,
+        'meteo_historique': _df_to_json_meteo_historique,
+        'gdd_historique': _df_to_json_gdd_historique,
+        'historique_alertes': _df_to_json_historique_alertes,
+        'vendanges': _df_to_json_vendanges,
+        'config_vignoble': _df_to_json_config_vignoble,
+    }
+
     def _json_to_df(self, key, data):
         """Convertit une structure JSON en DataFrame pour GSheets."""
         if not data: return pd.DataFrame()
 
-        if key == 'produits':
-            return pd.DataFrame(data.get('produits', []))
-
-        if key == 'besoins':
-            # data est un dict {cepage: {n, p, k}}
-            rows = []
-            for cepage, coefs in data.items():
-                row = {'Cépage': cepage}
-                row.update(coefs)
-                rows.append(row)
-            return pd.DataFrame(rows)
-
-        if key == 'fertilisation':
-            return pd.DataFrame(data.get('apports', []))
-
-        if key == 'traitements':
-            rows = []
-            for t in data.get('traitements', []):
-                row = t.copy()
-                if 'caracteristiques' in row and isinstance(row['caracteristiques'], dict):
-                    row['caracteristiques'] = json.dumps(row['caracteristiques'], ensure_ascii=False)
+        convertir = self._JSON_TO_DF.get(key)
+        if convertir is None:
+            return pd.DataFrame(data)
+        return convertir(self, data)
+
+    def _json_to_df_produits(self, data):
+        return pd.DataFrame(data.get('produits', []))
+
+    def _json_to_df_besoins(self, data):
+        # data est un dict {cepage: {n, p, k}}
+        rows = []
+        for cepage, coefs in data.items():
+            row = {'Cépage': cepage}
+            row.update(coefs)
+            rows.append(row)
+        return pd.DataFrame(rows)
+
+    def _json_to_df_fertilisation(self, data):
+        return pd.DataFrame(data.get('apports', []))
+
+    def _json_to_df_traitements(self, data):
+        rows = []
+        for t in data.get('traitements', []):
+            row = t.copy()
+            if 'caracteristiques' in row and isinstance(row['caracteristiques'], dict):
+                row['caracteristiques'] = _json_dumps(row['caracteristiques'])
+            rows.append(row)
+        return pd.DataFrame(rows)
+
+    def _json_to_df_meteo_historique(self, data):
+        rows = []
+        for date, values in data.items():
+            row = {'date': date}
+            row.update(values)
+            rows.append(row)
+        return pd.DataFrame(rows)
+
+    def _json_to_df_gdd_historique(self, data):
+        return pd.DataFrame({'date': list(data), 'value': list(data.values())})
+
+    def _json_to_df_historique_alertes(self, data):
+        rows = []
+        for campagne in data.get('campagnes', []):
+            annee = campagne['annee']
+            for analyse in campagne['analyses']:
+                row = {'annee': annee}
+                for k, v in analyse.items():
+                    if isinstance(v, (dict, list)):
+                        row[k] = _json_dumps(v)
+                    else:
+                        row[k] = v
                 rows.append(row)
-            return pd.DataFrame(rows)
-
-        elif key == 'meteo_historique':
-            rows = []
-            for date, values in data.items():
-                row = {'date': date}
-                row.update(values)
-                rows.append(row)
-            return pd.DataFrame(rows)
-
-        elif key == 'gdd_historique':
-            rows = [{'date': k, 'value': v} for k, v in data.items()]
-            return pd.DataFrame(rows)
-
-        elif key == 'historique_alertes':
-            rows = []
-            for campagne in data.get('campagnes', []):
-                annee = campagne['annee']
-                for analyse in campagne['analyses']:
-                    row = {'annee': annee}
-                    for k, v in analyse.items():
-                        if isinstance(v, (dict, list)):
-                            row[k] = json.dumps(v, ensure_ascii=False)
-                        else:
-                            row[k] = v
-                    rows.append(row)
-            return pd.DataFrame(rows)
-
-        elif key == 'vendanges':
-            rows = []
-            for campagne in data.get('campagnes', []):
-                annee = campagne['annee']
-                p = campagne.get('parametres', {})
-                s = campagne.get('surface_vendangee', {})
-                v = campagne.get('validation', {})
-                h = campagne.get('donnees_historiques', {})
-
-                camp_row = {
-                    'annee': annee, 'type': 'CAMPAGNE',
-                    'status': campagne.get('status'),
-                    'rdt_theo': p.get('rendement_theorique'),
-                    'prix_u': p.get('prix_u'),
-                    'prime_u': p.get('prime_u'),
-                    'frais_vinif_u': p.get('frais_vinif_u'),
-                    'total_ha': s.get('total_ha'),
-                    'notes_surface': s.get('notes'),
-                    'validee': v.get('validee'),
-                    'hl_reel': v.get('hl_reel'),
-                    'prix_u_reel': v.get('prix_u_reel'),
-                    'prime_reelle': v.get('prime_reelle'),
-                    'frais_reels': v.get('frais_reels'),
-                    'date_validation': v.get('date_validation'),
-                    'poids_kg_hist': h.get('poids_kg'),
-                    'hl_hist': h.get('hl'),
-                    'ca_brut_hist': h.get('ca_brut'),
-                    'ca_net_hist': h.get('ca_net'),
-                    'total_ha_hist': h.get('total_ha'),
-                    'euro_hl_hist': h.get('euro_hl'),
-                    'poids_ha_hist': h.get('poids_ha'),
-                    'rendement_reel_hist': h.get('rendement_reel')
-                }
-                rows.append(camp_row)
-
-                for ticket in campagne.get('tickets', []):
-                    t_row = {'annee': annee, 'type': 'TICKET'}
-                    t_row.update(ticket)
-                    rows.append(t_row)
-            return pd.DataFrame(rows)
-
-        elif key == 'config_vignoble':
-            return pd.DataFrame([{'json_content': json.dumps(data, ensure_ascii=False)}])
-
-        return pd.DataFrame(data)
+        return pd.DataFrame(rows)
+
+    def _json_to_df_vendanges(self, data):
+        # Une ligne CAMPAGNE puis une ligne par ticket, remplies colonne par colonne (sans dict par ticket)
+        campagnes = data.get('campagnes', [])
+        n = sum(1 + len(c.get('tickets', [])) for c in campagnes)
+        colonnes = {'annee': [float('nan')] * n, 'type': [float('nan')] * n} if n else {}
+        i = 0
+        for campagne in campagnes:
+            annee = campagne['annee']
+            p = campagne.get('parametres', {})
+            s = campagne.get('surface_vendangee', {})
+            v = campagne.get('validation', {})
+            h = campagne.get('donnees_historiques', {})
+
+            camp_row = {
+                'annee': annee, 'type': 'CAMPAGNE',
+                'status': campagne.get('status'),
+                'rdt_theo': p.get('rendement_theorique'),
+                'prix_u': p.get('prix_u'),
+                'prime_u': p.get('prime_u'),
+                'frais_vinif_u': p.get('frais_vinif_u'),
+                'total_ha': s.get('total_ha'),
+                'notes_surface': s.get('notes'),
+                'validee': v.get('validee'),
+                'hl_reel': v.get('hl_reel'),
+                'prix_u_reel': v.get('prix_u_reel'),
+                'prime_reelle': v.get('prime_reelle'),
+                'frais_reels': v.get('frais_reels'),
+                'date_validation': v.get('date_validation'),
+                'poids_kg_hist': h.get('poids_kg'),
+                'hl_hist': h.get('hl'),
+                'ca_brut_hist': h.get('ca_brut'),
+                'ca_net_hist': h.get('ca_net'),
+                'total_ha_hist': h.get('total_ha'),
+                'euro_hl_hist': h.get('euro_hl'),
+                'poids_ha_hist': h.get('poids_ha'),
+                'rendement_reel_hist': h.get('rendement_reel')
+            }
+            i = self._remplir_ligne(colonnes, n, i, camp_row)
+
+            for ticket in campagne.get('tickets', []):
+                colonnes['annee'][i] = annee
+                colonnes['type'][i] = 'TICKET'
+                i = self._remplir_ligne(colonnes, n, i, ticket)
+        return pd.DataFrame(colonnes)
+
+    @staticmethod
+    def _remplir_ligne(colonnes, n, i, champs):
+        """
+        Écrit les champs d'une ligne à l'indice i des listes de colonnes (créées à la première apparition
+        d'un champ, valeurs absentes à NaN comme pd.DataFrame(liste de dicts)) ; retourne l'indice suivant.
+        """
+        for k, v in champs.items():
+            col = colonnes.get(k)
+            if col is None:
+                col = colonnes[k] = [float('nan')] * n
+            col[i] = v
+        return i + 1
+
+    def _json_to_df_config_vignoble(self, data):
+        return pd.DataFrame([{'json_content': _json_dumps(data)}])
+
+    _JSON_TO_DF = {
+        'produits': _json_to_df_produits,
+        'besoins': _json_to_df_besoins,
+        'fertilisation': _json_to_df_fertilisation,
+        'traitements': _json_to_df_traitements,
+        'meteo_historique': _json_to_df_meteo_historique,
+        'gdd_historique': _json_to_df_gdd_historique,
+        'historique_alertes': _json_to_df_historique_alertes,
+        'vendanges': _json_to_df_vendanges,
+        'config_vignoble': _json_to_df_config_vignoble,
+    }
 
     def _get_default_for_key(self, key):
         defaults = {